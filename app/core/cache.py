@@ -0,0 +1,250 @@
+# app/core/cache.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import ormsgpack
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Dấu câu ở hai đầu câu hỏi không làm thay đổi ý nghĩa ("1986 mệnh gì?" == "1986 mệnh gì")
+_EDGE_PUNCTUATION = " \t\n.,!?;:…\"'()[]"
+
+
+def normalize_query_text(text: str) -> str:
+    """
+    Chuẩn hóa câu hỏi để làm khóa cache: Unicode NFC, chữ thường, gộp khoảng trắng,
+    bỏ dấu câu ở hai đầu. Giữ nguyên dấu tiếng Việt vì "hướng" và "hương" là hai ý khác nhau.
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    return " ".join(text.split()).strip(_EDGE_PUNCTUATION)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Tạo khóa cache ổn định (sha256) từ nhiều thành phần (văn bản đã chuẩn hóa, phiên bản prompt, model...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")  # Ký tự phân tách để ("ab", "c") khác ("a", "bc")
+    return digest.hexdigest()
+
+
+class TTLLRUCache:
+    """
+    Cache trong bộ nhớ với giới hạn số phần tử (LRU) và thời gian sống (TTL) tùy chọn.
+    An toàn khi dùng từ nhiều thread (event loop và các thread pool của tool).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SQLiteCacheTier:
+    """
+    Tầng cache trên đĩa (SQLite), giữ kết quả qua các lần khởi động lại và dùng chung giữa các worker.
+    Giá trị được serialize bằng MessagePack nên chỉ nên chứa các kiểu cơ bản (dict, list, str, số).
+    """
+
+    def __init__(self, db_path: str, namespace: str, ttl_seconds: Optional[float] = None):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, cache_key)
+            )
+            """
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        row = self._connection().execute(
+            "SELECT payload, expires_at FROM cache_entries WHERE namespace = ? AND cache_key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return _MISSING
+        payload, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return _MISSING
+        return ormsgpack.unpackb(payload)
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, cache_key, payload, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, ormsgpack.packb(value), expires_at),
+        )
+        conn.commit()
+
+    def delete(self, key: str):
+        conn = self._connection()
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND cache_key = ?", (self.namespace, key))
+        conn.commit()
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        conn.commit()
+
+
+class TieredCache:
+    """
+    Cache hai tầng: bộ nhớ (TTLLRUCache) phía trước, SQLite (tùy chọn) phía sau.
+    Khi trúng ở tầng đĩa, giá trị được đưa ngược lên tầng bộ nhớ.
+    Các phương thức aget/aset chạy thao tác đĩa trong thread riêng để không block event loop.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: Optional[float] = None,
+                 disk_path: Optional[str] = None):
+        self.name = name
+        self.memory = TTLLRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.disk: Optional[SQLiteCacheTier] = None
+        self.disk_hits = 0
+        if disk_path:
+            try:
+                self.disk = SQLiteCacheTier(disk_path, namespace=name, ttl_seconds=ttl_seconds)
+            except Exception as e:
+                logger.error(f"Không thể khởi tạo tầng cache trên đĩa cho '{name}': {e}")
+        register_cache(self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except Exception as e:
+                logger.warning(f"Lỗi khi đọc cache '{self.name}' trên đĩa: {e}")
+                value = _MISSING
+            if value is not _MISSING:
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except Exception as e:
+                logger.warning(f"Lỗi khi ghi cache '{self.name}' xuống đĩa: {e}")
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING or self.disk is None:
+            return default if value is _MISSING else value
+        # memory.get ở trên đã tính một lần miss, get() bên trong sẽ kiểm tra lại tầng bộ nhớ rất nhanh
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key: str, value: Any):
+        if self.disk is None:
+            self.memory.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        stats["disk_enabled"] = self.disk is not None
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+
+# --- Danh sách các cache đang hoạt động, dùng cho endpoint /metrics ---
+CACHE_REGISTRY: Dict[str, Any] = {}
+
+
+def register_cache(cache: Any):
+    """Đăng ký một cache (có thuộc tính name và phương thức stats()) để theo dõi."""
+    CACHE_REGISTRY[cache.name] = cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in CACHE_REGISTRY.items()}
@@ -1,5 +1,6 @@
 # app/core/config.py
 
+import logging
 import os
 from pydantic_settings import BaseSettings
 from pathlib import Path
@@ -30,6 +31,91 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     HUGGINGFACEHUB_API_TOKEN: str
 
+    # --- Cấu hình LLM client dùng chung ---
+    # Tất cả các lời gọi LLM (phân tích ý định, tổng hợp câu trả lời, re-ranking)
+    # đi qua app/services/llm_client.py với các giới hạn dưới đây.
+    LLM_MODEL: str = "gemma2-9b-it"
+    LLM_TIMEOUT_SECONDS: float = 30.0  # Timeout mặc định cho mỗi lời gọi
+    LLM_SYNTHESIS_TIMEOUT_SECONDS: float = 60.0  # Tổng hợp câu trả lời dài hơn nên cần timeout lớn hơn
+    LLM_MAX_CONCURRENCY: int = 16  # Số lời gọi LLM đồng thời tối đa trên một worker
+    LLM_MAX_CONNECTIONS: int = 32  # Kích thước connection pool HTTP
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 16
+    LLM_MAX_RETRIES: int = 3  # Số lần thử lại khi gặp lỗi mạng / rate limit / lỗi 5xx
+    LLM_RETRY_BACKOFF_SECONDS: float = 0.5  # Thời gian chờ cơ sở cho exponential backoff
+
+    # --- Cấu hình thread pool cho các tool đồng bộ ---
+    # Tool tra cứu CSDL chạy trong TOOL pool, tool tạo embedding (nặng CPU) chạy trong EMBEDDING pool
+    # để một truy vấn chậm không làm nghẽn event loop của các session khác.
+    TOOL_EXECUTOR_MAX_WORKERS: int = 8
+    EMBEDDING_EXECUTOR_MAX_WORKERS: int = 2
+
+    # --- Cấu hình gom lô (micro-batching) khi tạo embedding cho câu query ---
+    # Các yêu cầu đến trong EMBEDDING_BATCH_MAX_WAIT_MS (hoặc đủ EMBEDDING_BATCH_MAX_SIZE câu) được encode chung một lô.
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    # Backend suy luận của bi-encoder trên CPU: "torch", "torch_int8", "onnx", "onnx_int8"
+    # (xem app/services/encoder_backends.py; các backend onnx* cần gói optimum[onnxruntime] và chạy scripts/export_onnx_encoder.py
+    # trước, thiếu optimum thì quay về "torch").
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_DIR: Optional[str] = None  # Mặc định: data/models/vietnamese-bi-encoder-onnx
+    EMBEDDING_ONNX_QUANTIZATION: str = "avx2"
+    # Thời gian tối đa một request semantic search chờ mô hình/index được nạp xong ở nền
+    SEMANTIC_READY_TIMEOUT_SECONDS: float = 120.0
+    # Tham số tìm kiếm lúc query của các index xấp xỉ (loại index được chọn lúc build bằng VECTOR_INDEX_MODE,
+    # xem scripts/create_embeddings.py). Tăng để recall cao hơn, giảm để nhanh hơn; index "flat" bỏ qua các giá trị này.
+    VECTOR_HNSW_EF_SEARCH: int = 64
+    VECTOR_IVF_NPROBE: int = 16
+
+    # --- Cấu hình nạp lại dữ liệu khi server đang chạy (xem app/database/generations.py) ---
+    # Chế độ theo dõi: định kỳ kiểm tra file SQLite / bundle index đã công bố và tự nạp lại khi chúng thay đổi.
+    DATA_WATCH_ENABLED: bool = False
+    DATA_WATCH_INTERVAL_SECONDS: float = 10.0
+    DATA_WATCH_REBUILD: bool = False  # True: file Excel trong data/raw thay đổi thì chạy lại các script xử lý dữ liệu
+    # Bảo vệ các route /admin: request phải gửi header 'X-Admin-Token' khớp giá trị này; không đặt thì các route /admin bị tắt.
+    ADMIN_TOKEN: Optional[str] = None
+    # Cho phép POST /admin/reload?rebuild=true chạy lại các script xử lý dữ liệu (subprocess) trên server.
+    ADMIN_RELOAD_REBUILD_ENABLED: bool = False
+
+    # --- Cấu hình đọc CSDL tri thức SQLite (chỉ-đọc, mỗi thread một kết nối, xem app/database/sqlite_reader.py) ---
+    SQLITE_MMAP_SIZE_MB: int = 64  # PRAGMA mmap_size; >= kích thước file để đọc toàn bộ qua memory-map
+    SQLITE_CACHE_SIZE_MB: int = 8  # PRAGMA cache_size cho mỗi kết nối
+    # Mở bản SQLite đã ghim của mỗi thế hệ dữ liệu với immutable=1 (bỏ khóa file). Tắt nếu file CSDL bị sửa tại chỗ
+    # thay vì được thay bằng file mới (scripts/preprocess_data.py luôn thay bằng file mới).
+    SQLITE_IMMUTABLE: bool = True
+
+    # --- Cấu hình lưu trữ session hội thoại ---
+    # "memory": lưu trong process (LRU + TTL + giới hạn bộ nhớ).
+    # "sqlite": lưu vào file SQLite dùng chung, để nhiều worker uvicorn phục vụ cùng một session_id.
+    SESSION_BACKEND: str = "memory"
+    SESSION_TTL_SECONDS: int = 2 * 60 * 60  # Session không hoạt động quá thời gian này sẽ bị xóa
+    SESSION_MAX_ENTRIES: int = 10_000
+    SESSION_MAX_MEMORY_MB: float = 64.0  # Ngân sách bộ nhớ cho backend "memory"
+    SESSION_DB_PATH: Optional[str] = None  # Mặc định: data/runtime/sessions.sqlite
+    SESSION_MAX_TOOL_CALLS: int = 10  # Số lần gọi tool gần nhất được giữ lại trong snapshot của session
+
+    # --- Cấu hình phân tích ý định ---
+    # Bộ phân loại nhanh bằng luật (regex + từ điển) xử lý các câu hỏi đơn giản mà không cần gọi LLM
+    INTENT_RULES_ENABLED: bool = True
+
+    # --- Cấu hình cache kết quả ---
+    # Tầng đĩa (SQLite) dùng chung cho mọi cache bật *_CACHE_DISK_ENABLED, giữ kết quả qua các lần khởi động lại.
+    CACHE_DB_PATH: Optional[str] = None  # Mặc định: data/runtime/cache.sqlite
+    # Cache kết quả phân tích ý định, khóa = câu hỏi đã chuẩn hóa + phiên bản prompt + model
+    INTENT_CACHE_ENABLED: bool = True
+    INTENT_CACHE_MAX_ENTRIES: int = 5_000
+    INTENT_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    INTENT_CACHE_DISK_ENABLED: bool = False
+    # Cache câu trả lời tổng hợp, khóa = hash của prompt đã điền dữ liệu tra cứu + model + tham số sinh
+    SYNTHESIS_CACHE_ENABLED: bool = True
+    SYNTHESIS_CACHE_MAX_ENTRIES: int = 1_000
+    SYNTHESIS_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    SYNTHESIS_CACHE_VARIANTS: int = 1  # >1: giữ N câu trả lời khác nhau cho mỗi khóa và chọn ngẫu nhiên
+    SYNTHESIS_CACHE_DISK_ENABLED: bool = False
+    # Cache semantic search: câu query -> embedding, (index, query, k, ngưỡng) -> kết quả
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_EMBEDDING_CACHE_MAX_ENTRIES: int = 10_000  # ~3KB/vector 768 chiều float32
+    SEMANTIC_RESULT_CACHE_MAX_ENTRIES: int = 5_000
+
     # Cấu hình để Pydantic biết đọc từ file .env
     class Config:
         env_file = os.path.join(PROJECT_ROOT, ".env")
@@ -43,14 +129,24 @@ settings = Settings()
 # chúng ta sẽ tự động gán đường dẫn mặc định tới file SQLite.
 if settings.DATABASE_URL is None:
     default_db_path = os.path.join(PROJECT_ROOT, 'data', 'processed', 'phongthuy.sqlite')
-    # Kiểm tra xem file SQLite có thực sự tồn tại không
+    # Không raise lúc import: scripts/preprocess_data.py (bước tạo ra file này) cũng import config.
+    # Server sẽ báo lỗi kết nối ở bước kiểm tra CSDL khi khởi động nếu file vẫn chưa có.
     if not os.path.exists(default_db_path):
-         raise FileNotFoundError(
-            f"DATABASE_URL không được cung cấp trong .env và file SQLite mặc định không tồn tại tại: {default_db_path}. "
+        logging.getLogger(__name__).warning(
+            f"DATABASE_URL không được cung cấp trong .env và file SQLite mặc định chưa tồn tại tại: {default_db_path}. "
             "Vui lòng chạy script 'scripts/preprocess_data.py' trước."
         )
     settings.DATABASE_URL = f"sqlite:///{default_db_path}"
 
+if settings.SESSION_DB_PATH is None:
+    settings.SESSION_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'runtime', 'sessions.sqlite')
+
+if settings.EMBEDDING_ONNX_DIR is None:
+    settings.EMBEDDING_ONNX_DIR = os.path.join(PROJECT_ROOT, 'data', 'models', 'vietnamese-bi-encoder-onnx')
+
+if settings.CACHE_DB_PATH is None:
+    settings.CACHE_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'runtime', 'cache.sqlite')
+
 
 # In ra để kiểm tra khi khởi chạy (chỉ cho mục đích debug)
 if __name__ == "__main__":
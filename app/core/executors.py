@@ -0,0 +1,77 @@
+# app/core/executors.py
+
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# --- Các thread pool dùng chung cho toàn bộ process ---
+# TOOL_EXECUTOR: các tool tra cứu CSDL (I/O SQLite), số lượng worker lớn hơn.
+# EMBEDDING_EXECUTOR: các lời gọi SentenceTransformer.encode theo lô của EmbeddingService
+# và các tool đánh dấu @cpu_bound (nặng CPU), giữ nhỏ để không tranh chấp CPU với nhau.
+TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.TOOL_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="tool-worker",
+)
+EMBEDDING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.EMBEDDING_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="embedding-worker",
+)
+
+_EXECUTORS: Dict[str, ThreadPoolExecutor] = {
+    "tool": TOOL_EXECUTOR,
+    "embedding": EMBEDDING_EXECUTOR,
+}
+
+
+def cpu_bound(func: Callable) -> Callable:
+    """
+    Decorator đánh dấu một tool nặng CPU (ví dụ: tạo embedding),
+    để BaseWorkflow._call_tool điều phối nó sang EMBEDDING_EXECUTOR.
+    """
+    func.__executor__ = "embedding"
+    return func
+
+
+def get_executor_for(func: Callable) -> ThreadPoolExecutor:
+    """Chọn thread pool phù hợp cho một tool dựa trên đánh dấu của nó."""
+    return _EXECUTORS.get(getattr(func, "__executor__", "tool"), TOOL_EXECUTOR)
+
+
+async def run_sync_tool(func: Callable, **kwargs) -> Tuple[Any, float, float]:
+    """
+    Chạy một hàm đồng bộ trong thread pool tương ứng mà không block event loop.
+
+    Returns:
+        (kết quả, thời gian chờ trong hàng đợi (ms), thời gian chạy thực tế (ms))
+    """
+    loop = asyncio.get_running_loop()
+    submitted_at = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    def _timed_call():
+        started_at = time.perf_counter()
+        timings["queue_wait_ms"] = (started_at - submitted_at) * 1000
+        try:
+            return func(**kwargs)
+        finally:
+            timings["run_ms"] = (time.perf_counter() - started_at) * 1000
+
+    # Chạy trong bản sao context của request (run_in_executor không tự chép contextvars như asyncio.to_thread),
+    # để tool trong thread pool đọc cùng thế hệ dữ liệu với request (xem app/database/generations.py)
+    context = contextvars.copy_context()
+    result = await loop.run_in_executor(get_executor_for(func), context.run, _timed_call)
+    return result, timings["queue_wait_ms"], timings["run_ms"]
+
+
+def shutdown_executors():
+    """Giải phóng các thread pool (gọi khi ứng dụng tắt)."""
+    for name, executor in _EXECUTORS.items():
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Đã tắt thread pool '{name}'.")
@@ -0,0 +1,101 @@
+# app/core/lazy_resource.py
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """
+    Tài nguyên nặng (mô hình, index...) chỉ được nạp khi cần, trong một thread nền riêng.
+
+    - start(): bắt đầu nạp ở nền nếu chưa (gọi lúc app khởi động để "làm nóng" trước).
+    - get(): chờ (block) đến khi nạp xong, dùng trong code đồng bộ/script.
+    - aget(): chờ bất đồng bộ, không block event loop; nhiều request có thể cùng chờ.
+    - status(): trạng thái cho endpoint /health/ready.
+    Nếu nạp thất bại, get/aget raise lại lỗi đó trong một khoảng chờ tăng dần (RETRY_BASE_SECONDS, gấp đôi
+    sau mỗi lần thất bại liên tiếp, tối đa RETRY_MAX_SECONDS); lời gọi start/get/aget đầu tiên sau khoảng chờ nạp lại.
+    """
+
+    RETRY_BASE_SECONDS = 5.0
+    RETRY_MAX_SECONDS = 300.0
+
+    def __init__(self, name: str, loader: Callable[[], T]):
+        self.name = name
+        self._loader = loader
+        self._future: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._load_seconds: Optional[float] = None
+        self._failures = 0  # Số lần nạp thất bại liên tiếp
+        self._retry_at = 0.0  # time.monotonic() sớm nhất được thử nạp lại sau một lần thất bại
+
+    def _failed(self, future: Optional[Future]) -> bool:
+        return future is not None and future.done() and future.exception() is not None
+
+    def start(self) -> Future:
+        with self._lock:
+            retry = self._failed(self._future) and time.monotonic() >= self._retry_at
+            if self._future is None or retry:
+                if retry:
+                    logger.info(f"Thử nạp lại tài nguyên '{self.name}' (sau {self._failures} lần thất bại)...")
+                future = Future()
+                future.set_running_or_notify_cancel()  # Không cho phép hủy từ bên ngoài
+                self._future = future
+                threading.Thread(target=self._load, args=(future,), name=f"load-{self.name}", daemon=True).start()
+            return self._future
+
+    def _load(self, future: Future):
+        logger.info(f"Bắt đầu nạp tài nguyên '{self.name}' ở nền...")
+        started_at = time.perf_counter()
+        try:
+            value = self._loader()
+        except BaseException as e:
+            self._load_seconds = time.perf_counter() - started_at
+            with self._lock:
+                self._failures += 1
+                backoff = min(self.RETRY_BASE_SECONDS * 2 ** (self._failures - 1), self.RETRY_MAX_SECONDS)
+                self._retry_at = time.monotonic() + backoff
+            logger.error(f"Không thể nạp tài nguyên '{self.name}': {e} (thử lại sau {backoff:.0f}s)")
+            future.set_exception(e)
+            return
+        self._load_seconds = time.perf_counter() - started_at
+        with self._lock:
+            self._failures = 0
+        logger.info(f"Đã nạp xong tài nguyên '{self.name}' sau {self._load_seconds:.1f}s.")
+        future.set_result(value)
+
+    def get(self, timeout: Optional[float] = None) -> T:
+        return self.start().result(timeout=timeout)
+
+    async def aget(self, timeout: Optional[float] = None) -> T:
+        future = self.start()
+        # shield: caller bị hủy/timeout không ảnh hưởng đến việc nạp đang chạy cho các caller khác
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout)
+
+    def is_ready(self) -> bool:
+        future = self._future
+        return future is not None and future.done() and future.exception() is None
+
+    def status(self) -> Dict[str, Any]:
+        future = self._future
+        if future is None:
+            state, error = "not_started", None
+        elif not future.done():
+            state, error = "loading", None
+        elif future.exception() is not None:
+            state, error = "failed", str(future.exception())
+        else:
+            state, error = "ready", None
+        status = {"state": state, "load_seconds": round(self._load_seconds, 2) if self._load_seconds else None}
+        if error:
+            status["error"] = error
+            status["failures"] = self._failures
+            status["retry_in_seconds"] = round(max(0.0, self._retry_at - time.monotonic()), 1)
+        return status
@@ -0,0 +1,59 @@
+# app/core/metrics.py
+
+import bisect
+import threading
+from typing import Any, Dict, Sequence
+
+# Các mốc mặc định cho histogram thời gian (ms)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """
+    Histogram đơn giản theo các mốc cố định (kiểu Prometheus: số quan sát <= mỗi mốc, cộng dồn).
+    An toàn khi ghi từ nhiều thread.
+    """
+
+    def __init__(self, name: str, buckets: Sequence[float]):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # Phần tử cuối: > mốc lớn nhất
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+        register_histogram(self)
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets, self._counts):
+                running += count
+                cumulative[f"le_{bound}"] = running
+            cumulative["le_inf"] = self._count
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 3),
+                "mean": round(self._sum / self._count, 3) if self._count else 0.0,
+                "max": round(self._max, 3),
+                "buckets": cumulative,
+            }
+
+
+# --- Danh sách các histogram đang hoạt động, dùng cho endpoint /metrics ---
+HISTOGRAM_REGISTRY: Dict[str, Histogram] = {}
+
+
+def register_histogram(histogram: Histogram):
+    HISTOGRAM_REGISTRY[histogram.name] = histogram
+
+
+def histogram_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: histogram.stats() for name, histogram in HISTOGRAM_REGISTRY.items()}
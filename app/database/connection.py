@@ -1,14 +1,19 @@
 # app/database/connection.py
 
-import sqlite3
-import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
 import logging
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.elements import TextClause
 
 # Import đối tượng settings từ module config
 from app.core.config import settings
+from app.database.sqlite_reader import ReadOnlySQLite
 
 # --- Thiết lập SQLAlchemy ---
 # create_engine là điểm khởi đầu cho bất kỳ ứng dụng SQLAlchemy nào.
@@ -46,23 +51,116 @@ def get_db():
         db.close()
 
 
-# --- Hàm tiện ích để truy vấn trực tiếp bằng Pandas (rất hữu ích cho tools) ---
-def query_to_dataframe(query: str, params: dict = None) -> pd.DataFrame:
+# --- Lớp đọc SQLite chỉ-đọc (xem app/database/sqlite_reader.py) ---
+def sqlite_database_path(database_url: Optional[str] = None) -> Optional[str]:
+    """Đường dẫn file SQLite của DATABASE_URL, hoặc None nếu không phải SQLite dạng file."""
+    url = make_url(database_url or settings.DATABASE_URL)
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None
+    return os.path.abspath(url.database)
+
+
+def open_reader(path: str, immutable: bool = False) -> ReadOnlySQLite:
+    return ReadOnlySQLite(path, immutable=immutable, mmap_size_mb=settings.SQLITE_MMAP_SIZE_MB,
+                          cache_size_mb=settings.SQLITE_CACHE_SIZE_MB)
+
+
+# Dùng khi chưa có thế hệ dữ liệu nào được nạp (scripts, kiểm tra kết nối...). File gốc có thể bị thay
+# (scripts/preprocess_data.py) nên không mở ở chế độ immutable.
+_default_database_path = sqlite_database_path()
+default_reader: Optional[ReadOnlySQLite] = open_reader(_default_database_path) if _default_database_path else None
+
+
+def get_database():
+    """
+    Nguồn dữ liệu của thế hệ dữ liệu mà request hiện tại đang dùng (xem app/database/generations.py):
+    một ReadOnlySQLite với file SQLite, hoặc engine SQLAlchemy với các CSDL khác.
+    Khi chưa có thế hệ nào được nạp: default_reader, hoặc engine mặc định ở trên.
+    """
+    from app.database.generations import generation_manager
+
+    generation = generation_manager.active(load=False)
+    if generation is not None:
+        return generation.database
+    return default_reader if default_reader is not None else engine
+
+
+# --- Truy vấn trả về dòng trực tiếp (dùng cho tools trên đường phục vụ request) ---
+# Không dựng DataFrame: mỗi dòng là một dict (hoặc named tuple với mappings=False),
+# giá trị giữ nguyên kiểu của SQLite (NULL -> None, không bị ép sang float/NaN như pandas).
+# Pandas chỉ còn dùng trong các script xử lý dữ liệu offline.
+@lru_cache(maxsize=256)
+def _statement(query: str) -> TextClause:
+    """
+    Một TextClause duy nhất cho mỗi câu SQL: SQLAlchemy dùng lại bản đã biên dịch (compiled cache),
+    và sqlite3 dùng lại prepared statement của cùng chuỗi SQL trên mỗi kết nối
+    (với ReadOnlySQLite, chuỗi SQL được đưa thẳng vào statement cache của sqlite3).
+    """
+    return text(query)
+
+
+def select_columns(table: str, columns: Sequence[str], where: Optional[str] = None) -> str:
+    """Dựng câu SELECT liệt kê rõ các cột cần lấy (thay cho SELECT *), ví dụ cho các hằng SQL của tools."""
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    return f"{query} WHERE {where}" if where else query
+
+
+def run_query(query: str, params: dict = None, db=None, one: bool = False, mappings: bool = True) -> Any:
     """
-    Thực thi một câu lệnh SQL và trả về kết quả dưới dạng Pandas DataFrame.
-    An toàn hơn khi sử dụng params để tránh SQL Injection.
+    Thực thi một câu lệnh SQL (tham số dạng :ten) trên db (ReadOnlySQLite hoặc engine SQLAlchemy,
+    mặc định get_database()). Lỗi được raise cho caller; tools nên dùng fetch_one/fetch_all.
     """
-    if engine is None:
+    if db is None:
+        db = get_database()
+    if db is None:
         raise ConnectionError("Không thể thực thi query do lỗi kết nối CSDL ban đầu.")
+    if isinstance(db, ReadOnlySQLite):
+        return db.fetch_one(query, params, mappings) if one else db.fetch_all(query, params, mappings)
+
+    with db.connect() as connection:
+        result = connection.execute(_statement(query), params or {})
+        if one:
+            row = result.first()
+            if row is None:
+                return None
+            return dict(row._mapping) if mappings else row
+        rows = result.all()
+    return [dict(row._mapping) for row in rows] if mappings else rows
+
+
+def fetch_all(query: str, params: dict = None, db=None, mappings: bool = True) -> List[Any]:
+    """
+    Thực thi một câu lệnh SQL và trả về mọi dòng kết quả.
+
+    Args:
+        mappings: True -> mỗi dòng là một dict mới; False -> named tuple (truy cập theo vị trí/thuộc tính).
 
+    Returns:
+        Danh sách các dòng; danh sách rỗng nếu có lỗi (lỗi được ghi log).
+    """
+    try:
+        return run_query(query, params, db=db, mappings=mappings)
+    except ConnectionError:
+        raise
+    except Exception as e:
+        logging.error(f"Lỗi khi thực thi query: {query} với params: {params}. Lỗi: {e}")
+        return []
+
+
+def fetch_one(query: str, params: dict = None, db=None, mappings: bool = True) -> Optional[Any]:
+    """
+    Giống fetch_all nhưng chỉ lấy dòng đầu tiên (theo thứ tự SQLite trả về).
+
+    Returns:
+        Một dict (hoặc named tuple với mappings=False), hoặc None nếu không có dòng nào hoặc có lỗi.
+    """
     try:
-        with engine.connect() as connection:
-            df = pd.read_sql(query, connection, params=params)
-        return df
+        return run_query(query, params, db=db, one=True, mappings=mappings)
+    except ConnectionError:
+        raise
     except Exception as e:
         logging.error(f"Lỗi khi thực thi query: {query} với params: {params}. Lỗi: {e}")
-        # Trả về DataFrame rỗng nếu có lỗi
-        return pd.DataFrame()
+        return None
 
 
 # --- Hàm kiểm tra kết nối ---
@@ -71,8 +169,8 @@ def test_connection():
     try:
         logging.info("Đang kiểm tra kết nối CSDL...")
         # Thử đọc 1 dòng từ bảng 'menh' (giả sử bảng này tồn tại)
-        df = query_to_dataframe("SELECT * FROM menh LIMIT 1")
-        if not df.empty:
+        row = fetch_one("SELECT * FROM menh LIMIT 1")
+        if row is not None:
             logging.info("Kiểm tra kết nối CSDL thành công! Có thể đọc dữ liệu.")
             return True
         else:
@@ -87,6 +185,6 @@ if __name__ == "__main__":
     test_connection()
     # Ví dụ cách sử dụng
     # sample_query = "SELECT * FROM menh WHERE hanh_ngu_hanh = :menh"
-    # result_df = query_to_dataframe(sample_query, params={"menh": "Kim"})
+    # rows = fetch_all(sample_query, params={"menh": "Kim"})
     # print("\nKết quả truy vấn mẫu:")
-    # print(result_df)
\ No newline at end of file
+    # print(rows)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# app/database/embedding_builder.py
+
+import hashlib
+import logging
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.database.index_bundle import BundleManifest, bundle_root, load_current_bundle, write_bundle
+from app.database.vector_store import CollectionSpec, IndexBuildParams, build_index, index_ids, index_mode
+
+logger = logging.getLogger(__name__)
+
+ENCODE_BATCH_SIZE = 64
+
+
+class CorpusRow(NamedTuple):
+    """Một dòng cần tạo embedding: khóa ổn định, văn bản corpus và metadata đi kèm vector."""
+    key: str  # Không đổi khi nội dung dòng thay đổi (ví dụ "sat_khi:Thiên Trảm Sát")
+    text: str
+    metadata: Dict[str, Any]
+
+
+class BuildStats(NamedTuple):
+    added: int
+    changed: int
+    removed: int
+    unchanged: int
+    encoded: int  # Số văn bản thực sự được đưa qua mô hình (các dòng trùng nội dung chỉ encode một lần)
+    rebuilt: bool  # True: build lại toàn bộ index; False: cập nhật index cũ theo id
+    manifest: BundleManifest
+
+
+def corpus_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def unique_row_keys(names: List[str]) -> List[str]:
+    """Khóa duy nhất cho các dòng có thể trùng tên: lần xuất hiện thứ 2 trở đi được thêm hậu tố '#2', '#3'..."""
+    seen: Dict[str, int] = {}
+    keys = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        keys.append(name if seen[name] == 1 else f"{name}#{seen[name]}")
+    return keys
+
+
+def _atomic_write(path: str, write: Callable[[str], None]):
+    """Ghi ra file tạm cùng thư mục rồi os.replace, để tiến trình đang đọc không bao giờ thấy file ghi dở."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _load_embedding_state(path: str, model_id: str) -> Dict[str, np.ndarray]:
+    """Trạng thái của lần build trước (khóa, id, hash, vector của từng dòng); rỗng nếu chưa có hoặc đã đổi mô hình."""
+    if not os.path.exists(path):
+        return {}
+    with np.load(path, allow_pickle=False) as state:
+        if str(state["model_id"]) != model_id:
+            logger.info(f"Mô hình đã thay đổi ('{state['model_id']}' -> '{model_id}'), tạo lại toàn bộ embedding.")
+            return {}
+        return {name: state[name] for name in ("keys", "ids", "hashes", "vectors", "next_id")}
+
+
+def _encode_in_batches(texts: List[str], encode: Callable[[List[str]], np.ndarray], batch_size: int) -> np.ndarray:
+    import faiss
+
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        batch = np.asarray(encode(texts[start:start + batch_size]), dtype=np.float32)
+        batches.append(batch)
+        logger.info(f"  - Đã encode {min(start + batch_size, len(texts))}/{len(texts)} văn bản.")
+    vectors = np.ascontiguousarray(np.vstack(batches))
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_collection(spec: CollectionSpec, rows: List[CorpusRow], encode: Callable[[List[str]], np.ndarray],
+                     model_name: str, backend: str, output_dir: str, params: Optional[IndexBuildParams] = None,
+                     batch_size: int = ENCODE_BATCH_SIZE) -> BuildStats:
+    """
+    Build tăng dần bundle (index FAISS + metadata, xem app/database/index_bundle.py) của một collection.
+
+    - Mỗi dòng được băm (sha256) theo văn bản corpus; dòng không đổi dùng lại vector đã lưu ở lần build trước
+      (file spec.embeddings_file), chỉ các văn bản mới/thay đổi được encode, theo lô batch_size.
+    - Mỗi khóa dòng giữ một id cố định (IndexIDMap2). Với index flat/ivfpq cùng loại, index của bundle hiện tại
+      được cập nhật: xóa id của dòng bị xóa/thay đổi rồi thêm vector mới; HNSW hoặc đổi loại index thì build lại
+      từ các vector đã có (không cần encode lại).
+    - Kết quả được ghi thành một phiên bản bundle mới và chuyển sang một cách nguyên tử.
+
+    Args:
+        encode: Hàm nhận danh sách văn bản, trả về ma trận embedding (n, dim).
+        model_name, backend: Mô hình và backend đã tạo embedding; đổi một trong hai sẽ encode lại toàn bộ.
+    """
+    import faiss
+
+    params = params or IndexBuildParams()
+    model_id = f"{model_name}|{backend}"
+    state_path = os.path.join(output_dir, spec.embeddings_file)
+
+    state = _load_embedding_state(state_path, model_id)
+    previous_keys = state["keys"].tolist() if state else []
+    previous = {key: (int(row_id), row_hash, position) for position, (key, row_id, row_hash) in
+                enumerate(zip(previous_keys, state.get("ids", []), state.get("hashes", [])))}
+    next_id = int(state["next_id"]) if state else 0
+
+    # --- 1. So sánh với lần build trước ---
+    vector_by_hash = {row_hash: state["vectors"][position] for _, row_hash, position in previous.values()}
+    row_ids, row_hashes = [], []
+    added = changed = unchanged = 0
+    for row in rows:
+        row_hash = corpus_hash(row.text)
+        if row.key in previous:
+            row_id, previous_hash, _ = previous[row.key]
+            if previous_hash == row_hash:
+                unchanged += 1
+            else:
+                changed += 1
+        else:
+            row_id = next_id
+            next_id += 1
+            added += 1
+        row_ids.append(row_id)
+        row_hashes.append(row_hash)
+    current_keys = {row.key for row in rows}
+    removed_ids = [row_id for key, (row_id, _, _) in previous.items() if key not in current_keys]
+    dirty_ids = {row_id for row, row_id, row_hash in zip(rows, row_ids, row_hashes)
+                 if row.key not in previous or previous[row.key][1] != row_hash}
+
+    # --- 2. Encode các văn bản chưa có vector (mỗi nội dung chỉ encode một lần) ---
+    missing_texts = {row_hash: row.text for row, row_hash in zip(rows, row_hashes) if row_hash not in vector_by_hash}
+    if missing_texts:
+        logger.info(f"[{spec.name}] Đang encode {len(missing_texts)} văn bản mới/thay đổi...")
+        encoded = _encode_in_batches(list(missing_texts.values()), encode, batch_size)
+        vector_by_hash.update(zip(missing_texts.keys(), encoded))
+    vectors = np.vstack([vector_by_hash[row_hash] for row_hash in row_hashes]).astype(np.float32)
+    ids = np.asarray(row_ids, dtype=np.int64)
+    logger.info(f"[{spec.name}] {added} dòng mới, {changed} thay đổi, {len(removed_ids)} bị xóa, {unchanged} giữ nguyên.")
+
+    # --- 3. Cập nhật index cũ theo id, hoặc build lại ---
+    index = None
+    if state and params.mode != "hnsw":
+        try:
+            previous_index = load_current_bundle(bundle_root(output_dir), spec.name, expected_model=model_name).index
+        except Exception as e:
+            logger.warning(f"[{spec.name}] Không dùng lại được bundle hiện tại ({e}), build lại toàn bộ index.")
+            previous_index = None
+        if (previous_index is not None and isinstance(previous_index, faiss.IndexIDMap)
+                and index_mode(previous_index) == params.mode and previous_index.d == vectors.shape[1]
+                and set(index_ids(previous_index).tolist()) == {row_id for row_id, _, _ in previous.values()}):
+            index = previous_index
+            stale_ids = np.asarray(sorted(set(removed_ids) | (dirty_ids & set(index_ids(index).tolist()))), dtype=np.int64)
+            if len(stale_ids):
+                index.remove_ids(stale_ids)
+            dirty_mask = np.isin(ids, list(dirty_ids))
+            if dirty_mask.any():
+                index.add_with_ids(vectors[dirty_mask], ids[dirty_mask])
+    rebuilt = index is None
+    if rebuilt:
+        index = build_index(vectors, params, ids=ids)
+
+    # Metadata dạng cột, theo đúng thứ tự lưu trong index (thứ tự id_map thay đổi sau remove_ids)
+    stored_ids = index_ids(index)
+    metadata_by_id = {int(row_id): row.metadata for row, row_id in zip(rows, row_ids)}
+    columns = {
+        field: [metadata_by_id[int(row_id)][field] for row_id in stored_ids]
+        for field in spec.metadata_model.model_fields
+    }
+    corpus_digest = hashlib.sha256("\n".join(sorted(f"{row.key}\t{row_hash}" for row, row_hash in
+                                                     zip(rows, row_hashes))).encode("utf-8")).hexdigest()
+
+    # --- 4. Ghi nguyên tử: cache vector, rồi một phiên bản bundle mới ---
+    def write_state(path):
+        with open(path, "wb") as f:
+            np.savez(f, model_id=np.array(model_id), keys=np.array([row.key for row in rows]), ids=ids,
+                     hashes=np.array(row_hashes), vectors=vectors, next_id=np.array(next_id))
+
+    os.makedirs(output_dir, exist_ok=True)
+    _atomic_write(state_path, write_state)
+    manifest = write_bundle(bundle_root(output_dir), spec.name, index, stored_ids, columns,
+                            model=model_name, backend=backend, corpus_hash=corpus_digest)
+    logger.info(f"[{spec.name}] Đã lưu bundle {manifest.version} ({params.mode}, {index.ntotal} vectors, "
+                f"{'build lại' if rebuilt else 'cập nhật tại chỗ'}).")
+
+    return BuildStats(added=added, changed=changed, removed=len(removed_ids), unchanged=unchanged,
+                      encoded=len(missing_texts), rebuilt=rebuilt, manifest=manifest)
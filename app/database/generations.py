@@ -0,0 +1,439 @@
+# app/database/generations.py
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine
+
+from app.core.config import PROJECT_ROOT, settings
+from app.core.lazy_resource import LazyResource
+from app.database.connection import open_reader, run_query, sqlite_database_path
+from app.database.index_bundle import CURRENT_FILE, bundle_root
+from app.database.knowledge_base import TABLE_KEYS, KnowledgeBase
+from app.database.vector_store import COLLECTION_SPECS, IndexSearchParams, VectorStore
+
+logger = logging.getLogger(__name__)
+
+# --- Thế hệ dữ liệu (data generation) ---
+# Một thế hệ gồm mọi thứ được dựng từ dữ liệu đã xử lý: file SQLite, knowledge base trong bộ nhớ và vector store.
+# Nạp lại dữ liệu = dựng trọn một thế hệ mới bên cạnh thế hệ đang phục vụ, kiểm tra, rồi đổi con trỏ (nguyên tử).
+# Mỗi request giữ (reference count) thế hệ nó bắt đầu cho đến khi xong, nên request đang chạy không bao giờ thấy
+# dữ liệu trộn giữa hai thế hệ; thế hệ cũ chỉ được giải phóng khi request cuối cùng dùng nó kết thúc.
+PROCESSED_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
+RAW_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'raw')
+# Hard link tới file SQLite của từng thế hệ: file gốc bị thay bằng os.replace vẫn còn đọc được qua link này
+PIN_DIRNAME = ".generations"
+# Các bước dựng lại dữ liệu từ data/raw (chế độ rebuild), chạy trong process riêng theo thứ tự
+REBUILD_SCRIPTS = (
+    os.path.join("scripts", "preprocess_data.py"),
+    COLLECTION_SPECS["loandau"].build_script,
+    COLLECTION_SPECS["item"].build_script,
+)
+
+_active_generation: contextvars.ContextVar[Optional["DataGeneration"]] = contextvars.ContextVar(
+    "active_data_generation", default=None)
+
+
+class GenerationError(Exception):
+    """Thế hệ dữ liệu mới không dựng được hoặc không qua bước kiểm tra; thế hệ đang phục vụ được giữ nguyên."""
+    pass
+
+
+class ReloadInProgress(GenerationError):
+    pass
+
+
+def _file_identity(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def published_fingerprint(data_dir: str = PROCESSED_DATA_DIR) -> str:
+    """
+    Dấu vân tay của dữ liệu đã được công bố: danh tính file SQLite (inode, kích thước, mtime) và phiên bản
+    CURRENT của từng collection. Các script chỉ công bố bằng os.replace nên giá trị này đổi đúng một lần mỗi lần build.
+    """
+    parts = []
+    db_path = sqlite_database_path()
+    if db_path is not None:
+        parts.append(f"db={_file_identity(db_path)}")
+    for name in sorted(COLLECTION_SPECS):
+        pointer_path = os.path.join(bundle_root(data_dir), name, CURRENT_FILE)
+        try:
+            with open(pointer_path, encoding="utf-8") as f:
+                parts.append(f"{name}={f.read().strip()}")
+        except FileNotFoundError:
+            parts.append(f"{name}=missing")
+    return "|".join(parts)
+
+
+def raw_data_fingerprint(raw_dir: str = RAW_DATA_DIR) -> str:
+    """Dấu vân tay của các file Excel trong data/raw (tên, kích thước, mtime), dùng cho chế độ theo dõi + rebuild."""
+    if not os.path.isdir(raw_dir):
+        return ""
+    entries = sorted(name for name in os.listdir(raw_dir) if name.endswith(".xlsx") and not name.startswith("~$"))
+    return "|".join(f"{name}={_file_identity(os.path.join(raw_dir, name))}" for name in entries)
+
+
+def _pin_database(db_path: str, label: str) -> Optional[str]:
+    """Tạo hard link tới file SQLite hiện tại để thế hệ này luôn đọc đúng inode đó, kể cả khi file gốc bị thay."""
+    pin_dir = os.path.join(os.path.dirname(db_path), PIN_DIRNAME)
+    os.makedirs(pin_dir, exist_ok=True)
+    pin_path = os.path.join(pin_dir, f"{os.getpid()}-{label}.sqlite")
+    try:
+        os.link(db_path, pin_path)
+    except OSError as e:
+        logger.warning(f"Không tạo được hard link cho '{db_path}' ({e}), thế hệ dữ liệu sẽ đọc trực tiếp file gốc.")
+        return None
+    return pin_path
+
+
+def _remove_stale_pins(db_path: str):
+    """Xóa các link của process đã kết thúc (ví dụ worker bị kill trước khi kịp dọn)."""
+    pin_dir = os.path.join(os.path.dirname(db_path), PIN_DIRNAME)
+    if not os.path.isdir(pin_dir):
+        return
+    for name in os.listdir(pin_dir):
+        pid = name.split("-", 1)[0]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            os.remove(os.path.join(pin_dir, name))
+        except OSError:
+            pass  # Process vẫn tồn tại (của user khác): giữ nguyên
+
+
+def _load_vector_store(data_dir: str) -> VectorStore:
+    from app.services.encoder_backends import MODEL_NAME
+
+    return VectorStore.load(data_dir, expected_model=MODEL_NAME, search_params=IndexSearchParams(
+        ef_search=settings.VECTOR_HNSW_EF_SEARCH, nprobe=settings.VECTOR_IVF_NPROBE))
+
+
+class DataGeneration:
+    """
+    Một thế hệ dữ liệu: lớp đọc chỉ-đọc (ReadOnlySQLite) trên bản SQLite đã được ghim, knowledge base
+    và vector store (nạp lười). Được giải phóng (đóng kết nối, xóa link) khi đã bị thay thế và không còn request nào giữ.
+    """
+
+    def __init__(self, number: int, fingerprint: str, data_dir: str = PROCESSED_DATA_DIR):
+        self.number = number
+        self.fingerprint = fingerprint
+        self.version = f"g{number}-{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:12]}"
+        self.data_dir = data_dir
+        self.created_at = time.time()
+        self.pin_path: Optional[str] = None
+
+        db_path = sqlite_database_path()
+        if db_path is not None:
+            self.pin_path = _pin_database(db_path, self.version)
+            # Bản ghim không bao giờ bị sửa tại chỗ (dữ liệu mới luôn được công bố bằng file mới) nên mở được immutable
+            self.database = open_reader(self.pin_path or db_path,
+                                        immutable=settings.SQLITE_IMMUTABLE and self.pin_path is not None)
+        else:
+            self.database = create_engine(settings.DATABASE_URL)
+        self.knowledge_base: Optional[KnowledgeBase] = None
+        self.vector_store: LazyResource[VectorStore] = LazyResource("vector_store", lambda: _load_vector_store(data_dir))
+
+        self._lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+        self._closed = False
+
+    def load(self) -> "DataGeneration":
+        self.knowledge_base = KnowledgeBase.load(db=self.database)
+        return self
+
+    def validate(self, previous: Optional["DataGeneration"] = None):
+        """
+        Kiểm tra thế hệ mới trước khi đưa vào phục vụ: SQLite đọc được, đủ các bảng tri thức,
+        và vector store có ít nhất các collection mà thế hệ đang phục vụ có.
+        """
+        try:
+            run_query("SELECT 1 FROM menh LIMIT 1", db=self.database, one=True)
+        except Exception as e:
+            raise GenerationError(f"Không đọc được CSDL của thế hệ mới: {e}") from e
+
+        missing_tables = [name for name in TABLE_KEYS if name not in self.knowledge_base.tables]
+        if missing_tables:
+            raise GenerationError(f"Thế hệ mới thiếu các bảng tri thức: {missing_tables}")
+
+        try:
+            store = self.vector_store.get()
+        except Exception as e:
+            raise GenerationError(f"Không nạp được vector store của thế hệ mới: {e}") from e
+        required = set()
+        if previous is not None and previous.vector_store.is_ready():
+            required = set(previous.vector_store.get().collections)
+        missing_collections = sorted(required - set(store.collections))
+        if missing_collections:
+            raise GenerationError(f"Thế hệ mới thiếu các collection: {missing_collections}")
+
+    def acquire(self) -> "DataGeneration":
+        with self._lock:
+            if self._closed:
+                raise GenerationError(f"Thế hệ dữ liệu {self.version} đã được giải phóng.")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            should_close = self._retired and self._refs == 0
+        if should_close:
+            self.close()
+
+    def retire(self):
+        """Đánh dấu đã bị thay thế; giải phóng ngay nếu không còn request nào giữ."""
+        with self._lock:
+            self._retired = True
+            should_close = self._refs == 0
+        if should_close:
+            self.close()
+
+    @property
+    def refs(self) -> int:
+        return self._refs
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if hasattr(self.database, "dispose"):
+            self.database.dispose()
+        else:
+            self.database.close()
+        if self.pin_path and os.path.exists(self.pin_path):
+            os.remove(self.pin_path)
+        logger.info(f"Đã giải phóng thế hệ dữ liệu {self.version}.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "created_at": self.created_at,
+            "in_flight": self._refs,
+            "database": self.database.stats() if hasattr(self.database, "stats") else None,
+            "knowledge_base": self.knowledge_base.stats() if self.knowledge_base is not None else None,
+            "vector_store": self.vector_store.get().stats() if self.vector_store.is_ready() else None,
+        }
+
+
+SwapListener = Callable[[Optional[DataGeneration], DataGeneration], None]
+
+
+class GenerationManager:
+    """
+    Giữ thế hệ dữ liệu đang phục vụ và thực hiện nạp lại (dựng song song -> kiểm tra -> đổi nguyên tử).
+
+    - use(): context manager cho một request, giữ thế hệ hiện tại đến khi request kết thúc; các tool chạy
+      trong request (kể cả trong thread pool, xem run_sync_tool) đọc cùng thế hệ đó qua active().
+    - reload(): nạp thế hệ mới từ dữ liệu đã công bố (rebuild=True: chạy lại các script xử lý dữ liệu trước).
+    - register_swap_listener(): hook xóa các cache phụ thuộc dữ liệu sau khi đổi thế hệ.
+    """
+
+    def __init__(self, data_dir: str = PROCESSED_DATA_DIR):
+        self.data_dir = data_dir
+        self._current: Optional[DataGeneration] = None
+        self._retired: List[DataGeneration] = []
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listeners: List[SwapListener] = []
+        self._next_number = 1
+        self.reloads = 0
+        self.last_reload_error: Optional[str] = None
+
+    def _open_generation(self) -> DataGeneration:
+        with self._lock:
+            number = self._next_number
+            self._next_number += 1
+        return DataGeneration(number, published_fingerprint(self.data_dir), self.data_dir)
+
+    def current(self) -> DataGeneration:
+        """Thế hệ đang phục vụ; nạp thế hệ đầu tiên ở lần gọi đầu tiên."""
+        if self._current is None:
+            with self._reload_lock:
+                if self._current is None:
+                    db_path = sqlite_database_path()
+                    if db_path is not None:
+                        _remove_stale_pins(db_path)
+                    generation = self._open_generation().load()
+                    logger.info(f"Đã nạp thế hệ dữ liệu {generation.version}: {generation.knowledge_base.stats()}")
+                    with self._lock:
+                        self._current = generation
+        return self._current
+
+    def active(self, load: bool = True) -> Optional[DataGeneration]:
+        """Thế hệ của request đang chạy, hoặc thế hệ hiện tại nếu gọi ngoài request (None nếu chưa nạp và load=False)."""
+        generation = _active_generation.get()
+        if generation is not None:
+            return generation
+        if self._current is None and not load:
+            return None
+        return self.current()
+
+    @contextmanager
+    def use(self) -> Iterator[DataGeneration]:
+        if _active_generation.get() is not None:
+            yield _active_generation.get()
+            return
+        self.current()
+        with self._lock:
+            generation = self._current.acquire()
+        token = _active_generation.set(generation)
+        try:
+            yield generation
+        finally:
+            _active_generation.reset(token)
+            generation.release()
+
+    def register_swap_listener(self, listener: SwapListener):
+        self._listeners.append(listener)
+
+    def reload(self, rebuild: bool = False, force: bool = False) -> Dict[str, Any]:
+        """
+        Dựng thế hệ dữ liệu mới bên cạnh thế hệ đang phục vụ, kiểm tra rồi đổi sang.
+        Request đang chạy tiếp tục trên thế hệ cũ; request mới dùng thế hệ mới ngay sau khi đổi.
+
+        Args:
+            rebuild: Chạy lại scripts/preprocess_data.py và các script tạo embedding từ data/raw trước khi nạp.
+            force: Nạp lại kể cả khi dữ liệu đã công bố không thay đổi.
+
+        Raises:
+            ReloadInProgress: Đang có một lần nạp lại khác chạy.
+            GenerationError: Dựng hoặc kiểm tra thất bại (thế hệ đang phục vụ được giữ nguyên).
+        """
+        self.current()  # Nạp thế hệ đầu tiên nếu chưa có (current() tự lấy _reload_lock)
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress("Đang có một lần nạp lại dữ liệu khác chạy.")
+        try:
+            # Chỉ đọc thế hệ đang phục vụ khi đã giữ _reload_lock: một lần nạp lại khác có thể vừa đổi thế hệ
+            previous = self._current
+            started_at = time.perf_counter()
+            if rebuild:
+                self._run_rebuild_scripts()
+
+            fingerprint = published_fingerprint(self.data_dir)
+            if fingerprint == previous.fingerprint and not force:
+                logger.info(f"Dữ liệu đã công bố không thay đổi, giữ thế hệ {previous.version}.")
+                return {"status": "unchanged", "version": previous.version}
+
+            generation = self._open_generation()
+            try:
+                generation.load()
+                generation.validate(previous)
+            except Exception as e:
+                generation.close()
+                self.last_reload_error = str(e)
+                if isinstance(e, GenerationError):
+                    raise
+                raise GenerationError(f"Không dựng được thế hệ dữ liệu mới: {e}") from e
+
+            with self._lock:
+                self._current = generation
+                self._retired = [g for g in self._retired if not g.closed] + [previous]
+            for listener in self._listeners:
+                try:
+                    listener(previous, generation)
+                except Exception as e:
+                    logger.error(f"Lỗi trong swap listener {listener!r}: {e}")
+            previous.retire()
+            self.reloads += 1
+            self.last_reload_error = None
+            elapsed = time.perf_counter() - started_at
+            logger.info(f"Đã chuyển thế hệ dữ liệu {previous.version} -> {generation.version} sau {elapsed:.1f}s "
+                        f"({previous.refs} request còn chạy trên thế hệ cũ).")
+            return {
+                "status": "swapped",
+                "previous_version": previous.version,
+                "version": generation.version,
+                "seconds": round(elapsed, 2),
+                "knowledge_base": generation.knowledge_base.stats(),
+                "vector_store": generation.vector_store.get().stats(),
+            }
+        finally:
+            self._reload_lock.release()
+
+    def _run_rebuild_scripts(self):
+        for script in REBUILD_SCRIPTS:
+            logger.info(f"Đang chạy '{script}'...")
+            result = subprocess.run([sys.executable, os.path.join(PROJECT_ROOT, script)], cwd=PROJECT_ROOT)
+            if result.returncode != 0:
+                self.last_reload_error = f"'{script}' thoát với mã {result.returncode}"
+                raise GenerationError(f"Rebuild thất bại: {self.last_reload_error}.")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            current = self._current
+            retired = [g for g in self._retired if not g.closed]
+        return {
+            "current": current.stats() if current is not None else None,
+            "retired_in_flight": {g.version: g.refs for g in retired},
+            "reloads": self.reloads,
+            "last_reload_error": self.last_reload_error,
+        }
+
+
+async def watch_data_files(manager: "GenerationManager", interval: float, rebuild_on_raw_change: bool = False):
+    """
+    Theo dõi dữ liệu (polling): khi dữ liệu đã công bố (file SQLite, CURRENT của các bundle) thay đổi thì nạp lại;
+    khi rebuild_on_raw_change và các file Excel trong data/raw thay đổi thì dựng lại rồi nạp.
+    Một thay đổi chỉ được xử lý khi giữ nguyên qua hai lần kiểm tra liên tiếp (các script đã ghi xong mọi file),
+    và một thay đổi đã nạp thất bại không được thử lại cho đến khi dữ liệu thay đổi tiếp.
+    """
+    applied_raw = await asyncio.to_thread(raw_data_fingerprint)
+    seen: Dict[str, Optional[str]] = {"raw": None, "published": None}
+    failed: Dict[str, Optional[str]] = {"raw": None, "published": None}
+
+    def settled(kind: str, fingerprint: str) -> bool:
+        stable = seen[kind] == fingerprint
+        seen[kind] = fingerprint
+        return stable and failed[kind] != fingerprint
+
+    logger.info(f"Bật chế độ theo dõi dữ liệu (mỗi {interval}s, rebuild khi data/raw đổi: {rebuild_on_raw_change}).")
+    while True:
+        await asyncio.sleep(interval)
+        kind, fingerprint = "published", None
+        try:
+            raw = await asyncio.to_thread(raw_data_fingerprint)
+            if rebuild_on_raw_change and raw != applied_raw and failed["raw"] != raw:
+                kind, fingerprint = "raw", raw
+                if settled(kind, raw):
+                    logger.info("Phát hiện data/raw thay đổi, đang dựng lại dữ liệu...")
+                    await asyncio.to_thread(manager.reload, rebuild=True)
+                    applied_raw = raw
+                continue
+
+            fingerprint = await asyncio.to_thread(published_fingerprint, manager.data_dir)
+            if fingerprint != manager.current().fingerprint and settled(kind, fingerprint):
+                logger.info("Phát hiện dữ liệu đã công bố thay đổi, đang nạp lại...")
+                await asyncio.to_thread(manager.reload)
+        except ReloadInProgress:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            failed[kind] = fingerprint
+            logger.error(f"Tự động nạp lại dữ liệu thất bại: {e}")
+
+
+# --- Instance dùng chung cho toàn bộ process ---
+generation_manager = GenerationManager()
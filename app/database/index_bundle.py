@@ -0,0 +1,211 @@
+# app/database/index_bundle.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# --- Bundle index: định dạng lưu trữ của một collection trong vector store ---
+# data/processed/vector_store/<collection>/
+#   CURRENT                      <- tên phiên bản đang dùng, đổi bằng os.replace (nguyên tử)
+#   <phiên bản>/
+#     manifest.json              <- model, số chiều, số dòng, loại index, content hash của cả bundle
+#     index.faiss                <- chỉ mục FAISS
+#     ids.npy                    <- id của từng vector theo thứ tự lưu trong index
+#     meta_<trường>.npy          <- metadata dạng cột (NumPy, không pickle), được nạp bằng memory-map
+# Metadata được memory-map nên các worker uvicorn dùng chung page cache của hệ điều hành thay vì mỗi
+# process giữ một bản sao; index và metadata luôn được ghi/đổi cùng nhau trong một thư mục phiên bản.
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ROOT_DIRNAME = "vector_store"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+IDS_FILE = "ids.npy"
+KEEP_VERSIONS = 2  # Số phiên bản cũ được giữ lại (để quay lui, và cho process còn đang đọc)
+
+
+class BundleError(Exception):
+    """Bundle hỏng, sai định dạng, hoặc index và metadata không khớp nhau."""
+    pass
+
+
+class BundleManifest(BaseModel):
+    format_version: int
+    collection: str
+    version: str
+    model: str
+    backend: Optional[str] = None
+    dimension: int
+    rows: int
+    index_mode: str
+    columns: List[str]
+    content_hash: str  # sha256 của index.faiss, ids.npy và các cột metadata
+    corpus_hash: Optional[str] = None  # sha256 của văn bản corpus đã dùng để tạo embedding (nếu biết)
+    created_at: str
+
+
+class IndexBundle(NamedTuple):
+    manifest: BundleManifest
+    index: Any
+    ids: np.ndarray
+    columns: Dict[str, np.ndarray]
+    path: str
+
+
+def bundle_root(data_dir: str) -> str:
+    return os.path.join(data_dir, BUNDLE_ROOT_DIRNAME)
+
+
+def _column_file(field: str) -> str:
+    return f"meta_{field}.npy"
+
+
+def _content_hash(bundle_dir: str, columns: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for file_name in [INDEX_FILE, IDS_FILE] + [_column_file(field) for field in sorted(columns)]:
+        digest.update(file_name.encode("utf-8"))
+        with open(os.path.join(bundle_dir, file_name), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def current_bundle_path(root: str, collection: str) -> Optional[str]:
+    """Đường dẫn thư mục phiên bản đang dùng của collection, hoặc None nếu chưa có bundle nào."""
+    pointer_path = os.path.join(root, collection, CURRENT_FILE)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, encoding="utf-8") as f:
+        version = f.read().strip()
+    return os.path.join(root, collection, version)
+
+
+def _prune_old_versions(collection_dir: str, current_version: str):
+    versions = sorted(
+        name for name in os.listdir(collection_dir)
+        if not name.startswith(".") and os.path.isdir(os.path.join(collection_dir, name)) and name != current_version
+    )
+    for name in versions[:-KEEP_VERSIONS] if KEEP_VERSIONS else versions:
+        # Trên Linux, process đang memory-map file của phiên bản cũ vẫn đọc được đến khi unmap
+        shutil.rmtree(os.path.join(collection_dir, name), ignore_errors=True)
+
+
+def write_bundle(root: str, collection: str, index: Any, ids: np.ndarray, columns: Dict[str, Sequence[Any]],
+                 model: str, backend: Optional[str] = None, corpus_hash: Optional[str] = None) -> BundleManifest:
+    """
+    Ghi một phiên bản bundle mới vào thư mục tạm, đổi tên thành thư mục phiên bản rồi trỏ CURRENT sang đó.
+    Process đang đọc luôn thấy trọn vẹn phiên bản cũ hoặc phiên bản mới, không bao giờ thấy bản ghi dở.
+    """
+    import faiss
+
+    from app.database.vector_store import index_ids, index_mode
+
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if index.ntotal != len(ids) or any(len(values) != len(ids) for values in columns.values()):
+        raise BundleError(f"Collection '{collection}': số vector, số id và số dòng metadata phải bằng nhau.")
+    if not np.array_equal(index_ids(index), ids):
+        raise BundleError(f"Collection '{collection}': thứ tự id không khớp với index.")
+
+    collection_dir = os.path.join(root, collection)
+    os.makedirs(collection_dir, exist_ok=True)
+    created_at = datetime.now(timezone.utc)
+    tmp_dir = os.path.join(collection_dir, f".tmp-{os.getpid()}-{created_at:%Y%m%d%H%M%S%f}")
+    os.makedirs(tmp_dir)
+    try:
+        faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+        np.save(os.path.join(tmp_dir, IDS_FILE), ids, allow_pickle=False)
+        for field, values in columns.items():
+            np.save(os.path.join(tmp_dir, _column_file(field)), np.asarray(list(values)), allow_pickle=False)
+
+        content_hash = _content_hash(tmp_dir, list(columns))
+        manifest = BundleManifest(
+            format_version=BUNDLE_FORMAT_VERSION,
+            collection=collection,
+            version=f"{created_at:%Y%m%dT%H%M%S%f}-{content_hash[:12]}",
+            model=model,
+            backend=backend,
+            dimension=index.d,
+            rows=len(ids),
+            index_mode=index_mode(index),
+            columns=list(columns),
+            content_hash=content_hash,
+            corpus_hash=corpus_hash,
+            created_at=created_at.isoformat(),
+        )
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest.model_dump(), f, ensure_ascii=False, indent=2)
+
+        os.rename(tmp_dir, os.path.join(collection_dir, manifest.version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(collection_dir, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(manifest.version)
+    os.replace(pointer_tmp, os.path.join(collection_dir, CURRENT_FILE))
+    _prune_old_versions(collection_dir, manifest.version)
+    logger.info(f"Đã ghi bundle '{collection}' phiên bản {manifest.version} ({manifest.rows} vectors).")
+    return manifest
+
+
+def read_bundle(path: str, expected_model: Optional[str] = None, expected_columns: Optional[Sequence[str]] = None,
+                verify_hash: bool = True) -> IndexBundle:
+    """
+    Nạp một phiên bản bundle và kiểm tra index khớp với metadata theo manifest.
+
+    Raises:
+        FileNotFoundError: thư mục bundle không tồn tại.
+        BundleError: sai định dạng, sai mô hình, hoặc index/metadata không khớp (số dòng, số chiều, id, content hash).
+    """
+    import faiss
+
+    from app.database.vector_store import index_ids
+
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Không tìm thấy manifest của bundle tại: {path}")
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = BundleManifest.model_validate(json.load(f))
+
+    if manifest.format_version != BUNDLE_FORMAT_VERSION:
+        raise BundleError(f"Bundle '{path}' có định dạng v{manifest.format_version}, "
+                          f"server chỉ hỗ trợ v{BUNDLE_FORMAT_VERSION}.")
+    if expected_model is not None and manifest.model != expected_model:
+        raise BundleError(f"Bundle '{path}' được tạo bởi mô hình '{manifest.model}', server dùng '{expected_model}'.")
+    if expected_columns is not None and set(manifest.columns) != set(expected_columns):
+        raise BundleError(f"Bundle '{path}' có các cột {manifest.columns}, cần {list(expected_columns)}.")
+    if verify_hash and _content_hash(path, manifest.columns) != manifest.content_hash:
+        raise BundleError(f"Content hash của bundle '{path}' không khớp manifest (index hoặc metadata đã bị thay đổi).")
+
+    index = faiss.read_index(os.path.join(path, INDEX_FILE))
+    ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r", allow_pickle=False)
+    columns = {
+        field: np.load(os.path.join(path, _column_file(field)), mmap_mode="r", allow_pickle=False)
+        for field in manifest.columns
+    }
+
+    if index.ntotal != manifest.rows or index.d != manifest.dimension:
+        raise BundleError(f"Index của bundle '{path}' có {index.ntotal}x{index.d}, "
+                          f"manifest ghi {manifest.rows}x{manifest.dimension}.")
+    if len(ids) != manifest.rows or any(len(values) != manifest.rows for values in columns.values()):
+        raise BundleError(f"Metadata của bundle '{path}' không có đúng {manifest.rows} dòng.")
+    if not np.array_equal(index_ids(index), ids):
+        raise BundleError(f"Id trong index của bundle '{path}' không khớp metadata.")
+    return IndexBundle(manifest=manifest, index=index, ids=ids, columns=columns, path=path)
+
+
+def load_current_bundle(root: str, collection: str, expected_model: Optional[str] = None,
+                        expected_columns: Optional[Sequence[str]] = None) -> IndexBundle:
+    path = current_bundle_path(root, collection)
+    if path is None:
+        raise FileNotFoundError(f"Collection '{collection}' chưa có bundle nào trong: {root}")
+    return read_bundle(path, expected_model=expected_model, expected_columns=expected_columns)
@@ -0,0 +1,199 @@
+# app/database/knowledge_base.py
+
+import contextvars
+import logging
+import math
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.database import connection
+
+logger = logging.getLogger(__name__)
+
+# --- Khai báo các bảng tri thức tĩnh và cột khóa dùng để tra cứu ---
+# Các bảng này nhỏ và không thay đổi khi server đang chạy, nên được nạp một lần
+# vào bộ nhớ thay vì mỗi lần tra cứu lại mở kết nối, chạy SELECT * và dựng DataFrame.
+# Khi một khóa xuất hiện nhiều lần, dòng đầu tiên được giữ lại (giống thứ tự trả về của SQLite).
+TABLE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "cung_menh_lookup": ("namsinh_amlich", "gioitinh"),
+    "menh": ("tenmenh",),
+    "nap_am": ("napamid",),
+    # Bảng ánh xạ Can Chi -> Nạp Âm do scripts/preprocess_data.py tách từ cột canchi_tuongung
+    "nap_am_can_chi": ("can_chi",),
+    "huong": ("tenhuong",),
+    "cung_menh_huong_rules": ("cungmenh_giachu", "huongnha"),
+    "bat_trach_cung_vi": ("tencung",),
+    "menh_huong_rules": ("menhgiachu", "huongnha"),
+    "menh_menh_rules": ("napam1", "napam2"),
+    "phi_tinh_luu_nien": ("nam_duonglich",),
+}
+
+# Các bảng câu trả lời dựng sẵn (scripts/preprocess_data.py, xem app/tools/precomputed_tools.py), cột 'payload' là JSON.
+# Không bắt buộc: database dựng trước khi có các bảng này vẫn phục vụ được, workflow quay về chuỗi tra cứu từng bước.
+ANSWER_TABLE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "answer_person": ("namsinh_amlich", "gioitinh"),
+    "answer_analyze_house": ("namsinh_amlich", "gioitinh", "huongnha"),
+    "answer_nap_am_pair": ("napam1", "napam2"),
+}
+
+# Knowledge base thay thế cho thế hệ dữ liệu đang phục vụ (chỉ dùng khi dựng bảng câu trả lời từ database đang build)
+_knowledge_base_override: contextvars.ContextVar[Optional["KnowledgeBase"]] = contextvars.ContextVar(
+    "knowledge_base_override", default=None)
+
+
+def normalize_key(value: Any) -> Any:
+    """
+    Chuẩn hóa một giá trị khóa để so khớp ổn định giữa dữ liệu CSDL và đầu vào của tool:
+    - Số thực nguyên (1991.0 do pandas suy luận kiểu) -> int.
+    - Chuỗi -> Unicode NFC, bỏ khoảng trắng thừa.
+    """
+    if isinstance(value, float) and not math.isnan(value) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFC", value).split())
+    return value
+
+
+class TableIndex:
+    """
+    Chỉ mục trong bộ nhớ cho một bảng: các dòng được lưu dạng tuple (gọn hơn dict),
+    dùng chung một tuple tên cột, và một dict từ khóa -> vị trí dòng để tra cứu O(1).
+    """
+    __slots__ = ("name", "columns", "key_columns", "_rows", "_index")
+
+    def __init__(self, name: str, columns: Tuple[str, ...], key_columns: Tuple[str, ...],
+                 rows: List[Tuple[Any, ...]]):
+        self.name = name
+        self.columns = columns
+        self.key_columns = key_columns
+        self._rows = rows
+        self._index: Dict[Tuple[Any, ...], int] = {}
+
+        key_positions = [columns.index(col) for col in key_columns]
+        for position, row in enumerate(rows):
+            key = tuple(normalize_key(row[i]) for i in key_positions)
+            self._index.setdefault(key, position)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _as_dict(self, position: int) -> Dict[str, Any]:
+        # Luôn trả về một dict mới để caller có thể sửa đổi mà không ảnh hưởng dữ liệu dùng chung
+        return dict(zip(self.columns, self._rows[position]))
+
+    def get(self, *key: Any) -> Optional[Dict[str, Any]]:
+        """Tra cứu một dòng theo khóa (theo thứ tự của key_columns)."""
+        position = self._index.get(tuple(normalize_key(k) for k in key))
+        return None if position is None else self._as_dict(position)
+
+    def get_first(self, keys: Iterable[Tuple[Any, ...]]) -> Optional[Dict[str, Any]]:
+        """Trong các khóa cho trước, trả về dòng xuất hiện sớm nhất trong bảng (tương đương WHERE ... OR ...)."""
+        positions = [self._index.get(tuple(normalize_key(k) for k in key)) for key in keys]
+        positions = [p for p in positions if p is not None]
+        return self._as_dict(min(positions)) if positions else None
+
+    def find(self, predicate: Callable[[Dict[str, Any]], bool]) -> Optional[Dict[str, Any]]:
+        """Quét tuần tự và trả về dòng đầu tiên thỏa mãn điều kiện (chỉ dùng cho các bảng rất nhỏ)."""
+        for position in range(len(self._rows)):
+            row = self._as_dict(position)
+            if predicate(row):
+                return row
+        return None
+
+    def keys(self) -> List[Tuple[Any, ...]]:
+        """Danh sách các khóa theo thứ tự xuất hiện trong bảng."""
+        return list(self._index.keys())
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for position in range(len(self._rows)):
+            yield self._as_dict(position)
+
+
+class KnowledgeBase:
+    """Tập hợp các TableIndex của những bảng tri thức tĩnh, được nạp một lần từ CSDL."""
+
+    def __init__(self, tables: Dict[str, TableIndex]):
+        self.tables = tables
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, db=None, answers: bool = True) -> "KnowledgeBase":
+        """
+        Đọc toàn bộ các bảng trong TABLE_KEYS (và ANSWER_TABLE_KEYS nếu answers=True) từ CSDL
+        (db cho trước, mặc định connection.get_database()) và dựng chỉ mục.
+        """
+        tables: Dict[str, TableIndex] = {}
+        for table_name, key_columns in TABLE_KEYS.items():
+            records = connection.fetch_all(f"SELECT * FROM {table_name}", db=db, mappings=False)
+            if not records:
+                logger.error(f"Không thể nạp bảng '{table_name}' vào knowledge base (bảng rỗng hoặc không tồn tại).")
+                continue
+            columns = tuple(records[0]._fields)
+            rows = [tuple(record) for record in records]
+            tables[table_name] = TableIndex(table_name, columns, key_columns, rows)
+            logger.info(f"Đã nạp bảng '{table_name}' vào knowledge base ({len(rows)} dòng).")
+
+        for table_name, key_columns in (ANSWER_TABLE_KEYS.items() if answers else ()):
+            try:
+                records = connection.run_query(f"SELECT * FROM {table_name}", db=db, mappings=False)
+            except Exception:
+                logger.warning(f"Chưa có bảng câu trả lời dựng sẵn '{table_name}' (chạy lại scripts/preprocess_data.py).")
+                continue
+            if records:
+                tables[table_name] = TableIndex(table_name, tuple(records[0]._fields), key_columns,
+                                                [tuple(record) for record in records])
+                logger.info(f"Đã nạp bảng câu trả lời '{table_name}' ({len(records)} dòng).")
+        return cls(tables)
+
+    def table(self, table_name: str) -> Optional[TableIndex]:
+        return self.tables.get(table_name)
+
+    def lookup(self, table_name: str, *key: Any) -> Optional[Dict[str, Any]]:
+        """Tra cứu O(1) một dòng theo khóa. Trả về None nếu bảng hoặc khóa không tồn tại."""
+        table = self.tables.get(table_name)
+        if table is None:
+            logger.error(f"Bảng '{table_name}' chưa được nạp vào knowledge base.")
+            return None
+        return table.get(*key)
+
+    def stats(self) -> Dict[str, int]:
+        return {name: len(table) for name, table in self.tables.items()}
+
+
+# --- Knowledge base thuộc thế hệ dữ liệu đang phục vụ (xem app/database/generations.py) ---
+def get_knowledge_base() -> KnowledgeBase:
+    """
+    Trả về knowledge base của thế hệ dữ liệu mà request hiện tại đang dùng
+    (ngoài request: thế hệ hiện tại, tự nạp ở lần gọi đầu tiên nếu chưa được nạp lúc khởi động).
+    """
+    override = _knowledge_base_override.get()
+    if override is not None:
+        return override
+
+    from app.database.generations import generation_manager
+
+    return generation_manager.active().knowledge_base
+
+
+@contextmanager
+def use_knowledge_base(knowledge_base: KnowledgeBase) -> Iterator[KnowledgeBase]:
+    """Cho các tool trong khối with tra cứu trên knowledge base cho trước thay vì thế hệ dữ liệu đang phục vụ."""
+    token = _knowledge_base_override.set(knowledge_base)
+    try:
+        yield knowledge_base
+    finally:
+        _knowledge_base_override.reset(token)
+
+
+def reload_knowledge_base() -> KnowledgeBase:
+    """
+    Hook nạp lại dữ liệu, dùng sau khi 'scripts/preprocess_data.py' tạo lại file SQLite.
+    Toàn bộ thế hệ dữ liệu mới (CSDL, knowledge base, vector store) được dựng và kiểm tra xong rồi mới
+    thay thế thế hệ cũ, nên các tra cứu đang chạy không bao giờ thấy dữ liệu dở dang.
+    """
+    from app.database.generations import generation_manager
+
+    generation_manager.reload()
+    return generation_manager.current().knowledge_base
@@ -0,0 +1,178 @@
+# app/database/schema.py
+
+from typing import Dict, List, Literal, Sequence, Tuple
+
+from pydantic import BaseModel
+
+# --- Schema khai báo cho các bảng tri thức trong phongthuy.sqlite ---
+# scripts/preprocess_data.py dựng mỗi bảng theo TableSchema tương ứng thay vì để pandas tự suy kiểu:
+# cột được ép đúng kiểu (năm là INTEGER, không phải REAL), có khóa chính, các index cho những cột tra cứu
+# của tools/knowledge base (mọi tra cứu theo khóa là index seek), và kiểm tra NOT NULL / UNIQUE ngay lúc build.
+# Cột không được khai báo trong `columns` là TEXT. Tên cột là tên đã chuẩn hóa (xem normalize_text trong script).
+
+
+class SchemaError(Exception):
+    """Dữ liệu nguồn không khớp schema khai báo (thiếu cột, sai kiểu, NULL ở cột bắt buộc)."""
+    pass
+
+
+class TableSchema(BaseModel):
+    name: str
+    primary_key: Tuple[str, ...]
+    columns: Dict[str, Literal["INTEGER", "REAL"]] = {}  # Các cột không khai báo là TEXT
+    indexes: Tuple[Tuple[str, ...], ...] = ()
+    unique_indexes: Tuple[Tuple[str, ...], ...] = ()
+    not_null: Tuple[str, ...] = ()  # Ngoài các cột khóa chính và cột index (luôn NOT NULL)
+    derived: bool = False  # Bảng phái sinh, không có file data/raw/<name>.xlsx tương ứng
+
+    def column_type(self, column: str) -> str:
+        return self.columns.get(column, "TEXT")
+
+    def required_columns(self) -> List[str]:
+        """Các cột bắt buộc phải có trong dữ liệu nguồn và không được NULL."""
+        required = list(self.primary_key)
+        for columns in self.indexes + self.unique_indexes:
+            required.extend(columns)
+        required.extend(self.not_null)
+        return list(dict.fromkeys(required))
+
+    def create_table_sql(self, columns: Sequence[str]) -> str:
+        not_null = set(self.required_columns())
+        definitions = [
+            f'"{column}" {self.column_type(column)}' + (" NOT NULL" if column in not_null else "")
+            for column in columns
+        ]
+        definitions.append(f"PRIMARY KEY ({', '.join(self.primary_key)})")
+        return f'CREATE TABLE "{self.name}" (\n  ' + ",\n  ".join(definitions) + "\n)"
+
+    def create_index_sql(self) -> List[str]:
+        statements = []
+        for unique, index_columns in [(False, c) for c in self.indexes] + [(True, c) for c in self.unique_indexes]:
+            index_name = f"idx_{self.name}_{'_'.join(index_columns)}"
+            statements.append(f'CREATE {"UNIQUE " if unique else ""}INDEX "{index_name}" '
+                              f'ON "{self.name}" ({", ".join(index_columns)})')
+        return statements
+
+
+_INTEGER = "INTEGER"
+_REAL = "REAL"
+
+TABLE_SCHEMAS: Dict[str, TableSchema] = {schema.name: schema for schema in [
+    TableSchema(
+        name="bat_trach_cung_vi",
+        primary_key=("cungviid",),
+        columns={"cungviid": _INTEGER, "uutien_dat_cuachinh": _INTEGER, "uutien_dat_phongngu": _INTEGER,
+                 "uutien_dat_bep": _INTEGER, "uutien_dat_bantho": _INTEGER, "uutien_dat_banlamviec": _INTEGER,
+                 "version": _REAL},
+        unique_indexes=(("tencung",),),
+    ),
+    TableSchema(
+        name="cung_menh_huong_rules",
+        primary_key=("ruleid",),
+        columns={"ruleid": _INTEGER, "cungviid_thamchieu": _INTEGER, "diemso_battrach": _INTEGER,
+                 "diemso_nguhanh": _INTEGER, "diemso_tonghop": _INTEGER, "uutien_lam_cuachinh": _INTEGER,
+                 "uutien_lam_phongngu": _INTEGER, "uutien_lam_bep_toa": _INTEGER, "uutien_lam_nhavesinh": _INTEGER,
+                 "version": _REAL},
+        indexes=(("cungmenh_giachu", "huongnha"),),
+        not_null=("tencungvi_taothanh",),
+    ),
+    TableSchema(
+        name="cung_menh_lookup",
+        primary_key=("ruleid",),
+        columns={"ruleid": _INTEGER, "namsinh_amlich": _INTEGER, "version": _REAL},
+        indexes=(("namsinh_amlich", "gioitinh"),),
+        not_null=("cungmenh",),
+    ),
+    TableSchema(
+        name="huong",
+        primary_key=("huongid",),
+        columns={"huongid": _INTEGER, "gocdolaban_ketthuc": _REAL},
+        unique_indexes=(("tenhuong",),),
+    ),
+    TableSchema(
+        name="loan_dau_cat_tuong",
+        primary_key=("thedatid",),
+        columns={"thedatid": _INTEGER, "diemso_catkhi": _INTEGER},
+        unique_indexes=(("tenthedat",),),
+    ),
+    TableSchema(
+        name="menh",
+        primary_key=("menhid",),
+        columns={"menhid": _INTEGER},
+        unique_indexes=(("tenmenh",),),
+    ),
+    TableSchema(
+        name="menh_huong_rules",
+        primary_key=("ruleid",),
+        columns={"ruleid": _INTEGER, "suitabilityscore": _INTEGER, "version": _REAL},
+        indexes=(("menhgiachu", "huongnha"),),
+    ),
+    TableSchema(
+        name="menh_menh_rules",
+        primary_key=("ruleid",),
+        columns={"ruleid": _INTEGER, "compatibilityscore": _INTEGER, "version": _REAL},
+        indexes=(("napam1", "napam2"),),
+    ),
+    TableSchema(
+        name="menh_ngu_hanh_lookup",
+        primary_key=("namsinh_amlich",),
+        columns={"namsinh_amlich": _INTEGER},
+        not_null=("menhnguhanh", "napam"),
+    ),
+    TableSchema(
+        name="nap_am",
+        primary_key=("napamid",),
+        columns={"napamid": _INTEGER, "diemso_doanmenh": _INTEGER},
+        indexes=(("tennapam",),),
+    ),
+    # Bảng phái sinh, do scripts/preprocess_data.py tách từ cột nap_am.canchi_tuongung
+    TableSchema(
+        name="nap_am_can_chi",
+        primary_key=("can_chi",),
+        columns={"napamid": _INTEGER},
+        not_null=("napamid",),
+        derived=True,
+    ),
+    TableSchema(
+        name="ngoai_canh_sat_khi",
+        primary_key=("satkhiid",),
+        columns={"satkhiid": _INTEGER, "diemso_satkhi": _INTEGER, "version": _REAL},
+        unique_indexes=(("tensatkhi",),),
+    ),
+    TableSchema(
+        name="phi_tinh_luu_nien",
+        primary_key=("ruleid",),
+        columns={"ruleid": _INTEGER, "nam_duonglich": _INTEGER, "sonhaptrungcung": _INTEGER,
+                 "saotai_trungcung": _INTEGER, "saotai_taybac": _INTEGER, "saotai_tay": _INTEGER,
+                 "saotai_dongbac": _INTEGER, "saotai_nam": _INTEGER, "saotai_bac": _INTEGER,
+                 "saotai_taynam": _INTEGER, "saotai_dong": _INTEGER, "saotai_dongnam": _INTEGER, "version": _REAL},
+        unique_indexes=(("nam_duonglich",),),
+    ),
+    TableSchema(
+        name="vat_pham_phong_thuy",
+        primary_key=("vatphamid",),
+        columns={"vatphamid": _INTEGER, "version": _REAL},
+        indexes=(("tenvatpham",),),
+    ),
+    # Các bảng câu trả lời dựng sẵn (phái sinh từ các bảng trên, xem app/tools/precomputed_tools.py)
+    TableSchema(
+        name="answer_person",
+        primary_key=("namsinh_amlich", "gioitinh"),
+        columns={"namsinh_amlich": _INTEGER},
+        not_null=("payload",),
+        derived=True,
+    ),
+    TableSchema(
+        name="answer_analyze_house",
+        primary_key=("namsinh_amlich", "gioitinh", "huongnha"),
+        columns={"namsinh_amlich": _INTEGER},
+        not_null=("payload",),
+        derived=True,
+    ),
+    TableSchema(
+        name="answer_nap_am_pair",
+        primary_key=("napam1", "napam2"),
+        not_null=("payload",),
+        derived=True,
+    ),
+]}
@@ -0,0 +1,135 @@
+# app/database/sqlite_reader.py
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from app.core.metrics import LATENCY_BUCKETS_MS, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Thời gian thực thi (ms) của các truy vấn qua ReadOnlySQLite, mọi thế hệ dữ liệu dùng chung
+SQLITE_QUERY_LATENCY = Histogram("sqlite_query_ms", (0.05, 0.1, 0.25, 0.5) + LATENCY_BUCKETS_MS)
+# Số prepared statement sqlite3 giữ lại trên mỗi kết nối (các tool chỉ dùng vài chục câu SQL cố định)
+STATEMENT_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=256)
+def _row_type(columns: Tuple[str, ...]):
+    # rename=True: tên cột không hợp lệ cho namedtuple (trùng từ khóa, bắt đầu bằng số...) được đổi thành _0, _1...
+    return namedtuple("Row", columns, rename=True)
+
+
+class ReadOnlySQLite:
+    """
+    Lớp truy cập chỉ-đọc cho file SQLite tri thức, thay cho connection pool mặc định của SQLAlchemy.
+
+    - Mỗi thread (worker của TOOL_EXECUTOR, EMBEDDING_EXECUTOR...) giữ một kết nối riêng, mở một lần và dùng lại:
+      không có bước checkout/checkin qua một pool chung có khóa, các tool chạy song song không phải chờ nhau.
+    - File được mở bằng URI `mode=ro` (và `immutable=1` khi file chắc chắn không bị sửa tại chỗ, ví dụ bản đã được
+      ghim của một thế hệ dữ liệu): SQLite bỏ qua khóa file và kiểm tra thay đổi giữa các giao dịch.
+    - PRAGMA: query_only (chặn mọi lệnh ghi), mmap_size (đọc trang qua memory-map, dùng chung page cache của hệ điều
+      hành giữa các worker), cache_size (page cache riêng mỗi kết nối), temp_store=MEMORY (sắp xếp/tạm trong RAM).
+    """
+
+    def __init__(self, path: str, immutable: bool = False, mmap_size_mb: int = 64, cache_size_mb: int = 8):
+        self.path = path
+        self.immutable = immutable
+        self.mmap_size_mb = mmap_size_mb
+        self.cache_size_mb = cache_size_mb
+        self._uri = f"file:{quote(path)}?mode=ro" + ("&immutable=1" if immutable else "")
+        self._local = threading.local()
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._opened_total = 0
+        self._queries = 0
+        self._errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False chỉ để close() có thể đóng từ thread khác; mỗi kết nối chỉ được dùng bởi thread của nó
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size_mb * 1024 * 1024}")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size_mb * 1024}")  # Số âm: đơn vị KiB
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            if self._closed:
+                conn.close()
+                raise sqlite3.ProgrammingError(f"ReadOnlySQLite '{self.path}' đã bị đóng.")
+            self._connections[threading.get_ident()] = conn
+            self._opened_total += 1
+        logger.debug(f"Mở kết nối SQLite chỉ-đọc cho thread '{threading.current_thread().name}': {self._uri}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Kết nối của thread hiện tại (mở ở lần dùng đầu tiên)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        elif self._closed:
+            raise sqlite3.ProgrammingError(f"ReadOnlySQLite '{self.path}' đã bị đóng.")
+        return conn
+
+    def _execute(self, query: str, params: Optional[Dict[str, Any]]) -> sqlite3.Cursor:
+        started_at = time.perf_counter()
+        failed = True
+        try:
+            cursor = self.connection().execute(query, params or {})
+            failed = False
+        finally:
+            # Nhiều thread cùng dùng một ReadOnlySQLite: bộ đếm chỉ được cập nhật khi giữ lock
+            with self._lock:
+                self._queries += 1
+                if failed:
+                    self._errors += 1
+            SQLITE_QUERY_LATENCY.observe((time.perf_counter() - started_at) * 1000)
+        return cursor
+
+    @staticmethod
+    def _columns(cursor: sqlite3.Cursor) -> Tuple[str, ...]:
+        return tuple(column[0] for column in cursor.description)
+
+    def fetch_all(self, query: str, params: Optional[Dict[str, Any]] = None, mappings: bool = True) -> List[Any]:
+        cursor = self._execute(query, params)
+        rows = cursor.fetchall()
+        if cursor.description is None:
+            return []
+        columns = self._columns(cursor)
+        if mappings:
+            return [dict(zip(columns, row)) for row in rows]
+        row_type = _row_type(columns)
+        return [row_type._make(row) for row in rows]
+
+    def fetch_one(self, query: str, params: Optional[Dict[str, Any]] = None, mappings: bool = True) -> Optional[Any]:
+        cursor = self._execute(query, params)
+        row = cursor.fetchone()
+        columns = self._columns(cursor) if cursor.description is not None else ()
+        cursor.close()
+        if row is None:
+            return None
+        return dict(zip(columns, row)) if mappings else _row_type(columns)._make(row)
+
+    def close(self):
+        """Đóng mọi kết nối (khi không còn thread nào dùng, ví dụ thế hệ dữ liệu đã được giải phóng)."""
+        with self._lock:
+            self._closed = True
+            connections, self._connections = list(self._connections.values()), {}
+        for conn in connections:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "immutable": self.immutable,
+                "connections_open": len(self._connections),
+                "connections_opened_total": self._opened_total,
+                "queries": self._queries,
+                "errors": self._errors,
+            }
@@ -0,0 +1,336 @@
+# app/database/vector_store.py
+
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Literal, Optional, Type
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.database.index_bundle import BundleError, IndexBundle, bundle_root, load_current_bundle
+
+logger = logging.getLogger(__name__)
+
+
+# --- Metadata có kiểu cho từng collection ---
+class LoanDauMetadata(BaseModel):
+    """Một Sát Khí hoặc Thế Đất Cát Tường trong collection 'loandau'."""
+    type: Literal["sat_khi", "the_dat"]
+    name: str
+
+
+class ItemMetadata(BaseModel):
+    """Một vật phẩm phong thủy trong collection 'item'."""
+    name: str
+
+
+class CollectionSpec(BaseModel):
+    """Khai báo một collection: tên bundle (xem app/database/index_bundle.py) và kiểu metadata."""
+    name: str
+    metadata_model: Type[BaseModel]
+    build_script: str
+    embeddings_file: str  # Cache vector theo hash nội dung, dùng cho build tăng dần (app/database/embedding_builder.py)
+
+
+# Thêm một lĩnh vực mới chỉ cần khai báo thêm một CollectionSpec ở đây
+COLLECTION_SPECS: Dict[str, CollectionSpec] = {
+    "loandau": CollectionSpec(
+        name="loandau",
+        metadata_model=LoanDauMetadata,
+        build_script="scripts/create_embeddings.py",
+        embeddings_file="loandau_embeddings.npz",
+    ),
+    "item": CollectionSpec(
+        name="item",
+        metadata_model=ItemMetadata,
+        build_script="scripts/create_item_embeddings.py",
+        embeddings_file="item_embeddings.npz",
+    ),
+}
+
+# --- Các loại index FAISS (chọn lúc build) ---
+# - "flat": IndexFlatIP, tìm kiếm vét cạn, kết quả chính xác; đủ nhanh cho catalog vài nghìn dòng (mặc định).
+# - "hnsw": đồ thị HNSW, thời gian tìm kiếm ~log(n), tốn thêm bộ nhớ cho các cạnh của đồ thị.
+# - "ivfpq": phân cụm IVF + nén Product Quantization, tốn ít bộ nhớ nhất nhưng cần train và điểm số là xấp xỉ.
+# Mọi loại đều dùng inner product trên vector đã chuẩn hóa L2 (= cosine similarity).
+INDEX_MODES = ("flat", "hnsw", "ivfpq")
+MIN_PQ_NBITS = 4  # Codebook PQ nhỏ nhất: 2**4 = 16 centroid cho mỗi sub-quantizer
+
+
+class IndexBuildParams(BaseModel):
+    """Tham số build index. Các script build đọc từ biến môi trường VECTOR_INDEX_* (xem from_env)."""
+    mode: Literal["flat", "hnsw", "ivfpq"] = "flat"
+    hnsw_m: int = 32  # Số cạnh mỗi nút của đồ thị HNSW
+    hnsw_ef_construction: int = 200
+    ivf_nlist: Optional[int] = None  # Số cụm IVF; None: tự chọn theo số vector
+    pq_m: Optional[int] = None  # Số sub-quantizer PQ, phải chia hết số chiều; None: mỗi sub-vector 16 chiều
+    pq_nbits: int = 8
+
+    @classmethod
+    def from_env(cls, prefix: str = "VECTOR_INDEX_") -> "IndexBuildParams":
+        values = {}
+        for field in cls.model_fields:
+            raw_value = os.getenv(f"{prefix}{field.upper()}")
+            if raw_value:
+                values[field] = raw_value
+        return cls.model_validate(values)
+
+
+class IndexSearchParams(BaseModel):
+    """Tham số tìm kiếm lúc query của các index xấp xỉ; index "flat" bỏ qua."""
+    ef_search: int = 64  # HNSW: độ rộng danh sách ứng viên khi duyệt đồ thị
+    nprobe: int = 16  # IVF: số cụm được quét cho mỗi query
+
+
+def build_index(embeddings: np.ndarray, params: Optional[IndexBuildParams] = None,
+                ids: Optional[np.ndarray] = None) -> Any:
+    """
+    Xây dựng index FAISS từ ma trận embedding (n, dim) đã chuẩn hóa L2.
+    Với "ivfpq", số cụm và số bit PQ được giảm tự động khi corpus quá nhỏ để train; corpus ít hơn
+    2**MIN_PQ_NBITS vectors (không đủ điểm train cho codebook PQ nhỏ nhất) dùng index "flat".
+    Nếu có ids, index được bọc trong IndexIDMap2: kết quả tìm kiếm trả về id ổn định của từng dòng,
+    và có thể xóa/thay vector theo id mà không phải build lại (trừ HNSW).
+    """
+    import faiss
+
+    params = params or IndexBuildParams()
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n_vectors, dimension = embeddings.shape
+    mode = params.mode
+    if mode == "ivfpq" and n_vectors < 2 ** MIN_PQ_NBITS:
+        logger.warning(f"Corpus chỉ có {n_vectors} vectors, quá ít để train IVF-PQ; dùng index flat.")
+        mode = "flat"
+
+    if mode == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif mode == "hnsw":
+        index = faiss.index_factory(dimension, f"HNSW{params.hnsw_m},Flat", faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params.hnsw_ef_construction
+    else:
+        # faiss cần ít nhất ~39 điểm train cho mỗi centroid (của IVF và của mỗi sub-quantizer PQ)
+        nlist = params.ivf_nlist or int(4 * np.sqrt(n_vectors))
+        nlist = max(1, min(nlist, n_vectors // 39))
+        pq_m = params.pq_m or max(1, dimension // 16)
+        if dimension % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} phải chia hết số chiều {dimension}.")
+        pq_nbits = min(params.pq_nbits, int(np.log2(max(n_vectors // 39, 2 ** MIN_PQ_NBITS))))
+        if pq_nbits < params.pq_nbits:
+            logger.warning(f"Corpus chỉ có {n_vectors} vectors, giảm số bit PQ từ {params.pq_nbits} xuống {pq_nbits}.")
+        index = faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}x{pq_nbits}", faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+
+    if ids is None:
+        index.add(embeddings)
+        return index
+    id_mapped_index = faiss.IndexIDMap2(index)
+    id_mapped_index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+    return id_mapped_index
+
+
+def index_ids(index: Any) -> np.ndarray:
+    """Id của các vector theo thứ tự lưu trong index (0..n-1 nếu index không dùng IndexIDMap)."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+
+def index_mode(index: Any) -> str:
+    """Loại của một index FAISS đã nạp: "flat", "hnsw" hoặc "ivfpq"."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivfpq"
+    return "flat"
+
+
+def index_memory_bytes(index: Any) -> int:
+    """Kích thước (byte) của index khi serialize, xấp xỉ bộ nhớ index chiếm khi nạp."""
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def search_parameters(index: Any, k: int, search_params: IndexSearchParams, selector: Any = None) -> Any:
+    """SearchParameters của FAISS phù hợp với loại index, kèm bộ lọc id (selector) nếu có."""
+    import faiss
+
+    kwargs = {"sel": selector} if selector is not None else {}
+    mode = index_mode(index)
+    if mode == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=max(search_params.ef_search, k), **kwargs)
+    if mode == "ivfpq":
+        return faiss.SearchParametersIVF(nprobe=search_params.nprobe, **kwargs)
+    return faiss.SearchParameters(**kwargs) if kwargs else None
+
+
+# Bộ lọc: {tên trường: giá trị} hoặc {tên trường: [các giá trị chấp nhận]}, các trường kết hợp theo AND
+Filters = Dict[str, Any]
+
+
+class VectorCollection:
+    """
+    Một collection trong vector store: chỉ mục FAISS (cosine similarity qua inner product trên vector
+    đã chuẩn hóa) cùng metadata dạng cột (memory-mapped), theo đúng thứ tự lưu trong index.
+    FAISS trả về id của dòng (IndexIDMap2 khi build tăng dần), được ánh xạ ngược về vị trí metadata;
+    metadata của mỗi kết quả được kiểm tra kiểu bằng spec.metadata_model.
+    """
+
+    def __init__(self, spec: CollectionSpec, bundle: IndexBundle, search_params: Optional[IndexSearchParams] = None):
+        self.spec = spec
+        self.bundle = bundle
+        self.index = bundle.index
+        self.columns = bundle.columns
+        self.ids = bundle.ids
+        self.version = bundle.manifest.version
+        self.search_params = search_params or IndexSearchParams()
+        self.mode = index_mode(self.index)
+        self._row_by_id = {int(row_id): position for position, row_id in enumerate(self.ids)}
+
+        # Chỉ mục ngược trường -> giá trị -> các id, dùng để lọc ngay trong lúc tìm kiếm FAISS
+        self._field_ids: Dict[str, Dict[Any, np.ndarray]] = {}
+        for field, values in self.columns.items():
+            unique_values, inverse = np.unique(values, return_inverse=True)
+            self._field_ids[field] = {
+                value.item(): np.asarray(self.ids[inverse == i], dtype=np.int64)
+                for i, value in enumerate(unique_values)
+            }
+
+    @property
+    def name(self) -> str:
+        return self.spec.name
+
+    @property
+    def dimension(self) -> int:
+        return self.index.d
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, position: int) -> Dict[str, Any]:
+        """Metadata (đã kiểm tra kiểu) của dòng ở vị trí position."""
+        raw_row = {field: values[position].item() for field, values in self.columns.items()}
+        return self.spec.metadata_model.model_validate(raw_row).model_dump()
+
+    def _filter_ids(self, filters: Optional[Filters]) -> Optional[np.ndarray]:
+        """Tập id thỏa mãn bộ lọc, hoặc None nếu không lọc."""
+        if not filters:
+            return None
+        selected: Optional[np.ndarray] = None
+        for field, accepted in filters.items():
+            if field not in self._field_ids:
+                raise ValueError(f"Collection '{self.name}' không có trường '{field}' để lọc.")
+            values: Iterable[Any] = accepted if isinstance(accepted, (list, tuple, set, frozenset)) else [accepted]
+            groups = [self._field_ids[field].get(value) for value in values]
+            ids = np.unique(np.concatenate([g for g in groups if g is not None] or [np.empty(0, dtype=np.int64)]))
+            selected = ids if selected is None else np.intersect1d(selected, ids)
+        return selected
+
+    def search(self, query_vectors: np.ndarray, k: int, similarity_threshold: Optional[float] = None,
+               filters: Optional[Filters] = None,
+               search_params: Optional[IndexSearchParams] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Tìm kiếm theo lô: mỗi dòng của query_vectors (n, dim, đã chuẩn hóa L2) cho ra một danh sách kết quả.
+        Bộ lọc được áp dụng bên trong FAISS (IDSelector), nên luôn trả về đủ k kết quả hợp lệ nếu có.
+        search_params ghi đè tham số tìm kiếm mặc định của collection (efSearch/nprobe) cho riêng lần gọi này.
+
+        Returns:
+            Với mỗi query: danh sách dict metadata kèm 'similarity_score', giảm dần theo độ tương đồng.
+        """
+        import faiss
+
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+        n_queries = query_vectors.shape[0]
+
+        candidate_ids = self._filter_ids(filters)
+        selector = None
+        candidate_count = self.index.ntotal
+        if candidate_ids is not None:
+            candidate_count = len(candidate_ids)
+            selector = faiss.IDSelectorBatch(candidate_ids)
+
+        k = min(k, candidate_count)
+        if k <= 0:
+            return [[] for _ in range(n_queries)]
+
+        params = search_parameters(self.index, k, search_params or self.search_params, selector)
+        similarity_scores, indices = self.index.search(query_vectors, k, params=params)
+
+        results: List[List[Dict[str, Any]]] = []
+        for scores_row, ids_row in zip(similarity_scores, indices):
+            hits = []
+            for similarity, row_id in zip(scores_row, ids_row):
+                if row_id < 0:
+                    continue  # FAISS trả -1 khi không đủ k kết quả
+                if similarity_threshold is not None and similarity < similarity_threshold:
+                    continue
+                hit = self.row(self._row_by_id[int(row_id)])
+                hit['similarity_score'] = float(similarity)
+                hits.append(hit)
+            results.append(hits)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        manifest = self.bundle.manifest
+        return {"rows": len(self), "dimension": self.dimension, "mode": self.mode, "version": self.version,
+                "model": manifest.model, "content_hash": manifest.content_hash[:12]}
+
+
+class VectorStore:
+    """Tập các VectorCollection được đặt tên, nạp từ các bundle trong data_dir/vector_store."""
+
+    def __init__(self, collections: Dict[str, VectorCollection]):
+        self.collections = collections
+
+    @staticmethod
+    def load_collection(spec: CollectionSpec, data_dir: str, expected_model: Optional[str] = None,
+                        search_params: Optional[IndexSearchParams] = None) -> VectorCollection:
+        bundle = load_current_bundle(bundle_root(data_dir), spec.name, expected_model=expected_model,
+                                     expected_columns=list(spec.metadata_model.model_fields))
+        return VectorCollection(spec, bundle, search_params=search_params)
+
+    @classmethod
+    def load(cls, data_dir: str, specs: Optional[Dict[str, CollectionSpec]] = None,
+             expected_model: Optional[str] = None,
+             search_params: Optional[IndexSearchParams] = None) -> "VectorStore":
+        """
+        Nạp phiên bản hiện tại của mọi collection. Collection chưa có bundle, hoặc có bundle không khớp
+        (sai mô hình, index/metadata lệch nhau) bị bỏ qua kèm log, không bao giờ được dùng để tìm kiếm.
+        """
+        collections: Dict[str, VectorCollection] = {}
+        for name, spec in (specs or COLLECTION_SPECS).items():
+            try:
+                collections[name] = cls.load_collection(spec, data_dir, expected_model=expected_model,
+                                                        search_params=search_params)
+                logger.info(f"Đã nạp collection '{name}' ({len(collections[name])} vectors, "
+                            f"index {collections[name].mode}, phiên bản {collections[name].version}).")
+            except FileNotFoundError:
+                logger.warning(f"Không tìm thấy bundle cho collection '{name}'. "
+                               f"Vui lòng chạy script '{spec.build_script}' trước.")
+            except BundleError as e:
+                logger.error(f"Từ chối bundle của collection '{name}': {e}")
+            except Exception as e:
+                logger.error(f"Lỗi khi nạp collection '{name}': {e}")
+        return cls(collections)
+
+    def collection(self, name: str) -> Optional[VectorCollection]:
+        return self.collections.get(name)
+
+    def search(self, name: str, query_vectors: np.ndarray, k: int, similarity_threshold: Optional[float] = None,
+               filters: Optional[Filters] = None,
+               search_params: Optional[IndexSearchParams] = None) -> List[List[Dict[str, Any]]]:
+        collection = self.collections.get(name)
+        if collection is None:
+            raise KeyError(f"Collection '{name}' chưa được nạp vào vector store.")
+        return collection.search(query_vectors, k, similarity_threshold=similarity_threshold, filters=filters,
+                                 search_params=search_params)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: collection.stats() for name, collection in self.collections.items()}
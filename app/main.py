@@ -1,19 +1,29 @@
 # app/main.py
 
+import asyncio
+import json
 import logging
-from fastapi import FastAPI, HTTPException
+import secrets
+from fastapi import Depends, FastAPI, Header, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import uuid
 
 # Import các module đã tạo
 from app.core.config import settings
 from app.database.connection import test_connection
-from app.services.intent_analyzer import analyze_intent, IntentResult, ExtractedEntities
+from app.database.generations import GenerationError, ReloadInProgress, generation_manager, watch_data_files
+from app.services.intent_analyzer import analyze_intent, IntentResult, ExtractedEntities, RULE_FAST_PATH_STATS
 from app.orchestrator.workflow_manager import run_workflow, preprocess_entities
-from app.services.response_synthesizer import synthesize_response
+from app.services.response_synthesizer import synthesize_response, stream_response
+from app.services import llm_client
+from app.core.executors import shutdown_executors
+from app.core.cache import cache_stats
+from app.core.metrics import histogram_stats
+from app.tools import semantic_search_tools
 from app.services.context_manager import ToolCallRecord, ChatContext
-from fastapi.responses import RedirectResponse
+from app.services.session_store import create_session_store
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 
 # --- Cấu hình Logging ---
 logging.basicConfig(level=logging.INFO)
@@ -39,8 +49,8 @@ app = FastAPI(
     description=description_md,
 )
 
-# Key: session_id (str), Value: ChatContext object
-CONTEXT_STORE: Dict[str, ChatContext] = {}
+# Nơi lưu ChatContext theo session_id (LRU + TTL, backend cấu hình qua SESSION_BACKEND)
+CONTEXT_STORE = create_session_store()
 
 # --- Định nghĩa model cho request body ---
 class ChatRequest(BaseModel):
@@ -62,10 +72,30 @@ class SessionResponse(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     logger.info("--- Ứng dụng Chatbot Phong Thủy đang khởi động ---")
+    # Nạp mô hình embedding và các index FAISS ở nền; server nhận request ngay,
+    # chỉ các request cần semantic search mới phải chờ (xem /health/ready).
+    # Thế hệ dữ liệu đầu tiên (các bảng tri thức tĩnh trong bộ nhớ, tra cứu O(1)) được nạp sẵn trong lúc đó.
+    await asyncio.to_thread(semantic_search_tools.start_background_loading)
     if not test_connection():
         logger.error("!!! CẢNH BÁO: Không thể kết nối đến CSDL. Các chức năng sẽ không hoạt động.")
     else:
         logger.info(">>> Kết nối CSDL đã sẵn sàng.")
+        knowledge_base = generation_manager.current().knowledge_base
+        logger.info(f">>> Knowledge base đã sẵn sàng: {knowledge_base.stats()}")
+    if settings.DATA_WATCH_ENABLED:
+        app.state.data_watcher = asyncio.create_task(watch_data_files(
+            generation_manager, settings.DATA_WATCH_INTERVAL_SECONDS, rebuild_on_raw_change=settings.DATA_WATCH_REBUILD))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    data_watcher = getattr(app.state, "data_watcher", None)
+    if data_watcher is not None:
+        data_watcher.cancel()
+    # Đóng connection pool HTTP của LLM client dùng chung
+    await llm_client.aclose()
+    if semantic_search_tools.encoder_resource.is_ready():
+        await semantic_search_tools.encoder_resource.get().aclose()
+    shutdown_executors()
 
 @app.get("/", include_in_schema=False)
 async def root():
@@ -74,15 +104,132 @@ async def root():
     """
     return RedirectResponse(url="/docs")
 
+@app.get("/health/ready", tags=["General"])
+async def health_ready():
+    """
+    Trạng thái sẵn sàng: 200 khi mô hình embedding và các index FAISS đã nạp xong, ngược lại 503.
+    Các intent không cần semantic search (chào hỏi, tra cứu năm sinh...) vẫn được phục vụ khi chưa sẵn sàng.
+    """
+    resources = semantic_search_tools.readiness()
+    ready = all(status["state"] == "ready" for status in resources.values())
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "ready": ready, "resources": resources, "data_version": generation_manager.current().version})
+
 @app.post("/session", tags=["General"])
 async def create_session():
     """Tạo một session_id duy nhất cho một cuộc trò chuyện mới."""
     session_id = str(uuid.uuid4())
     # Khởi tạo một context rỗng cho session mới
-    CONTEXT_STORE[session_id] = ChatContext()
+    await CONTEXT_STORE.set(session_id, ChatContext())
     logger.info(f"Đã tạo session mới: {session_id}")
     return {"session_id": session_id}
 
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Kiểm tra header 'X-Admin-Token'. Chưa cấu hình ADMIN_TOKEN thì các route /admin bị tắt."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Các route /admin bị tắt; đặt ADMIN_TOKEN để bật.")
+    if not secrets.compare_digest(x_admin_token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Thiếu hoặc sai X-Admin-Token.")
+
+@app.post("/admin/reload", tags=["Admin"], dependencies=[Depends(require_admin_token)])
+async def reload_data(rebuild: bool = False, force: bool = False):
+    """
+    Nạp lại dữ liệu (SQLite, knowledge base, vector store) mà không cần khởi động lại server.
+    Thế hệ dữ liệu mới được dựng và kiểm tra song song; request đang chạy hoàn tất trên thế hệ cũ.
+
+    - `rebuild=true`: chạy lại 'scripts/preprocess_data.py' và các script tạo embedding từ data/raw trước
+      (chỉ khi ADMIN_RELOAD_REBUILD_ENABLED=true).
+    - `force=true`: nạp lại kể cả khi dữ liệu đã công bố không thay đổi.
+    """
+    if rebuild and not settings.ADMIN_RELOAD_REBUILD_ENABLED:
+        raise HTTPException(status_code=403, detail="rebuild=true bị tắt; đặt ADMIN_RELOAD_REBUILD_ENABLED=true để bật.")
+    try:
+        return await asyncio.to_thread(generation_manager.reload, rebuild=rebuild, force=force)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except GenerationError as e:
+        logger.error(f"Nạp lại dữ liệu thất bại, giữ thế hệ {generation_manager.current().version}: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/metrics", tags=["Admin"])
+async def metrics():
+    """Các chỉ số vận hành: hit/miss của các cache, bộ phân loại nhanh, histogram (gom lô embedding...), session store và thế hệ dữ liệu."""
+    return {
+        "caches": cache_stats(),
+        "histograms": histogram_stats(),
+        "intent_rules": dict(RULE_FAST_PATH_STATS),
+        "sessions": await CONTEXT_STORE.stats(),
+        "data_generations": generation_manager.stats(),
+    }
+
+async def run_chat_pipeline(session_id: str, query: str) -> ChatContext:
+    """
+    Giai đoạn 0-2 của một lượt chat (dùng chung cho /chat và /chat/stream):
+    hợp nhất ngữ cảnh, tiền xử lý entities và chạy workflow. Trả về context đã được làm giàu.
+    Mọi tra cứu trong lượt chat dùng cùng một thế hệ dữ liệu, kể cả khi dữ liệu được nạp lại giữa chừng.
+    """
+    with generation_manager.use():
+        return await _run_chat_stages(session_id, query)
+
+
+async def _run_chat_stages(session_id: str, query: str) -> ChatContext:
+    # --- Giai đoạn 0: Lấy và Hợp nhất Ngữ cảnh (LOGIC MỚI) ---
+    previous_context = await CONTEXT_STORE.get(session_id) or ChatContext()
+    current_intent_result = await analyze_intent(query)
+
+    final_intent_name = current_intent_result.intent
+    base_entities = ExtractedEntities()  # Tạo một entities rỗng
+
+    # Quyết định xem nên giữ lại ngữ cảnh cũ hay bắt đầu mới
+    is_continuing_conversation = (
+            previous_context.missing_info and
+            previous_context.intent_name not in ["UNKNOWN", "GREETING", None]
+    )
+
+    if is_continuing_conversation:
+        # --- TRƯỜNG HỢP 1: Đang trả lời câu hỏi của chatbot ---
+        logger.info("Phát hiện đang tiếp tục cuộc trò chuyện.")
+        # Giữ lại intent của luồng cũ
+        final_intent_name = previous_context.intent_name
+        # Lấy entities từ luồng cũ làm nền
+        base_entities = previous_context.initial_entities
+    else:
+        # --- TRƯỜNG HỢP 2: Bắt đầu một chủ đề mới ---
+        logger.info("Bắt đầu một chủ đề trò chuyện mới.")
+        # Intent sẽ là intent của câu nói hiện tại
+        # base_entities là rỗng, bắt đầu lại từ đầu
+        pass
+
+    # Hợp nhất: Lấy base_entities và cập nhật bằng thông tin mới
+    merged_entities = base_entities.model_copy(
+        update=current_intent_result.entities.model_dump(exclude_unset=True, exclude_none=True)
+    )
+
+    final_intent_result = IntentResult(intent=final_intent_name, entities=merged_entities)
+
+    logger.info(f"Intent cuối cùng được chọn: '{final_intent_result.intent}'")
+    logger.info(f"Entities sau khi hợp nhất: {merged_entities.model_dump_json(indent=2)}")
+
+    # --- Giai đoạn 1: Tiền xử lý entities ---
+    final_intent_result.entities = await preprocess_entities(final_intent_result.entities)
+
+    # --- Giai đoạn 2: Chạy workflow ---
+    final_context = await run_workflow(final_intent_result)
+    # Nếu workflow đã hoàn thành (không còn missing_info),
+    # chúng ta có thể cân nhắc xóa bớt entities để chuẩn bị cho lượt sau.
+    # Tuy nhiên, để đơn giản, cứ lưu lại toàn bộ.
+    final_context.initial_entities = final_intent_result.entities
+    return final_context
+
+
+def build_debug_info(context: ChatContext) -> DebugInfo:
+    return DebugInfo(
+        intent=context.intent_name,
+        entities=context.initial_entities.model_dump(exclude_unset=True, exclude_none=True),
+        tool_calls=context.tool_calls
+    )
+
+
 @app.post("/chat", response_model=ChatResponse, tags=["Chatbot"])
 @app.post("/chat", tags=["Chatbot"])
 async def handle_chat(request: ChatRequest):
@@ -93,75 +240,74 @@ async def handle_chat(request: ChatRequest):
         session_id = request.session_id
         logger.info(f"Nhận được query: '{request.query}' cho session_id: {session_id}")
 
-        # --- Giai đoạn 0: Lấy và Hợp nhất Ngữ cảnh (LOGIC MỚI) ---
-        previous_context = CONTEXT_STORE.get(session_id, ChatContext())
-        current_intent_result = await analyze_intent(request.query)
-
-        final_intent_name = current_intent_result.intent
-        base_entities = ExtractedEntities()  # Tạo một entities rỗng
-
-        # Quyết định xem nên giữ lại ngữ cảnh cũ hay bắt đầu mới
-        is_continuing_conversation = (
-                previous_context.missing_info and
-                previous_context.intent_name not in ["UNKNOWN", "GREETING", None]
-        )
-
-        if is_continuing_conversation:
-            # --- TRƯỜNG HỢP 1: Đang trả lời câu hỏi của chatbot ---
-            logger.info("Phát hiện đang tiếp tục cuộc trò chuyện.")
-            # Giữ lại intent của luồng cũ
-            final_intent_name = previous_context.intent_name
-            # Lấy entities từ luồng cũ làm nền
-            base_entities = previous_context.initial_entities
-        else:
-            # --- TRƯỜNG HỢP 2: Bắt đầu một chủ đề mới ---
-            logger.info("Bắt đầu một chủ đề trò chuyện mới.")
-            # Intent sẽ là intent của câu nói hiện tại
-            # base_entities là rỗng, bắt đầu lại từ đầu
-            pass
-
-        # Hợp nhất: Lấy base_entities và cập nhật bằng thông tin mới
-        merged_entities = base_entities.model_copy(
-            update=current_intent_result.entities.model_dump(exclude_unset=True, exclude_none=True)
-        )
-
-        final_intent_result = IntentResult(intent=final_intent_name, entities=merged_entities)
-
-        logger.info(f"Intent cuối cùng được chọn: '{final_intent_result.intent}'")
-        logger.info(f"Entities sau khi hợp nhất: {merged_entities.model_dump_json(indent=2)}")
-
-        # --- Giai đoạn 1: Tiền xử lý entities ---
-        from app.orchestrator.workflow_manager import preprocess_entities
-        final_intent_result.entities = await preprocess_entities(final_intent_result.entities)
-
-        # --- Giai đoạn 2: Chạy workflow ---
-        final_context = await run_workflow(final_intent_result)
+        # --- Giai đoạn 0-2: Hợp nhất ngữ cảnh, tiền xử lý, chạy workflow ---
+        final_context = await run_chat_pipeline(session_id, request.query)
 
         # --- Giai đoạn 3: Tổng hợp câu trả lời ---
         final_answer = await synthesize_response(final_context)
 
         # --- Giai đoạn 4: Lưu ngữ cảnh ---
-        # Nếu workflow đã hoàn thành (không còn missing_info),
-        # chúng ta có thể cân nhắc xóa bớt entities để chuẩn bị cho lượt sau.
-        # Tuy nhiên, để đơn giản, cứ lưu lại toàn bộ.
-        final_context.initial_entities = final_intent_result.entities
-        CONTEXT_STORE[session_id] = final_context
+        await CONTEXT_STORE.set(session_id, final_context)
         logger.info(f"Đã cập nhật context cho session_id: {session_id}")
 
-        debug_info = DebugInfo(
-            intent=final_context.intent_name,
-            entities=final_context.initial_entities.model_dump(exclude_unset=True, exclude_none=True),
-            tool_calls=final_context.tool_calls
-        )
-
-        return ChatResponse(answer=final_answer, debug_info=debug_info)
+        return ChatResponse(answer=final_answer, debug_info=build_debug_info(final_context))
 
     except Exception as e:
         logger.exception(f"Lỗi nghiêm trọng trong quá trình xử lý chat cho session {session_id}: {e}")
         # Xóa context bị lỗi để tránh ảnh hưởng đến các lần sau
-        if session_id in CONTEXT_STORE:
-            del CONTEXT_STORE[session_id]
+        await CONTEXT_STORE.delete(session_id)
+        raise HTTPException(status_code=500, detail="Đã có lỗi xảy ra ở máy chủ. Vui lòng tạo một session mới.")
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """Định dạng một sự kiện Server-Sent Events, data được mã hóa JSON trên một dòng."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream", tags=["Chatbot"])
+async def handle_chat_stream(request: ChatRequest):
+    """
+    Giống /chat nhưng trả về câu trả lời dưới dạng Server-Sent Events (text/event-stream):
+    - `debug_info`: gửi đầu tiên, ngay khi workflow chạy xong (intent, entities, tool_calls).
+    - `token`: từng đoạn văn bản của câu trả lời, `{"text": "..."}`.
+    - `done`: kết thúc, `{"answer": "<toàn bộ câu trả lời>"}`. Ngữ cảnh được lưu ngay trước sự kiện này.
+    - `error`: lỗi xảy ra giữa chừng, session bị xóa giống như /chat.
+    Câu trả lời có sẵn (direct_response, hỏi lại thông tin thiếu) được gửi ngay trong một sự kiện `token`.
+    """
+    session_id = request.session_id
+    logger.info(f"Nhận được query (stream): '{request.query}' cho session_id: {session_id}")
+    try:
+        # Giai đoạn 0-2 chạy trước khi mở stream để lỗi vẫn trả về HTTP 500 như /chat
+        final_context = await run_chat_pipeline(session_id, request.query)
+    except Exception as e:
+        logger.exception(f"Lỗi nghiêm trọng trong quá trình xử lý chat cho session {session_id}: {e}")
+        await CONTEXT_STORE.delete(session_id)
         raise HTTPException(status_code=500, detail="Đã có lỗi xảy ra ở máy chủ. Vui lòng tạo một session mới.")
 
+    async def event_stream():
+        yield _sse_event("debug_info", build_debug_info(final_context).model_dump(mode="json"))
+        answer_parts = []
+        try:
+            # --- Giai đoạn 3: Stream câu trả lời ---
+            async for text in stream_response(final_context):
+                answer_parts.append(text)
+                yield _sse_event("token", {"text": text})
+
+            # --- Giai đoạn 4: Lưu ngữ cảnh khi stream hoàn tất ---
+            await CONTEXT_STORE.set(session_id, final_context)
+            logger.info(f"Đã cập nhật context cho session_id: {session_id}")
+            yield _sse_event("done", {"answer": "".join(answer_parts)})
+        except Exception as e:
+            logger.exception(f"Lỗi khi stream câu trả lời cho session {session_id}: {e}")
+            await CONTEXT_STORE.delete(session_id)
+            yield _sse_event("error", {"detail": "Đã có lỗi xảy ra ở máy chủ. Vui lòng tạo một session mới."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Tắt buffer của reverse proxy (nginx) để token tới client ngay lập tức
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Để chạy ứng dụng, mở terminal và gõ lệnh:
 # uvicorn app.main:app --reload
\ No newline at end of file
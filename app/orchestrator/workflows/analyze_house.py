@@ -3,10 +3,10 @@
 import logging
 from datetime import datetime
 
-from app.orchestrator.workflows.base_workflow import BaseWorkflow
+from app.orchestrator.workflows.base_workflow import BaseWorkflow, ToolStep, params_if
 from app.services.context_manager import ChatContext
 # Import tất cả các tool cần thiết
-from app.tools import ngu_hanh_tools, bat_trach_tools, tuong_tac_tools, general_tools
+from app.tools import ngu_hanh_tools, bat_trach_tools, tuong_tac_tools, general_tools, precomputed_tools
 
 logger = logging.getLogger(__name__)
 
@@ -32,62 +32,66 @@ class AnalyzeHouseWorkflow(BaseWorkflow):
         nam_sinh = entities.nam_sinh_1
         gioi_tinh = entities.gioi_tinh_1
         huong_nha = entities.huong_nha
+        current_year = datetime.now().year
 
-        # --- Bước 2: Tra cứu thông tin bản mệnh của gia chủ ---
-        logger.info("Bước 2: Tra cứu thông tin bản mệnh")
-        cung_menh_info = await self._call_tool(
-            ngu_hanh_tools.get_cung_menh_by_year_gender,
-            nam_sinh=nam_sinh,
-            gioi_tinh=gioi_tinh
-        )
-        if not cung_menh_info:
-            logger.error("Không thể tìm thấy cung mệnh, dừng workflow.")
+        # --- Đường nhanh: kết quả đã được dựng sẵn cho (năm sinh, giới tính, hướng nhà) ---
+        answer = await self._call_tool(precomputed_tools.get_house_analysis, nam_sinh=nam_sinh,
+                                       gioi_tinh=gioi_tinh, huong_nha=huong_nha, nam=current_year)
+        if answer is not None:
+            self.context.update_context(answer)
+            logger.info("--- Hoàn thành Workflow: Phân tích nhà cửa (kết quả dựng sẵn) ---")
             return self.context
-        self.context.update_context({"cung_menh_info": cung_menh_info})
-
-        menh_ngu_hanh = cung_menh_info.get('hanhcungmenh')
-        if menh_ngu_hanh:
-            menh_info = await self._call_tool(ngu_hanh_tools.get_menh_info, menh=menh_ngu_hanh)
-            self.context.update_context({"menh_ngu_hanh_info": menh_info})
-
-        nap_am_info = await self._call_tool(ngu_hanh_tools.get_nap_am_info, nam_sinh=nam_sinh)
-        self.context.update_context({"nap_am_info": nap_am_info})
-
-        # --- Bước 3: Phân tích Bát Trạch ---
-        logger.info("Bước 3: Phân tích Bát Trạch")
-        cung_menh = cung_menh_info.get('cungmenh')
-        if cung_menh:
-            rule_info = await self._call_tool(
-                bat_trach_tools.get_bat_trach_info,
-                cung_menh=cung_menh,
-                huong_nha=huong_nha
-            )
-            self.context.update_context({"bat_trach_rule_info": rule_info})
 
-            if rule_info:
-                ten_cung_vi = rule_info.get('tencungvi_taothanh')
-                if ten_cung_vi:
-                    detail_info = await self._call_tool(
-                        bat_trach_tools.get_cung_vi_detail,
-                        ten_cung_vi=ten_cung_vi
-                    )
-                    self.context.update_context({"bat_trach_detail_info": detail_info})
-
-        # --- Bước 4: Phân tích tương tác Mệnh - Hướng ---
-        logger.info("Bước 4: Phân tích tương tác Mệnh - Hướng")
-        if menh_ngu_hanh:
-            interaction_info = await self._call_tool(
-                tuong_tac_tools.get_menh_huong_interaction,
-                menh_gia_chu=menh_ngu_hanh,
-                huong_nha=huong_nha
-            )
-            self.context.update_context({"menh_huong_interaction_info": interaction_info})
+        # --- Bước 2-5: Khai báo đồ thị phụ thuộc giữa các lần tra cứu ---
+        # Bản mệnh, Nạp Âm và Phi tinh độc lập với nhau nên chạy đồng thời;
+        # Bát Trạch và tương tác Mệnh - Hướng chỉ cần chờ kết quả Cung Mệnh.
+        logger.info("Bước 2-5: Tra cứu bản mệnh, Bát Trạch, tương tác Mệnh - Hướng và Phi tinh")
+        steps = {
+            # Bước 2: Thông tin bản mệnh của gia chủ
+            "cung_menh_info": ToolStep(
+                tool_func=ngu_hanh_tools.get_cung_menh_by_year_gender,
+                params={"nam_sinh": nam_sinh, "gioi_tinh": gioi_tinh},
+            ),
+            "menh_ngu_hanh_info": ToolStep(
+                tool_func=ngu_hanh_tools.get_menh_info,
+                depends_on=["cung_menh_info"],
+                params=lambda r: params_if(menh=r["cung_menh_info"].get('hanhcungmenh')),
+            ),
+            "nap_am_info": ToolStep(
+                tool_func=ngu_hanh_tools.get_nap_am_info,
+                params={"nam_sinh": nam_sinh},
+            ),
+            # Bước 3: Phân tích Bát Trạch
+            "bat_trach_rule_info": ToolStep(
+                tool_func=bat_trach_tools.get_bat_trach_info,
+                depends_on=["cung_menh_info"],
+                params=lambda r: params_if(cung_menh=r["cung_menh_info"].get('cungmenh'), huong_nha=huong_nha),
+            ),
+            "bat_trach_detail_info": ToolStep(
+                tool_func=bat_trach_tools.get_cung_vi_detail,
+                depends_on=["bat_trach_rule_info"],
+                params=lambda r: params_if(ten_cung_vi=r["bat_trach_rule_info"].get('tencungvi_taothanh')),
+            ),
+            # Bước 4: Phân tích tương tác Mệnh - Hướng
+            "menh_huong_interaction_info": ToolStep(
+                tool_func=tuong_tac_tools.get_menh_huong_interaction,
+                depends_on=["cung_menh_info"],
+                params=lambda r: params_if(menh_gia_chu=r["cung_menh_info"].get('hanhcungmenh'), huong_nha=huong_nha),
+            ),
+            # Bước 5: Phân tích Phi tinh năm hiện tại
+            "phi_tinh_info": ToolStep(
+                tool_func=general_tools.get_phi_tinh_info,
+                params={"nam": current_year},
+            ),
+        }
+        results = await self._run_tool_graph(steps)
+
+        if not results.get("cung_menh_info"):
+            logger.error("Không thể tìm thấy cung mệnh, dừng workflow.")
+            return self.context
 
-        # --- Bước 5: Phân tích Phi tinh năm hiện tại ---
-        logger.info("Bước 5: Phân tích Phi tinh")
-        current_year = datetime.now().year
-        phi_tinh_info = await self._call_tool(general_tools.get_phi_tinh_info, nam=current_year)
-        self.context.update_context({"phi_tinh_info": phi_tinh_info})
+        # Chỉ cập nhật các bước đã thực sự được gọi (giữ nguyên hành vi khi một nhánh bị bỏ qua)
+        self.context.update_context(results)
 
         logger.info("--- Hoàn thành Workflow: Phân tích nhà cửa ---")
         return self.context
\ No newline at end of file
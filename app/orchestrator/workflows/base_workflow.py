@@ -1,12 +1,38 @@
 # app/orchestrator/workflows/base_workflow.py
 
+import asyncio
+import inspect
+import time
 from abc import ABC, abstractmethod
+from pydantic import BaseModel, Field
+from app.core.executors import run_sync_tool
 from app.services.context_manager import ChatContext
 import logging
-from typing import Callable, Any, Dict
+from typing import Callable, Any, Dict, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+
+class ToolStep(BaseModel):
+    """
+    Một bước gọi tool trong đồ thị phụ thuộc của workflow.
+
+    - tool_func: tool cần gọi.
+    - params: dict tham số cố định, hoặc một hàm nhận kết quả của các bước phụ thuộc
+      và trả về dict tham số (trả về None để bỏ qua bước này).
+    - depends_on: tên các bước phải hoàn thành trước. Nếu một bước phụ thuộc
+      không có kết quả (None), bước hiện tại sẽ bị bỏ qua.
+    """
+    tool_func: Callable
+    params: Union[Dict[str, Any], Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = Field(default_factory=dict)
+    depends_on: List[str] = Field(default_factory=list)
+
+
+def params_if(**params) -> Optional[Dict[str, Any]]:
+    """Trả về params nếu tất cả giá trị đều có, ngược lại None để bỏ qua bước tương ứng trong đồ thị."""
+    return params if all(params.values()) else None
+
+
 class BaseWorkflow(ABC):
     """
     Lớp cơ sở trừu tượng cho tất cả các workflow.
@@ -15,22 +41,93 @@ class BaseWorkflow(ABC):
     def __init__(self, context: ChatContext):
         self.context = context
 
-    async def _call_tool(self, tool_func: Callable, **kwargs) -> Any:
+    async def _execute_tool(self, tool_func: Callable, **kwargs) -> Tuple[Any, Dict[str, Any]]:
         """
-        Hàm bọc (wrapper) để gọi một tool, tự động ghi lại lịch sử và xử lý lỗi.
+        Thực thi một tool và trả về (kết quả, thông tin bản ghi ToolCallRecord) mà chưa ghi vào context.
+        Tool đồng bộ được đẩy sang thread pool (xem app/core/executors.py) để không block event loop.
         """
         tool_name = tool_func.__name__
         logger.info(f"Workflow đang gọi tool: {tool_name} với params: {kwargs}")
 
+        queue_wait_ms = None
+        started_at = time.perf_counter()
         try:
-            result = tool_func(**kwargs)
+            if inspect.iscoroutinefunction(tool_func):
+                # Các tool bất đồng bộ (ví dụ: re-ranking bằng LLM) chạy trực tiếp trên event loop
+                result = await tool_func(**kwargs)
+                run_ms = (time.perf_counter() - started_at) * 1000
+            else:
+                result, queue_wait_ms, run_ms = await run_sync_tool(tool_func, **kwargs)
             status = "success" if result is not None else "failed (no data)"
-            self.context.add_tool_call(tool_name=tool_name, params=kwargs, status=status)
-            return result
         except Exception as e:
             logger.error(f"Lỗi khi thực thi tool '{tool_name}': {e}")
-            self.context.add_tool_call(tool_name=tool_name, params=kwargs, status="failed (exception)")
-            return None
+            result = None
+            status = "failed (exception)"
+            run_ms = (time.perf_counter() - started_at) * 1000
+
+        record = dict(tool_name=tool_name, params=kwargs, status=status,
+                      queue_wait_ms=queue_wait_ms, run_ms=run_ms)
+        return result, record
+
+    async def _call_tool(self, tool_func: Callable, **kwargs) -> Any:
+        """
+        Hàm bọc (wrapper) để gọi một tool, tự động ghi lại lịch sử và xử lý lỗi.
+        """
+        result, record = await self._execute_tool(tool_func, **kwargs)
+        self.context.add_tool_call(**record)
+        return result
+
+    async def _run_tool_graph(self, steps: Dict[str, ToolStep]) -> Dict[str, Any]:
+        """
+        Chạy một tập các bước gọi tool theo đồ thị phụ thuộc: các nhánh độc lập chạy đồng thời,
+        mỗi bước chỉ bắt đầu khi các bước nó phụ thuộc đã xong. Tổng thời gian chỉ còn bằng
+        chuỗi phụ thuộc dài nhất thay vì tổng của tất cả các tool.
+
+        Các bước phải được khai báo sau những bước mà chúng phụ thuộc (đảm bảo không có chu trình).
+        Các ToolCallRecord được ghi vào context theo đúng thứ tự khai báo, không phụ thuộc
+        vào thứ tự hoàn thành thực tế.
+
+        Returns:
+            Dict từ tên bước -> kết quả, chỉ gồm các bước đã thực sự được gọi.
+        """
+        declared = set()
+        for name, step in steps.items():
+            unknown = [dep for dep in step.depends_on if dep not in declared]
+            if unknown:
+                raise ValueError(f"Bước '{name}' phụ thuộc vào bước chưa được khai báo trước đó: {unknown}")
+            declared.add(name)
+
+        tasks: Dict[str, asyncio.Task] = {}
+        records: Dict[str, Dict[str, Any]] = {}
+
+        async def _run_step(name: str, step: ToolStep) -> Any:
+            dep_results = {}
+            if step.depends_on:
+                values = await asyncio.gather(*(tasks[dep] for dep in step.depends_on))
+                dep_results = dict(zip(step.depends_on, values))
+                if any(value is None for value in values):
+                    logger.info(f"Bỏ qua bước '{name}' do bước phụ thuộc không có kết quả.")
+                    return None
+
+            params = step.params(dep_results) if callable(step.params) else step.params
+            if params is None:
+                logger.info(f"Bỏ qua bước '{name}' do không đủ tham số.")
+                return None
+
+            result, records[name] = await self._execute_tool(step.tool_func, **params)
+            return result
+
+        for name, step in steps.items():
+            tasks[name] = asyncio.create_task(_run_step(name, step))
+
+        await asyncio.gather(*tasks.values())
+
+        # Ghi lịch sử theo thứ tự khai báo để debug_info ổn định giữa các lần chạy
+        for name in steps:
+            if name in records:
+                self.context.add_tool_call(**records[name])
+
+        return {name: tasks[name].result() for name in steps if name in records}
 
     @abstractmethod
     async def run(self):
@@ -39,4 +136,4 @@ class BaseWorkflow(ABC):
         Nó sẽ gọi các tool theo đúng thứ tự, cập nhật context,
         và cuối cùng trả về context đã được làm giàu thông tin.
         """
-        pass
\ No newline at end of file
+        pass
@@ -1,9 +1,9 @@
 # app/orchestrator/workflows/compare_people.py
 
 import logging
-from app.orchestrator.workflows.base_workflow import BaseWorkflow
+from app.orchestrator.workflows.base_workflow import BaseWorkflow, ToolStep, params_if
 from app.services.context_manager import ChatContext
-from app.tools import ngu_hanh_tools, tuong_tac_tools
+from app.tools import ngu_hanh_tools, tuong_tac_tools, precomputed_tools
 
 logger = logging.getLogger(__name__)
 
@@ -29,32 +29,45 @@ class ComparePeopleWorkflow(BaseWorkflow):
             logger.warning(f"Thiếu thông tin: {self.context.missing_info}")
             return self.context
 
-        # --- Bước 1: Tra cứu thông tin người thứ nhất ---
-        logger.info(f"Bước 1: Tra cứu người 1 (Năm sinh: {entities.nam_sinh_1})")
-        cung_menh_1 = await self._call_tool(ngu_hanh_tools.get_cung_menh_by_year_gender, nam_sinh=entities.nam_sinh_1,
-                                            gioi_tinh=entities.gioi_tinh_1)
-        nap_am_1 = await self._call_tool(ngu_hanh_tools.get_nap_am_info, nam_sinh=entities.nam_sinh_1)
-        self.context.update_context({"cung_menh_info": cung_menh_1, "nap_am_info": nap_am_1})
-
-        # --- Bước 2: Tra cứu thông tin người thứ hai ---
-        logger.info(f"Bước 2: Tra cứu người 2 (Năm sinh: {entities.nam_sinh_2})")
-        cung_menh_2 = await self._call_tool(ngu_hanh_tools.get_cung_menh_by_year_gender, nam_sinh=entities.nam_sinh_2,
-                                            gioi_tinh=entities.gioi_tinh_2)
-        nap_am_2 = await self._call_tool(ngu_hanh_tools.get_nap_am_info, nam_sinh=entities.nam_sinh_2)
-        self.context.update_context({
-            "cung_menh_info_2": cung_menh_2,
-            "nap_am_info_2": nap_am_2
-        })
-
-        # --- Bước 3: Tra cứu sự tương tác ---
-        if nap_am_1 and nap_am_2:
-            logger.info("Bước 3: Tra cứu sự tương tác")
-            nap_am_1_name = nap_am_1.get('tennapam')
-            nap_am_2_name = nap_am_2.get('tennapam')
-            if nap_am_1_name and nap_am_2_name:
-                interaction = await self._call_tool(tuong_tac_tools.get_menh_menh_interaction, nap_am1=nap_am_1_name,
-                                                    nap_am2=nap_am_2_name)
-                self.context.update_context({"menh_menh_interaction_info": interaction})
+        # --- Đường nhanh: bản mệnh hai người và ma trận cặp Nạp Âm đã được dựng sẵn ---
+        answer = await self._call_tool(precomputed_tools.get_people_comparison,
+                                       nam_sinh_1=entities.nam_sinh_1, gioi_tinh_1=entities.gioi_tinh_1,
+                                       nam_sinh_2=entities.nam_sinh_2, gioi_tinh_2=entities.gioi_tinh_2)
+        if answer is not None:
+            self.context.update_context(answer)
+            logger.info("--- Hoàn thành Workflow: So sánh hai người (kết quả dựng sẵn) ---")
+            return self.context
+
+        # --- Bước 1 & 2: Tra cứu thông tin hai người (chạy đồng thời) ---
+        # --- Bước 3: Tra cứu sự tương tác (chờ Nạp Âm của cả hai người) ---
+        logger.info(f"Bước 1-2: Tra cứu người 1 (Năm sinh: {entities.nam_sinh_1}) "
+                    f"và người 2 (Năm sinh: {entities.nam_sinh_2})")
+        steps = {
+            "cung_menh_info": ToolStep(
+                tool_func=ngu_hanh_tools.get_cung_menh_by_year_gender,
+                params={"nam_sinh": entities.nam_sinh_1, "gioi_tinh": entities.gioi_tinh_1},
+            ),
+            "nap_am_info": ToolStep(
+                tool_func=ngu_hanh_tools.get_nap_am_info,
+                params={"nam_sinh": entities.nam_sinh_1},
+            ),
+            "cung_menh_info_2": ToolStep(
+                tool_func=ngu_hanh_tools.get_cung_menh_by_year_gender,
+                params={"nam_sinh": entities.nam_sinh_2, "gioi_tinh": entities.gioi_tinh_2},
+            ),
+            "nap_am_info_2": ToolStep(
+                tool_func=ngu_hanh_tools.get_nap_am_info,
+                params={"nam_sinh": entities.nam_sinh_2},
+            ),
+            "menh_menh_interaction_info": ToolStep(
+                tool_func=tuong_tac_tools.get_menh_menh_interaction,
+                depends_on=["nap_am_info", "nap_am_info_2"],
+                params=lambda r: params_if(nap_am1=r["nap_am_info"].get('tennapam'),
+                                           nap_am2=r["nap_am_info_2"].get('tennapam')),
+            ),
+        }
+        results = await self._run_tool_graph(steps)
+        self.context.update_context(results)
 
         logger.info("--- Hoàn thành Workflow: So sánh hai người ---")
         return self.context
\ No newline at end of file
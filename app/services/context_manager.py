@@ -1,6 +1,7 @@
 # app/services/context_manager.py
 
 from typing import Dict, Any, Optional, List # Thêm List
+import ormsgpack
 from pydantic import BaseModel, Field
 
 # Import model entities để tái sử dụng
@@ -12,8 +13,40 @@ class ToolCallRecord(BaseModel):
     tool_name: str
     params: Dict[str, Any]
     status: str # "success" hoặc "failed"
+    queue_wait_ms: Optional[float] = None  # Thời gian chờ trong hàng đợi thread pool
+    run_ms: Optional[float] = None  # Thời gian thực thi thực tế của tool
     # result: Optional[Dict[str, Any]] = None # Bỏ đi để response đỡ cồng kềnh
 
+class SessionSnapshot(BaseModel):
+    """
+    Bản chụp gọn của một phiên hội thoại, chỉ giữ trạng thái cần cho lượt chat kế tiếp
+    (intent, entities, thông tin còn thiếu) và một lịch sử gọi tool có giới hạn.
+    Dữ liệu tra cứu từ CSDL (cung_menh_info, nap_am_info, lookup_result, ...) không được lưu
+    vì mỗi lượt đều tra cứu lại.
+    """
+    intent_name: Optional[str] = None
+    initial_entities: ExtractedEntities = Field(default_factory=ExtractedEntities)
+    missing_info: Optional[str] = None
+    tool_calls: List[ToolCallRecord] = Field(default_factory=list)
+
+    def to_bytes(self) -> bytes:
+        """Serialize sang MessagePack (nhị phân, nhỏ và nhanh hơn JSON), bỏ các trường None."""
+        return ormsgpack.packb(self.model_dump(exclude_none=True))
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "SessionSnapshot":
+        return cls.model_validate(ormsgpack.unpackb(payload))
+
+    def to_context(self) -> "ChatContext":
+        """Khôi phục một ChatContext từ bản chụp (các trường dữ liệu tra cứu để trống)."""
+        return ChatContext(
+            intent_name=self.intent_name,
+            initial_entities=self.initial_entities,
+            missing_info=self.missing_info,
+            tool_calls=self.tool_calls,
+        )
+
+
 class ChatContext(BaseModel):
     """
     Lớp quản lý và lưu trữ toàn bộ thông tin thu thập được trong một phiên hội thoại.
@@ -71,7 +104,18 @@ class ChatContext(BaseModel):
         self.missing_info = None
         return True
 
-    def add_tool_call(self, tool_name: str, params: Dict[str, Any], status: str):
+    def to_snapshot(self, max_tool_calls: int = 10) -> SessionSnapshot:
+        """Tạo bản chụp gọn để lưu session, chỉ giữ max_tool_calls lần gọi tool gần nhất."""
+        return SessionSnapshot(
+            intent_name=self.intent_name,
+            initial_entities=self.initial_entities,
+            missing_info=self.missing_info,
+            tool_calls=self.tool_calls[-max_tool_calls:] if max_tool_calls > 0 else [],
+        )
+
+    def add_tool_call(self, tool_name: str, params: Dict[str, Any], status: str,
+                      queue_wait_ms: Optional[float] = None, run_ms: Optional[float] = None):
         """Thêm một bản ghi về việc gọi tool vào lịch sử."""
-        record = ToolCallRecord(tool_name=tool_name, params=params, status=status)
+        record = ToolCallRecord(tool_name=tool_name, params=params, status=status,
+                                queue_wait_ms=queue_wait_ms, run_ms=run_ms)
         self.tool_calls.append(record)
\ No newline at end of file
@@ -0,0 +1,117 @@
+# app/services/embedding_service.py
+
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import Histogram, LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingService:
+    """
+    Dịch vụ tạo embedding theo lô nhỏ (micro-batching) trong process.
+
+    Mỗi lời gọi encode(text) được đưa vào một hàng đợi; một task nền gom các yêu cầu đến
+    trong khoảng max_wait_ms (hoặc đến khi đủ max_batch_size) rồi gọi model.encode một lần
+    cho cả lô trong thread pool, sau đó trả từng vector về đúng caller đang chờ.
+    SentenceTransformer trên CPU xử lý một lô nhanh hơn nhiều so với từng câu riêng lẻ.
+    """
+
+    def __init__(self, model: Any, executor: Executor, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, normalize: bool = True):
+        self.model = model
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.normalize = normalize
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.batch_size_histogram = Histogram("embedding_batch_size", _BATCH_SIZE_BUCKETS)
+        self.encode_latency_histogram = Histogram("embedding_batch_encode_ms", LATENCY_BUCKETS_MS)
+        self.request_latency_histogram = Histogram("embedding_request_ms", LATENCY_BUCKETS_MS)
+
+    def _ensure_worker(self):
+        # Hàng đợi và task nền gắn với event loop đang chạy (tạo lại nếu loop thay đổi)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Gọi model.encode đồng bộ cho cả lô (chạy trong thread pool). Trả về ma trận float32 (n, dim)."""
+        vectors = self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Tạo embedding (vector 1 chiều, đã chuẩn hóa L2 nếu normalize=True) cho một câu."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # Bỏ các yêu cầu mà caller đã hủy trong lúc chờ
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            texts = [text for text, _, _ in batch]
+            started_at = time.perf_counter()
+            try:
+                vectors = await self._loop.run_in_executor(self.executor, self.encode_batch, texts)
+            except Exception as e:
+                logger.error(f"Lỗi khi tạo embedding cho lô {len(texts)} câu: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            finished_at = time.perf_counter()
+            self.batch_size_histogram.observe(len(texts))
+            self.encode_latency_histogram.observe((finished_at - started_at) * 1000)
+            for (_, future, enqueued_at), vector in zip(batch, vectors):
+                self.request_latency_histogram.observe((finished_at - enqueued_at) * 1000)
+                if not future.done():
+                    future.set_result(vector)
+
+    async def aclose(self):
+        """Dừng task nền (gọi khi ứng dụng tắt)."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
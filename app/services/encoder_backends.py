@@ -0,0 +1,108 @@
+# app/services/encoder_backends.py
+
+import importlib.util
+import logging
+import os
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Module này không import app.core.config để các script trong scripts/ dùng được mà không cần file .env
+MODEL_NAME = 'bkai-foundation-models/vietnamese-bi-encoder'
+
+# Các backend suy luận trên CPU cho bi-encoder:
+# - "torch": PyTorch FP32 gốc (mặc định, dùng làm chuẩn để so sánh độ chính xác).
+# - "torch_int8": PyTorch với các lớp Linear được lượng tử hóa động int8, không cần export.
+# - "onnx": ONNX Runtime FP32, đọc từ thư mục đã export (scripts/export_onnx_encoder.py).
+# - "onnx_int8": ONNX Runtime với mô hình lượng tử hóa động int8 (nhanh nhất trên CPU).
+ENCODER_BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+DEFAULT_ONNX_QUANTIZATION = "avx2"  # Cấu hình lượng tử hóa của ONNX Runtime: "avx2", "avx512", "avx512_vnni", "arm64"
+
+
+def onnx_int8_file_name(quantization: str = DEFAULT_ONNX_QUANTIZATION) -> str:
+    """Tên file (tương đối trong thư mục export) của mô hình ONNX đã lượng tử hóa int8."""
+    return os.path.join("onnx", f"model_qint8_{quantization}.onnx")
+
+
+def onnx_runtime_available() -> bool:
+    """Các backend onnx* của SentenceTransformer cần gói 'optimum[onnxruntime]' (không có trong cài đặt mặc định)."""
+    try:
+        return importlib.util.find_spec("optimum.onnxruntime") is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    Backend sẽ thực sự dùng: backend onnx* quay về "torch" (kèm cảnh báo) khi thiếu 'optimum[onnxruntime]',
+    thay vì để lỗi import chỉ xuất hiện lúc nạp mô hình.
+    """
+    if backend in ("onnx", "onnx_int8") and not onnx_runtime_available():
+        logger.warning(f"Backend '{backend}' cần gói 'optimum[onnxruntime]' nhưng chưa được cài đặt; "
+                       "dùng backend 'torch'. Cài đặt: pip install 'optimum[onnxruntime]'")
+        return "torch"
+    return backend
+
+
+def load_encoder(backend: str = "torch", model_name: str = MODEL_NAME, onnx_dir: Optional[str] = None,
+                 onnx_quantization: str = DEFAULT_ONNX_QUANTIZATION) -> Any:
+    """
+    Nạp SentenceTransformer với backend suy luận được chọn. Mọi backend đều có cùng giao diện encode().
+
+    Args:
+        backend: Một trong ENCODER_BACKENDS.
+        model_name: Tên mô hình trên HuggingFace (dùng cho các backend torch).
+        onnx_dir: Thư mục chứa mô hình đã export bởi scripts/export_onnx_encoder.py (bắt buộc với backend onnx*).
+        onnx_quantization: Cấu hình lượng tử hóa đã dùng khi export (chọn file cho "onnx_int8").
+
+    Raises:
+        ValueError: backend không hợp lệ hoặc thiếu onnx_dir.
+        FileNotFoundError: chưa export mô hình ONNX.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Backend '{backend}' không hợp lệ, chọn một trong: {', '.join(ENCODER_BACKENDS)}")
+
+    if backend in ("torch", "torch_int8"):
+        model = SentenceTransformer(model_name, device="cpu" if backend == "torch_int8" else None)
+        if backend == "torch_int8":
+            import torch
+            # Lượng tử hóa động: trọng số Linear lưu dạng int8, activation lượng tử hóa khi chạy
+            torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    if not onnx_dir:
+        raise ValueError(f"Backend '{backend}' cần đường dẫn thư mục mô hình ONNX (onnx_dir).")
+    if not os.path.isdir(os.path.join(onnx_dir, "onnx")):
+        raise FileNotFoundError(
+            f"Không tìm thấy mô hình ONNX tại '{onnx_dir}'. Vui lòng chạy script 'scripts/export_onnx_encoder.py' trước.")
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if backend == "onnx_int8":
+        file_name = onnx_int8_file_name(onnx_quantization)
+        if not os.path.exists(os.path.join(onnx_dir, file_name)):
+            raise FileNotFoundError(
+                f"Không tìm thấy mô hình int8 '{file_name}' trong '{onnx_dir}'. "
+                "Vui lòng chạy script 'scripts/export_onnx_encoder.py' trước.")
+        model_kwargs["file_name"] = file_name
+    return SentenceTransformer(onnx_dir, backend="onnx", model_kwargs=model_kwargs)
+
+
+def export_onnx_encoder(onnx_dir: str, model_name: str = MODEL_NAME,
+                        onnx_quantization: str = DEFAULT_ONNX_QUANTIZATION):
+    """
+    Export mô hình sang ONNX (FP32) và tạo thêm bản lượng tử hóa động int8 trong cùng thư mục.
+    Cần gói 'optimum[onnxruntime]'.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    logger.info(f"Đang export '{model_name}' sang ONNX tại: {onnx_dir}")
+    # backend="onnx" tự chuyển đổi từ trọng số PyTorch nếu repo gốc chưa có file ONNX
+    model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"})
+    model.save_pretrained(onnx_dir)
+
+    logger.info(f"Đang lượng tử hóa động int8 (cấu hình '{onnx_quantization}')...")
+    export_dynamic_quantized_onnx_model(model, onnx_quantization, onnx_dir)
+    logger.info(f"Đã export xong: {os.path.join(onnx_dir, onnx_int8_file_name(onnx_quantization))}")
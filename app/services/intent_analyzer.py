@@ -1,16 +1,38 @@
 # app/services/intent_analyzer.py
 
+import hashlib
 import logging
 import json
-from typing import Dict, Any
-from groq import Groq
+import re
+import threading
+from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field, ValidationError
 
+from app.core.cache import TieredCache, make_cache_key, normalize_query_text
 from app.core.config import settings
+from app.database.generations import generation_manager
+from app.database.knowledge_base import get_knowledge_base
+from app.services import llm_client
+from app.tools.can_chi_helper import ALIAS_TO_CON_GIAP, DIA_CHI, THIEN_CAN, normalize_can_chi
 from app.services.prompt_templates import INTENT_ANALYSIS_PROMPT
 
 logger = logging.getLogger(__name__)
 
+# Phiên bản prompt: thay đổi nội dung INTENT_ANALYSIS_PROMPT sẽ tự động làm mất hiệu lực các kết quả đã cache
+INTENT_PROMPT_VERSION = hashlib.sha256(INTENT_ANALYSIS_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# --- Cache kết quả phân tích ý định ---
+# Phân tích ý định chạy với temperature=0 nên cùng một câu hỏi luôn cho cùng kết quả;
+# các câu hỏi lặp lại ("chào em", "1986 mệnh gì") được trả lời ngay mà không cần gọi LLM.
+intent_cache: Optional[TieredCache] = None
+if settings.INTENT_CACHE_ENABLED:
+    intent_cache = TieredCache(
+        name="intent",
+        max_entries=settings.INTENT_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.INTENT_CACHE_TTL_SECONDS,
+        disk_path=settings.CACHE_DB_PATH if settings.INTENT_CACHE_DISK_ENABLED else None,
+    )
+
 
 # --- Pydantic Models để Validate kết quả từ LLM ---
 # Điều này đảm bảo rằng output của LLM luôn có cấu trúc đúng như chúng ta mong đợi.
@@ -32,12 +54,196 @@ class IntentResult(BaseModel):
     entities: ExtractedEntities
 
 
-# --- Khởi tạo client cho Groq ---
-try:
-    groq_client = Groq(api_key=settings.GROQ_API_KEY)
-except Exception as e:
-    logger.error(f"Không thể khởi tạo Groq client: {e}")
-    groq_client = None
+# --- Bộ phân loại nhanh dựa trên luật (regex + từ điển) ---
+# Nhiều câu hỏi có thể quyết định hoàn toàn mà không cần LLM: một năm sinh hay Can Chi trần
+# ("Bính Dần", "1991", "sinh năm 91"), một lời chào, hoặc "nam 1990 nhà hướng Tây Nam". Bộ phân loại chỉ trả
+# kết quả khi MỌI từ trong câu đều được nhận diện (thực thể hoặc từ đệm quen thuộc);
+# chỉ cần một từ lạ là trả về None để chuyển cho LLM.
+_GENDER_WORDS = {"nam": "Nam", "nữ": "Nữ", "chồng": "Nam", "vợ": "Nữ"}
+_GREETING_WORDS = frozenset({"chào", "hello", "hi", "alo", "hey"})
+_FILLER_WORDS = frozenset("""
+    xin xem giúp giùm hộ mình tôi tui em anh chị bạn ad cho của là thì sao gì nào
+    mệnh mạng cung tuổi sinh năm người nhà hợp có không ko ạ ơi với và thế như được
+    hỏi tra cứu thông tin về ngũ hành nạp âm bản nhé nha vậy này đây đời
+""".split())
+# Năm viết tắt 2 chữ số ("91") chỉ được coi là năm sinh khi đứng ngay sau một từ chỉ năm, và không đứng cạnh
+# "tuổi": "tôi 30 tuổi" là tuổi, không phải năm sinh 1930/2030.
+_SHORT_YEAR_CUES = frozenset({"năm", "đời"})
+# "năm 2024 có gì" có thể là câu hỏi về năm 2024, không phải năm sinh: năm đứng sau "năm" (không có "sinh")
+# chỉ được coi là năm sinh khi câu có thêm dấu hiệu về người (giới tính, hướng nhà hoặc một trong các từ này).
+_BIRTH_CUE_WORDS = frozenset({"sinh", "tuổi", "mệnh", "mạng", "cung", "nạp", "ngũ", "người"})
+_INNER_PUNCTUATION_RE = re.compile(r"[,.!?;:…\"'()\[\]/-]+")
+
+# Thống kê để theo dõi tỉ lệ câu hỏi được xử lý mà không cần gọi LLM (xem /metrics)
+RULE_FAST_PATH_STATS = {"hits": 0, "fallbacks": 0}
+
+_rule_pattern: Optional[re.Pattern] = None
+_direction_names: Dict[str, str] = {}
+_rule_pattern_lock = threading.Lock()
+
+
+def _load_direction_names() -> Dict[str, str]:
+    """Tên các hướng nhà hợp lệ (chữ thường -> tên chính tắc), lấy từ bảng 'huong' trong knowledge base."""
+    knowledge_base = get_knowledge_base()
+    huong_table = knowledge_base.table("huong")
+    rules_table = knowledge_base.table("cung_menh_huong_rules")
+    if huong_table is None or rules_table is None:
+        logger.warning("Không có bảng 'huong' trong knowledge base, bộ phân loại nhanh sẽ không nhận diện hướng nhà.")
+        return {}
+    # Chỉ giữ các hướng có luật Bát Trạch (bỏ "Trung Cung", "Hướng Giao thoa")
+    house_directions = {key[1] for key in rules_table.keys()}
+    return {name.lower(): name for (name,) in huong_table.keys() if name in house_directions}
+
+
+def _get_rule_pattern() -> re.Pattern:
+    """Dựng (một lần) regex tách câu hỏi thành các token: hướng nhà, Can Chi, con giáp, năm sinh, từ đơn."""
+    global _rule_pattern, _direction_names
+    if _rule_pattern is None:
+        with _rule_pattern_lock:
+            if _rule_pattern is None:
+                _direction_names = _load_direction_names()
+
+                def alternation(words):
+                    # Ưu tiên cụm dài trước ("tây nam" trước "tây")
+                    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+                can = alternation(c.lower() for c in THIEN_CAN)
+                chi = alternation([c.lower() for c in DIA_CHI] + ["tí"])
+                parts = [
+                    rf"(?P<can_chi>(?:{can}) (?:{chi}))",
+                    rf"tuổi (?P<con_giap>{alternation(ALIAS_TO_CON_GIAP)})",
+                    r"(?P<year>(?:19|20)\d{2})",
+                    r"(?P<short_year>\d{2})",
+                    r"(?P<word>\S+)",
+                ]
+                if _direction_names:
+                    parts.insert(0, rf"hướng(?: nhà)? (?P<huong>{alternation(_direction_names)})")
+                _rule_pattern = re.compile(r"(?<!\S)(?:" + "|".join(parts) + r")(?!\S)")
+    return _rule_pattern
+
+
+def _reset_rule_pattern(*_):
+    """Dựng lại regex ở lần dùng tiếp theo (danh sách hướng nhà lấy từ knowledge base của thế hệ dữ liệu mới)."""
+    global _rule_pattern
+    with _rule_pattern_lock:
+        _rule_pattern = None
+
+
+generation_manager.register_swap_listener(_reset_rule_pattern)
+
+
+def rule_based_intent(user_query: str) -> Optional[IntentResult]:
+    """
+    Phân loại câu hỏi bằng luật, không gọi LLM.
+
+    Returns:
+        IntentResult nếu câu hỏi được nhận diện chắc chắn, ngược lại None.
+    """
+    text = _INNER_PUNCTUATION_RE.sub(" ", normalize_query_text(user_query))
+    pattern = _get_rule_pattern()
+
+    persons: List[Dict[str, Any]] = []
+    directions: List[str] = []
+    pending_gender: Optional[str] = None
+    mentions_direction = False
+    has_greeting = False
+    last_was_person = False
+
+    matches = list(pattern.finditer(text))
+    tokens = [match.group(0) for match in matches]
+    calendar_year_mentioned = False
+
+    for position, match in enumerate(matches):
+        kind = match.lastgroup
+        value = match.group(kind)
+        previous_token = tokens[position - 1] if position > 0 else None
+        next_token = tokens[position + 1] if position + 1 < len(tokens) else None
+
+        if kind == "short_year" and (previous_token not in _SHORT_YEAR_CUES or next_token == "tuổi"):
+            return None  # "30 tuổi", "91" đứng trần: có thể là tuổi/số lượng, để LLM quyết định
+        if kind in ("year", "short_year") and previous_token == "năm" and (position < 2 or tokens[position - 2] != "sinh"):
+            calendar_year_mentioned = True
+
+        if kind in ("can_chi", "con_giap", "year", "short_year"):
+            person: Dict[str, Any] = {"gender": pending_gender}
+            if kind == "year":
+                person["nam_sinh"] = int(value)
+            elif kind == "short_year":
+                person["alias"] = value
+            elif kind == "can_chi":
+                person["alias"] = normalize_can_chi(value)
+            else:
+                person["con_giap"] = value
+            persons.append(person)
+            pending_gender = None
+            last_was_person = True
+            continue
+
+        if kind == "huong":
+            directions.append(_direction_names[value])
+        elif value in _GENDER_WORDS:
+            gender = _GENDER_WORDS[value]
+            if last_was_person and persons[-1]["gender"] is None:
+                persons[-1]["gender"] = gender  # "1990 nam"
+            elif pending_gender is None:
+                pending_gender = gender  # "nam 1990"
+            else:
+                return None
+        elif value == "hướng":
+            mentions_direction = True
+        elif value in _GREETING_WORDS:
+            has_greeting = True
+        elif value not in _FILLER_WORDS:
+            return None  # Có từ lạ -> không đủ chắc chắn
+        last_was_person = False
+
+    if pending_gender is not None:
+        # "1990 là nam": gán giới tính còn lại cho người duy nhất chưa có giới tính
+        genderless = [p for p in persons if p["gender"] is None]
+        if len(persons) != 1 or len(genderless) != 1:
+            return None
+        genderless[0]["gender"] = pending_gender
+
+    if (calendar_year_mentioned and not directions and not mentions_direction
+            and not any(p["gender"] for p in persons) and not _BIRTH_CUE_WORDS.intersection(tokens)):
+        return None  # "năm 2024 có gì": không rõ là năm sinh hay câu hỏi về năm đó
+
+    if not persons:
+        if has_greeting and not directions and not mentions_direction:
+            return IntentResult(intent="GREETING", entities=ExtractedEntities())
+        return None
+    if len(persons) > 2 or len(directions) > 1:
+        return None
+
+    wants_house = bool(directions) or mentions_direction
+    if len(persons) == 2:
+        if wants_house or any("con_giap" in p for p in persons):
+            return None
+        intent = "COMPARE_PEOPLE"
+    else:
+        if wants_house and "con_giap" in persons[0]:
+            return None  # "tuổi chuột" ứng với nhiều năm, cần LLM/người dùng làm rõ
+        intent = "ANALYZE_HOUSE" if wants_house else "LOOKUP_NAMSINH"
+
+    fields: Dict[str, Any] = {}
+    for i, person in enumerate(persons, start=1):
+        if "nam_sinh" in person:
+            fields[f"nam_sinh_{i}"] = person["nam_sinh"]
+        elif "alias" in person:
+            # Alias được preprocess_entities giải mã thành năm sinh cụ thể
+            fields[f"nam_sinh_alias_{i}"] = person["alias"]
+        else:
+            fields["nam_sinh_alias"] = person["con_giap"]
+        if person["gender"]:
+            fields[f"gioi_tinh_{i}"] = person["gender"]
+    if directions:
+        fields["huong_nha"] = directions[0]
+
+    return IntentResult(intent=intent, entities=ExtractedEntities(**fields))
+
+
+def _intent_cache_key(user_query: str) -> str:
+    return make_cache_key(normalize_query_text(user_query), INTENT_PROMPT_VERSION, settings.LLM_MODEL)
 
 
 async def analyze_intent(user_query: str, max_retries: int = 3) -> IntentResult:
@@ -51,8 +257,31 @@ async def analyze_intent(user_query: str, max_retries: int = 3) -> IntentResult:
     Returns:
         Một đối tượng IntentResult chứa intent và entities đã được validate.
     """
-    if not groq_client:
-        logger.error("Groq client chưa được khởi tạo. Không thể phân tích ý định.")
+    if settings.INTENT_RULES_ENABLED:
+        try:
+            rule_result = rule_based_intent(user_query)
+        except Exception as e:
+            logger.warning(f"Lỗi trong bộ phân loại nhanh, chuyển sang LLM: {e}")
+            rule_result = None
+        if rule_result is not None:
+            RULE_FAST_PATH_STATS["hits"] += 1
+            logger.info(
+                f"Phân loại nhanh bằng luật: Intent='{rule_result.intent}', "
+                f"Entities={rule_result.entities.model_dump(exclude_unset=True)}")
+            return rule_result
+        RULE_FAST_PATH_STATS["fallbacks"] += 1
+
+    cache_key = None
+    if intent_cache is not None:
+        cache_key = _intent_cache_key(user_query)
+        cached = await intent_cache.aget(cache_key)
+        if cached is not None:
+            logger.info(f"Intent cache hit cho query: '{user_query}'")
+            # Luôn dựng object mới để caller có thể sửa entities mà không ảnh hưởng bản trong cache
+            return IntentResult.model_validate(cached)
+
+    if not llm_client.is_available():
+        logger.error("LLM client chưa được khởi tạo. Không thể phân tích ý định.")
         return IntentResult(intent="ERROR", entities=ExtractedEntities())
 
     prompt = INTENT_ANALYSIS_PROMPT.format(user_query=user_query)
@@ -60,20 +289,17 @@ async def analyze_intent(user_query: str, max_retries: int = 3) -> IntentResult:
     for attempt in range(max_retries):
         try:
             logger.info(f"Đang gửi yêu cầu phân tích ý định đến LLM (Lần thử {attempt + 1})...")
-            chat_completion = groq_client.chat.completions.create(
+            raw_response = await llm_client.chat_completion(
                 messages=[
                     {
                         "role": "user",
                         "content": prompt,
                     }
                 ],
-                model="gemma2-9b-it",  # Hoặc "mixtral-8x7b-32768"
                 temperature=0,  # =0 để kết quả có tính quyết định, ít sáng tạo
                 max_tokens=256,
                 response_format={"type": "json_object"},
             )
-
-            raw_response = chat_completion.choices[0].message.content
             logger.info(f"LLM response (raw): {raw_response}")
 
             # Validate kết quả JSON bằng Pydantic
@@ -82,6 +308,9 @@ async def analyze_intent(user_query: str, max_retries: int = 3) -> IntentResult:
 
             logger.info(
                 f"Phân tích thành công: Intent='{validated_result.intent}', Entities={validated_result.entities.model_dump_json(indent=2)}")
+            # Chỉ cache kết quả LLM hợp lệ; các lỗi tạm thời (UNKNOWN/ERROR do thất bại) không được cache
+            if cache_key is not None:
+                await intent_cache.aset(cache_key, validated_result.model_dump(exclude_unset=True))
             return validated_result
 
         except json.JSONDecodeError as e:
@@ -120,5 +349,26 @@ if __name__ == '__main__':
             print(f"Entities: {result.entities.model_dump()}")
 
 
+    # Bộ phân loại nhanh: các câu về tuổi / năm dương lịch phải được chuyển cho LLM (None)
+    rule_cases = [
+        ("1986 mệnh gì", "LOOKUP_NAMSINH"),
+        ("sinh năm 91", "LOOKUP_NAMSINH"),
+        ("nữ đời 88", "LOOKUP_NAMSINH"),
+        ("năm 1990 mệnh gì", "LOOKUP_NAMSINH"),
+        ("xem nhà hướng tây nam cho nữ 1991", "ANALYZE_HOUSE"),
+        ("tôi 30 tuổi", None),
+        ("em 25 tuổi mệnh gì", None),
+        ("sinh năm 90 tuổi", None),
+        ("91", None),
+        ("nam 91", None),
+        ("năm 2024 có gì", None),
+        ("năm 91", None),
+    ]
+    for query, expected in rule_cases:
+        result = rule_based_intent(query)
+        intent = result.intent if result else None
+        status = "OK" if intent == expected else "SAI"
+        print(f"[{status}] rule_based_intent('{query}') -> {intent} (mong đợi: {expected})")
+
     # Chạy các hàm bất đồng bộ để test
     asyncio.run(run_tests())
\ No newline at end of file
@@ -0,0 +1,196 @@
+# app/services/llm_client.py
+
+import asyncio
+import logging
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from groq import AsyncGroq, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Các lỗi tạm thời, đáng để thử lại (mất kết nối, timeout, rate limit, lỗi 5xx từ Groq)
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+
+class LLMClientError(Exception):
+    """Lỗi khi không thể hoàn thành một lời gọi LLM (client chưa khởi tạo hoặc đã hết số lần thử)."""
+    pass
+
+
+# --- Khởi tạo client bất đồng bộ dùng chung ---
+# Một AsyncGroq duy nhất cho toàn bộ process để tái sử dụng connection pool HTTP,
+# thay vì mỗi module tự tạo một client đồng bộ riêng (làm block event loop).
+try:
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=settings.LLM_TIMEOUT_SECONDS,
+    )
+    async_groq_client = AsyncGroq(
+        api_key=settings.GROQ_API_KEY,
+        http_client=_http_client,
+        max_retries=0,  # Việc thử lại do module này tự quản lý (có backoff và log rõ ràng)
+    )
+except Exception as e:
+    logger.error(f"Không thể khởi tạo AsyncGroq client: {e}")
+    _http_client = None
+    async_groq_client = None
+
+# Giới hạn số lời gọi LLM đồng thời để không vượt quá rate limit của Groq
+_concurrency_limiter = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+
+def is_available() -> bool:
+    """Kiểm tra xem LLM client đã sẵn sàng để sử dụng chưa."""
+    return async_groq_client is not None
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff có jitter: base * 2^attempt * [0.5, 1.5)."""
+    return settings.LLM_RETRY_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+
+
+async def chat_completion(
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        temperature: float = 0,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        finish_info: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Gửi một yêu cầu chat completion đến Groq mà không block event loop.
+
+    Args:
+        messages: Danh sách message theo định dạng OpenAI/Groq.
+        model: Tên model, mặc định lấy từ settings.LLM_MODEL.
+        temperature: Nhiệt độ sinh văn bản.
+        max_tokens: Số token tối đa của câu trả lời.
+        response_format: Ví dụ {"type": "json_object"}.
+        timeout: Timeout (giây) cho mỗi lần gọi, mặc định settings.LLM_TIMEOUT_SECONDS.
+        finish_info: Nếu truyền vào, lý do kết thúc của lần gọi được ghi vào finish_info["finish_reason"]
+            ("stop", hoặc "length" khi câu trả lời bị cắt ở max_tokens).
+
+    Returns:
+        Nội dung văn bản trong choice đầu tiên.
+
+    Raises:
+        LLMClientError: Nếu client chưa được khởi tạo hoặc đã hết số lần thử lại.
+    """
+    if async_groq_client is None:
+        raise LLMClientError("AsyncGroq client chưa được khởi tạo.")
+
+    request_kwargs: Dict[str, Any] = {
+        "messages": messages,
+        "model": model or settings.LLM_MODEL,
+        "temperature": temperature,
+        "timeout": timeout or settings.LLM_TIMEOUT_SECONDS,
+    }
+    if max_tokens is not None:
+        request_kwargs["max_tokens"] = max_tokens
+    if response_format is not None:
+        request_kwargs["response_format"] = response_format
+
+    max_retries = settings.LLM_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        try:
+            async with _concurrency_limiter:
+                chat_completion_result = await async_groq_client.chat.completions.create(**request_kwargs)
+            choice = chat_completion_result.choices[0]
+            if finish_info is not None:
+                finish_info["finish_reason"] = choice.finish_reason
+            return choice.message.content
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries:
+                raise LLMClientError(f"Lời gọi LLM thất bại sau {max_retries + 1} lần thử: {e}") from e
+            delay = _backoff_delay(attempt)
+            logger.warning(
+                f"Lỗi tạm thời khi gọi LLM ({type(e).__name__}: {e}). Thử lại sau {delay:.2f}s "
+                f"(lần {attempt + 1}/{max_retries})...")
+            await asyncio.sleep(delay)
+
+    # Không bao giờ tới đây, vòng lặp luôn return hoặc raise
+    raise LLMClientError("Lời gọi LLM thất bại.")
+
+
+async def chat_completion_stream(
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        temperature: float = 0,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        finish_info: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """
+    Giống chat_completion nhưng trả về từng đoạn văn bản ngay khi Groq sinh ra (stream=True).
+
+    Chỉ thử lại khi lỗi xảy ra lúc mở stream; khi đã gửi token đầu tiên cho caller thì lỗi
+    giữa chừng được raise thẳng (dưới dạng LLMClientError) vì không thể "rút lại" các token đã gửi.
+    finish_info: như chat_completion, được ghi khi stream kết thúc.
+
+    Yields:
+        Các đoạn văn bản (delta.content) khác rỗng theo thứ tự.
+    """
+    if async_groq_client is None:
+        raise LLMClientError("AsyncGroq client chưa được khởi tạo.")
+
+    request_kwargs: Dict[str, Any] = {
+        "messages": messages,
+        "model": model or settings.LLM_MODEL,
+        "temperature": temperature,
+        "timeout": timeout or settings.LLM_TIMEOUT_SECONDS,
+        "stream": True,
+    }
+    if max_tokens is not None:
+        request_kwargs["max_tokens"] = max_tokens
+
+    max_retries = settings.LLM_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        await _concurrency_limiter.acquire()
+        try:
+            stream = await async_groq_client.chat.completions.create(**request_kwargs)
+            break
+        except RETRYABLE_ERRORS as e:
+            # Trả slot trong lúc chờ backoff để không chặn các request khác
+            _concurrency_limiter.release()
+            if attempt >= max_retries:
+                raise LLMClientError(f"Không thể mở stream LLM sau {max_retries + 1} lần thử: {e}") from e
+            delay = _backoff_delay(attempt)
+            logger.warning(
+                f"Lỗi tạm thời khi mở stream LLM ({type(e).__name__}: {e}). Thử lại sau {delay:.2f}s "
+                f"(lần {attempt + 1}/{max_retries})...")
+            await asyncio.sleep(delay)
+        except BaseException:
+            _concurrency_limiter.release()
+            raise
+
+    # Giữ slot của semaphore trong suốt thời gian stream, vì kết nối HTTP vẫn đang được dùng
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            if finish_info is not None and chunk.choices[0].finish_reason:
+                finish_info["finish_reason"] = chunk.choices[0].finish_reason
+            text = chunk.choices[0].delta.content
+            if text:
+                yield text
+    except RETRYABLE_ERRORS as e:
+        raise LLMClientError(f"Stream LLM bị gián đoạn: {e}") from e
+    finally:
+        try:
+            await stream.close()
+        finally:
+            _concurrency_limiter.release()
+
+
+async def aclose():
+    """Đóng connection pool HTTP (gọi khi ứng dụng tắt)."""
+    if _http_client is not None:
+        await _http_client.aclose()
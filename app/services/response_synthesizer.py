@@ -1,22 +1,33 @@
 # app/services/response_synthesizer.py
 
+import asyncio
 import logging
 import json
-from groq import Groq
+import random
+from typing import AsyncIterator, List, Optional, Tuple
 
+from app.core.cache import TieredCache, make_cache_key
 from app.core.config import settings
+from app.services import llm_client
 from app.services.context_manager import ChatContext
 from app.services.prompt_templates import RESPONSE_SYNTHESIS_PROMPT
 
 logger = logging.getLogger(__name__)
 
-# Khởi tạo lại client (hoặc có thể tạo một module client chung)
-try:
-    groq_client = Groq(api_key=settings.GROQ_API_KEY)
-except Exception as e:
-    logger.error(f"Không thể khởi tạo Groq client: {e}")
-    groq_client = None
-
+# --- Cache câu trả lời tổng hợp ---
+# Với cùng dữ liệu tra cứu (ví dụ mọi yêu cầu "Nữ 1991, hướng Tây Nam"), prompt tổng hợp giống hệt nhau,
+# nên có thể dùng lại câu trả lời đã sinh thay vì chờ LLM viết lại 2048 token.
+# Mỗi khóa lưu một danh sách tối đa SYNTHESIS_CACHE_VARIANTS câu trả lời để giữ sự đa dạng.
+synthesis_cache: Optional[TieredCache] = None
+if settings.SYNTHESIS_CACHE_ENABLED:
+    synthesis_cache = TieredCache(
+        name="synthesis",
+        max_entries=settings.SYNTHESIS_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.SYNTHESIS_CACHE_TTL_SECONDS,
+        disk_path=settings.CACHE_DB_PATH if settings.SYNTHESIS_CACHE_DISK_ENABLED else None,
+    )
+# Tuần tự hóa đọc-sửa-ghi danh sách biến thể để các request đồng thời không ghi đè câu trả lời của nhau
+_store_lock = asyncio.Lock()
 
 def _format_dict_to_string(data: dict, title: str) -> list[str]:
     """Chuyển một dictionary thành một list các chuỗi có định dạng đẹp."""
@@ -109,7 +120,7 @@ def format_context_for_prompt(context: ChatContext) -> str:
             phi_tinh = data.get('phi_tinh_info')
             if phi_tinh:
                 data_lines.append(
-                    f"- Yếu tố thời vận (Năm {int(phi_tinh.get('nam_duonglich'))}): Cần chú ý đến các sao tốt/xấu của năm. Hướng đại cát là **{phi_tinh.get('phuongvi_daicat_so1')}**, hướng đại hung là **{phi_tinh.get('phuongvi_daihung_so1')}**.")
+                    f"- Yếu tố thời vận (Năm {phi_tinh.get('nam_duonglich')}): Cần chú ý đến các sao tốt/xấu của năm. Hướng đại cát là **{phi_tinh.get('phuongvi_daicat_so1')}**, hướng đại hung là **{phi_tinh.get('phuongvi_daihung_so1')}**.")
 
         case "COMPARE_PEOPLE":
             data_lines.append("**PHÂN TÍCH SỰ TƯƠNG HỢP GIỮA HAI NGƯỜI**")
@@ -165,46 +176,148 @@ def format_context_for_prompt(context: ChatContext) -> str:
     return "\n".join(data_lines)
 
 
-async def synthesize_response(context: ChatContext) -> str:
+# Tham số sinh văn bản dùng chung cho cả chế độ trả về một lần và chế độ stream
+SYNTHESIS_TEMPERATURE = 0.7  # Cho phép LLM viết văn mượt mà hơn
+SYNTHESIS_MAX_TOKENS = 2048
+SYNTHESIS_ERROR_MESSAGE = "Xin lỗi, đã có lỗi xảy ra trong quá trình tạo câu trả lời. Vui lòng thử lại sau."
+
+
+def prepare_synthesis(context: ChatContext) -> Tuple[Optional[str], Optional[str]]:
     """
-    Tổng hợp câu trả lời cuối cùng dựa trên context đã được làm giàu.
+    Quyết định cách trả lời cho một context.
+
+    Returns:
+        (câu trả lời có sẵn, None) cho các trường hợp không cần LLM (direct_response, missing_info, thiếu dữ liệu),
+        hoặc (None, prompt) khi cần gọi LLM để tổng hợp.
     """
-    if not groq_client:
-        return "Lỗi: Dịch vụ LLM không khả dụng."
+    if not llm_client.is_available():
+        return "Lỗi: Dịch vụ LLM không khả dụng.", None
 
     # Xử lý các trường hợp đơn giản không cần LLM
     if context.direct_response:
-        return context.direct_response
+        return context.direct_response, None
 
     if context.missing_info:
-        return f"Để phân tích, tôi cần biết thêm thông tin về {context.missing_info} của bạn."
+        return f"Để phân tích, tôi cần biết thêm thông tin về {context.missing_info} của bạn.", None
 
     # Xây dựng prompt cho các trường hợp phức tạp
     formatted_context = format_context_for_prompt(context)
 
     if "Không có đủ dữ liệu" in formatted_context:
-        return formatted_context
+        return formatted_context, None
+
+    return None, RESPONSE_SYNTHESIS_PROMPT.format(context_data=formatted_context)
+
+
+def _synthesis_cache_key(prompt: str) -> str:
+    # Prompt đã bao gồm cả template lẫn dữ liệu tra cứu, nên sửa template cũng làm đổi khóa
+    return make_cache_key(prompt, settings.LLM_MODEL, SYNTHESIS_TEMPERATURE, SYNTHESIS_MAX_TOKENS)
+
+
+def _pick_cached_answer(variants: List[str]) -> Optional[str]:
+    """Chọn ngẫu nhiên một câu trả lời đã cache, hoặc None nếu chưa đủ số biến thể cần giữ cho khóa này."""
+    if len(variants) < settings.SYNTHESIS_CACHE_VARIANTS:
+        return None
+    return random.choice(variants)
+
+
+async def _store_answer(cache_key: str, answer: str, finish_reason: Optional[str]):
+    """Thêm câu trả lời vào danh sách biến thể đã cache; bỏ qua câu trả lời bị cắt ở max_tokens."""
+    if finish_reason == "length":
+        logger.info("Câu trả lời tổng hợp bị cắt ở max_tokens, không cache.")
+        return
+    async with _store_lock:
+        # Đọc lại danh sách hiện tại thay vì dùng bản đã đọc lúc tra cache (có thể đã có request khác ghi thêm)
+        variants = list(await synthesis_cache.aget(cache_key) or [])
+        if answer not in variants:
+            variants.append(answer)
+        await synthesis_cache.aset(cache_key, variants[-settings.SYNTHESIS_CACHE_VARIANTS:])
 
-    prompt = RESPONSE_SYNTHESIS_PROMPT.format(context_data=formatted_context)
 
+async def synthesize_response(context: ChatContext) -> str:
+    """
+    Tổng hợp câu trả lời cuối cùng dựa trên context đã được làm giàu.
+    """
+    immediate_answer, prompt = prepare_synthesis(context)
+    if immediate_answer is not None:
+        return immediate_answer
+
+    cache_key = None
+    if synthesis_cache is not None:
+        cache_key = _synthesis_cache_key(prompt)
+        cached_answer = _pick_cached_answer(list(await synthesis_cache.aget(cache_key) or []))
+        if cached_answer is not None:
+            logger.info("Synthesis cache hit, dùng lại câu trả lời đã tổng hợp.")
+            return cached_answer
+
+    finish_info = {}
     try:
         logger.info("Đang gửi yêu cầu tổng hợp câu trả lời đến LLM...")
-        chat_completion = groq_client.chat.completions.create(
+        final_answer = await llm_client.chat_completion(
             messages=[
                 {
                     "role": "user",
                     "content": prompt,
                 }
             ],
-            model="gemma2-9b-it",
-            temperature=0.7,  # Cho phép LLM viết văn mượt mà hơn
-            max_tokens=2048,
+            temperature=SYNTHESIS_TEMPERATURE,
+            max_tokens=SYNTHESIS_MAX_TOKENS,
+            timeout=settings.LLM_SYNTHESIS_TIMEOUT_SECONDS,
+            finish_info=finish_info,
         )
-
-        final_answer = chat_completion.choices[0].message.content
         logger.info("Đã nhận được câu trả lời tổng hợp từ LLM.")
+        if cache_key is not None and final_answer:
+            await _store_answer(cache_key, final_answer, finish_info.get("finish_reason"))
         return final_answer
 
     except Exception as e:
         logger.error(f"Lỗi khi tổng hợp câu trả lời: {e}")
-        return "Xin lỗi, đã có lỗi xảy ra trong quá trình tạo câu trả lời. Vui lòng thử lại sau."
\ No newline at end of file
+        return SYNTHESIS_ERROR_MESSAGE
+
+
+async def stream_response(context: ChatContext) -> AsyncIterator[str]:
+    """
+    Phiên bản stream của synthesize_response: trả về từng đoạn văn bản ngay khi LLM sinh ra.
+    Các câu trả lời có sẵn (direct_response, missing_info) được trả về ngay trong một đoạn duy nhất.
+    """
+    immediate_answer, prompt = prepare_synthesis(context)
+    if immediate_answer is not None:
+        yield immediate_answer
+        return
+
+    cache_key = None
+    if synthesis_cache is not None:
+        cache_key = _synthesis_cache_key(prompt)
+        cached_answer = _pick_cached_answer(list(await synthesis_cache.aget(cache_key) or []))
+        if cached_answer is not None:
+            logger.info("Synthesis cache hit, dùng lại câu trả lời đã tổng hợp.")
+            yield cached_answer
+            return
+
+    answer_parts: List[str] = []
+    finish_info = {}
+    try:
+        logger.info("Đang stream câu trả lời tổng hợp từ LLM...")
+        async for text in llm_client.chat_completion_stream(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                temperature=SYNTHESIS_TEMPERATURE,
+                max_tokens=SYNTHESIS_MAX_TOKENS,
+                timeout=settings.LLM_SYNTHESIS_TIMEOUT_SECONDS,
+                finish_info=finish_info,
+        ):
+            answer_parts.append(text)
+            yield text
+        logger.info("Đã stream xong câu trả lời tổng hợp từ LLM.")
+        # Chỉ cache khi stream hoàn tất (không cache câu trả lời bị cắt giữa chừng)
+        if cache_key is not None and answer_parts:
+            await _store_answer(cache_key, "".join(answer_parts), finish_info.get("finish_reason"))
+
+    except Exception as e:
+        logger.error(f"Lỗi khi stream câu trả lời: {e}")
+        # Nếu đã gửi một phần câu trả lời, thông báo lỗi được nối tiếp vào cuối
+        yield ("\n\n" if answer_parts else "") + SYNTHESIS_ERROR_MESSAGE
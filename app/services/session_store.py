@@ -0,0 +1,254 @@
+# app/services/session_store.py
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.context_manager import ChatContext, SessionSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _serialize(context: ChatContext) -> bytes:
+    # Chỉ lưu bản chụp gọn (trạng thái hội thoại + lịch sử tool có giới hạn) dưới dạng MessagePack
+    return context.to_snapshot(max_tool_calls=settings.SESSION_MAX_TOOL_CALLS).to_bytes()
+
+
+def _deserialize(payload: bytes) -> ChatContext:
+    return SessionSnapshot.from_bytes(payload).to_context()
+
+
+class SessionStore(ABC):
+    """
+    Giao diện chung cho nơi lưu ngữ cảnh hội thoại theo session_id.
+    Các session không được truy cập quá TTL sẽ bị xóa; số lượng session được giới hạn.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[ChatContext]:
+        """Lấy context của session (và gia hạn TTL), hoặc None nếu không tồn tại / đã hết hạn."""
+
+    @abstractmethod
+    async def set(self, session_id: str, context: ChatContext):
+        """Lưu (ghi đè) context của session."""
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        """Xóa session nếu tồn tại."""
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """Các chỉ số để theo dõi (số session, số lần bị xóa do hết hạn/LRU, ...)."""
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Backend lưu trong process: OrderedDict theo thứ tự LRU, mỗi entry là (thời điểm hết hạn, SessionSnapshot đã serialize).
+    Lưu dạng bytes thay vì object Pydantic để đo được dung lượng và áp dụng ngân sách bộ nhớ.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_memory_bytes: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.max_memory_bytes = max_memory_bytes
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._evicted_expired = 0
+        self._evicted_lru = 0
+
+    def _remove(self, session_id: str):
+        _, payload = self._entries.pop(session_id)
+        self._memory_bytes -= len(payload)
+
+    def _evict(self, now: float):
+        # 1. Xóa các session đã hết hạn (các entry cũ nhất nằm ở đầu OrderedDict)
+        while self._entries:
+            oldest_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._remove(oldest_id)
+            self._evicted_expired += 1
+
+        # 2. Vượt giới hạn số lượng hoặc bộ nhớ -> xóa session ít được dùng nhất
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._memory_bytes > self.max_memory_bytes):
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+            self._evicted_lru += 1
+
+    async def get(self, session_id: str) -> Optional[ChatContext]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= now:
+                self._remove(session_id)
+                self._evicted_expired += 1
+                return None
+            # Gia hạn TTL và đưa về cuối hàng đợi LRU
+            self._entries[session_id] = (now + self.ttl_seconds, payload)
+            self._entries.move_to_end(session_id)
+        return _deserialize(payload)
+
+    async def set(self, session_id: str, context: ChatContext):
+        payload = _serialize(context)
+        now = time.time()
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+            self._entries[session_id] = (now + self.ttl_seconds, payload)
+            self._memory_bytes += len(payload)
+            self._evict(now)
+
+    async def delete(self, session_id: str):
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+
+    async def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "evicted_expired": self._evicted_expired,
+                "evicted_lru": self._evicted_lru,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Backend lưu vào một file SQLite dùng chung (chế độ WAL), cho phép nhiều worker uvicorn
+    cùng đọc/ghi một session_id. Mỗi thread giữ một kết nối riêng; các thao tác chạy trong
+    thread pool để không block event loop.
+    """
+
+    # Cứ sau bấy nhiêu lần ghi thì dọn các session hết hạn / vượt giới hạn một lần
+    CLEANUP_EVERY_N_WRITES = 200
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_sync(self, session_id: str) -> Optional[bytes]:
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT payload FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE sessions SET expires_at = ? WHERE session_id = ?", (now + self.ttl_seconds, session_id))
+        conn.commit()
+        return row[0]
+
+    def _set_sync(self, session_id: str, payload: bytes):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, payload, expires_at) VALUES (?, ?, ?)",
+            (session_id, payload, now + self.ttl_seconds),
+        )
+        conn.commit()
+
+        with self._writes_lock:
+            self._writes += 1
+            should_cleanup = self._writes % self.CLEANUP_EVERY_N_WRITES == 0
+        if should_cleanup:
+            self._cleanup_sync(now)
+
+    def _cleanup_sync(self, now: float):
+        conn = self._connection()
+        expired = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+        # Giữ lại tối đa max_entries session có hạn dùng xa nhất (tức là được dùng gần đây nhất)
+        overflow = conn.execute(
+            """
+            DELETE FROM sessions WHERE session_id IN (
+                SELECT session_id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        ).rowcount
+        conn.commit()
+        if expired or overflow:
+            logger.info(f"Đã dọn session store: {expired} session hết hạn, {overflow} session vượt giới hạn.")
+
+    def _delete_sync(self, session_id: str):
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    async def get(self, session_id: str) -> Optional[ChatContext]:
+        payload = await asyncio.to_thread(self._get_sync, session_id)
+        return None if payload is None else _deserialize(payload)
+
+    async def set(self, session_id: str, context: ChatContext):
+        await asyncio.to_thread(self._set_sync, session_id, _serialize(context))
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._delete_sync, session_id)
+
+    def _count_sync(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    async def stats(self) -> Dict[str, Any]:
+        count = await asyncio.to_thread(self._count_sync)
+        return {"backend": "sqlite", "sessions": count, "db_path": self.db_path}
+
+
+def create_session_store() -> SessionStore:
+    """Khởi tạo session store theo cấu hình SESSION_BACKEND."""
+    backend = settings.SESSION_BACKEND.lower()
+    if backend == "sqlite":
+        logger.info(f"Sử dụng session store SQLite tại: {settings.SESSION_DB_PATH}")
+        return SQLiteSessionStore(
+            db_path=settings.SESSION_DB_PATH,
+            ttl_seconds=settings.SESSION_TTL_SECONDS,
+            max_entries=settings.SESSION_MAX_ENTRIES,
+        )
+    if backend != "memory":
+        logger.warning(f"SESSION_BACKEND '{settings.SESSION_BACKEND}' không hợp lệ, dùng backend 'memory'.")
+    return InMemorySessionStore(
+        ttl_seconds=settings.SESSION_TTL_SECONDS,
+        max_entries=settings.SESSION_MAX_ENTRIES,
+        max_memory_bytes=int(settings.SESSION_MAX_MEMORY_MB * 1024 * 1024),
+    )
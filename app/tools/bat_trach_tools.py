@@ -1,10 +1,9 @@
 # app/tools/bat_trach_tools.py
 
-import pandas as pd
 import logging
 from typing import Optional, Dict, Any
 
-from app.database.connection import query_to_dataframe
+from app.database.knowledge_base import get_knowledge_base
 
 logger = logging.getLogger(__name__)
 
@@ -26,21 +25,13 @@ def get_bat_trach_info(cung_menh: str, huong_nha: str) -> Optional[Dict[str, Any
     cung_menh_normalized = cung_menh.strip().capitalize()
     huong_nha_normalized = huong_nha.strip().title()
 
-    sql_query = """
-        SELECT * 
-        FROM cung_menh_huong_rules 
-        WHERE cungmenh_giachu = :cung_menh AND huongnha = :huong_nha
-    """
-    params = {"cung_menh": cung_menh_normalized, "huong_nha": huong_nha_normalized}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        rule_info = get_knowledge_base().lookup("cung_menh_huong_rules", cung_menh_normalized, huong_nha_normalized)
+        if rule_info is None:
             logger.warning(
                 f"Không tìm thấy luật Bát Trạch cho Cung Mệnh '{cung_menh_normalized}' và Hướng nhà '{huong_nha_normalized}'.")
             return None
 
-        rule_info = result_df.to_dict('records')[0]
         logger.info(f"Tìm thấy cung Bát Trạch: {rule_info.get('tencungvi_taothanh')}") # ten_cung_vi_tao_thanh -> tencungvi_taothanh
         return rule_info
 
@@ -62,16 +53,12 @@ def get_cung_vi_detail(ten_cung_vi: str) -> Optional[Dict[str, Any]]:
     logger.info(f"Đang tra cứu chi tiết cho Cung Vị: {ten_cung_vi}")
     ten_cung_vi_normalized = ten_cung_vi.strip().title()
 
-    sql_query = "SELECT * FROM bat_trach_cung_vi WHERE tencung = :ten_cung"
-    params = {"ten_cung": ten_cung_vi_normalized}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        detail_info = get_knowledge_base().lookup("bat_trach_cung_vi", ten_cung_vi_normalized)
+        if detail_info is None:
             logger.warning(f"Không tìm thấy thông tin chi tiết cho Cung Vị '{ten_cung_vi_normalized}'.")
             return None
 
-        detail_info = result_df.to_dict('records')[0]
         logger.info(f"Đã lấy thông tin chi tiết thành công cho Cung Vị {ten_cung_vi_normalized}.")
         return detail_info
 
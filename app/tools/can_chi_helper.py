@@ -1,4 +1,5 @@
 import re
+import unicodedata
 from datetime import datetime
 from typing import List, Optional
 
@@ -69,6 +70,24 @@ def get_can_chi_from_year(year: int) -> Optional[str]:
     return f"{can} {chi}"
 
 
+def normalize_can_chi(text: str) -> Optional[str]:
+    """
+    Chuẩn hóa một chuỗi Can Chi về dạng chính tắc (ví dụ: "  bính   dần " -> "Bính Dần").
+    Chấp nhận cả tên gọi khác của Chi (ví dụ: "Giáp Tí" -> "Giáp Tý").
+    Trả về None nếu chuỗi không phải là một Can Chi hợp lệ.
+    """
+    if text is None:
+        return None
+    words = unicodedata.normalize("NFC", str(text)).split()
+    if len(words) != 2:
+        return None
+
+    can = words[0].title()
+    chi = ALIAS_TO_CON_GIAP.get(words[1].lower(), words[1].title())
+    can_chi = f"{can} {chi}"
+    return can_chi if can_chi in CAN_CHI_TO_YEARS else None
+
+
 def resolve_alias_to_year(alias: str | int) -> Optional[int]:
     """
     Cố gắng giải mã một alias thành MỘT năm sinh cụ thể.
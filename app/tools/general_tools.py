@@ -3,10 +3,22 @@
 import logging
 from typing import Optional, Dict, Any
 
-from app.database.connection import query_to_dataframe
+from app.database.connection import fetch_one, select_columns
+from app.database.knowledge_base import get_knowledge_base
 
 logger = logging.getLogger(__name__)
 
+# Các cột trả về cho workflow/LLM (bỏ các cột quản trị dữ liệu: file nguồn, version, lastupdated)
+VAT_PHAM_COLUMNS = (
+    "vatphamid", "tenvatpham", "tengoikhac", "loaivatpham", "hanhnguhanh_coban", "hanhnguhanh_theochatlieu",
+    "mota_truyenthuyet", "congdung_keywords", "congdungchinh_so1", "congdungphu_so2", "diengiai_congdung_tailoc",
+    "diengiai_congdung_hoasat", "phuhop_voi_menh_nao", "phuhop_voi_tuoi_nao", "vitridat_uutien",
+    "cungvi_dat_hopnhat", "huongdat_yeucau", "vitri_cantranh", "diengiai_vitridat", "luuy_khaiquang",
+    "luuy_camky_quantrong", "goiy_kethop_vatpham", "keywords_search",
+)
+VAT_PHAM_BY_NAME_SQL = select_columns("vat_pham_phong_thuy", VAT_PHAM_COLUMNS, "tenvatpham = :ten_vat_pham")
+VAT_PHAM_BY_KEYWORD_SQL = select_columns("vat_pham_phong_thuy", VAT_PHAM_COLUMNS, "tenvatpham LIKE :keyword")
+
 
 def get_huong_info(ten_huong: str) -> Optional[Dict[str, Any]]:
     """
@@ -21,16 +33,12 @@ def get_huong_info(ten_huong: str) -> Optional[Dict[str, Any]]:
     logger.info(f"Đang tra cứu thông tin cho Hướng: {ten_huong}")
     huong_normalized = ten_huong.strip().title()
 
-    sql_query = "SELECT * FROM huong WHERE tenhuong = :ten_huong"
-    params = {"ten_huong": huong_normalized}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        huong_info = get_knowledge_base().lookup("huong", huong_normalized)
+        if huong_info is None:
             logger.warning(f"Không tìm thấy thông tin cho Hướng '{huong_normalized}'.")
             return None
 
-        huong_info = result_df.to_dict('records')[0]
         logger.info(f"Đã lấy thông tin thành công cho Hướng {huong_normalized}.")
         return huong_info
 
@@ -51,23 +59,22 @@ def get_vat_pham_info(keyword: str = None, ten_vat_pham: str = None) -> Optional
     if ten_vat_pham:
         # --- Ưu tiên tìm kiếm chính xác theo tên ---
         logger.info(f"Đang tra cứu vật phẩm theo tên chính xác: '{ten_vat_pham}'")
-        sql_query = "SELECT * FROM vat_pham_phong_thuy WHERE tenvatpham = :ten_vat_pham"
+        sql_query = VAT_PHAM_BY_NAME_SQL
         params = {"ten_vat_pham": ten_vat_pham.strip().title()}
     else:
         # --- Phương án dự phòng: tìm kiếm tương đối theo keyword ---
         logger.info(f"Đang tra cứu vật phẩm theo keyword (LIKE): '{keyword}'")
         # Tìm kiếm linh hoạt hơn, ví dụ người dùng gõ "ty huu" vẫn ra "Tỳ Hưu"
-        sql_query = "SELECT * FROM vat_pham_phong_thuy WHERE tenvatpham LIKE :keyword"
+        sql_query = VAT_PHAM_BY_KEYWORD_SQL
         params = {"keyword": f"%{keyword.strip().title()}%"}
 
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        # Trả về kết quả đầu tiên tìm được
+        vat_pham_info = fetch_one(sql_query, params)
+        if vat_pham_info is None:
             logger.warning(f"Không tìm thấy thông tin vật phẩm với params: {params}.")
             return None
 
-        # Trả về kết quả đầu tiên tìm được
-        vat_pham_info = result_df.to_dict('records')[0]
         logger.info(f"Đã lấy thông tin thành công cho vật phẩm: {vat_pham_info.get('tenvatpham')}")
         return vat_pham_info
 
@@ -83,16 +90,12 @@ def get_phi_tinh_info(nam: int) -> Optional[Dict[str, Any]]:
     # ... (Giữ nguyên code của hàm này)
     logger.info(f"Đang tra cứu Phi tinh cho năm: {nam}")
 
-    sql_query = "SELECT * FROM phi_tinh_luu_nien WHERE nam_duonglich = :nam"
-    params = {"nam": nam}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        phi_tinh_info = get_knowledge_base().lookup("phi_tinh_luu_nien", nam)
+        if phi_tinh_info is None:
             logger.warning(f"Không tìm thấy thông tin Phi tinh cho năm {nam}.")
             return None
 
-        phi_tinh_info = result_df.to_dict('records')[0]
         logger.info(f"Đã lấy thông tin Phi tinh thành công cho năm {nam}.")
         return phi_tinh_info
 
@@ -3,10 +3,30 @@
 import logging
 from typing import Optional, Dict, Any, List
 
-from app.database.connection import query_to_dataframe
+from app.database.connection import fetch_one, select_columns
 
 logger = logging.getLogger(__name__)
 
+# Các cột trả về cho workflow/LLM (bỏ các cột quản trị dữ liệu: file nguồn, version, lastupdated)
+THE_DAT_COLUMNS = (
+    "thedatid", "tenthedat", "tengoi_thongdung", "loaithedat", "mota_nhandien", "keywords_nhandien",
+    "hinhanh_minhhoa_url", "mucdo_cattuong", "diemso_catkhi", "tacdong_tichcuc_keywords", "linhvuc_vuongphat_chinh",
+    "diengiai_tacdong", "doituong_huongloi_manhnhat", "dieukien_dephathuy", "nguyentac_kichhoat",
+    "giaiphap_kichhoat_1", "diengiai_giaiphap_1", "giaiphap_kichhoat_2", "diengiai_giaiphap_2",
+    "giaiphap_kichhoat_3", "diengiai_giaiphap_3", "luuy_khikichhoat",
+)
+SAT_KHI_COLUMNS = (
+    "satkhiid", "tensatkhi", "tengoi_thongdung", "loaisatkhi", "mota_nhandien", "keywords_nhandien",
+    "hinhanh_minhhoa_url", "mucdo_nguyhiem", "diemso_satkhi", "tacdong_tieucuc_keywords", "linhvuc_anhhuong_chinh",
+    "diengiai_tacdong", "doituong_bianhhuong_manhnhat", "nguyentac_hoagiai_chung", "giaiphap_uutien_1",
+    "diengiai_giaiphap_1", "giaiphap_uutien_2", "diengiai_giaiphap_2", "giaiphap_uutien_3", "diengiai_giaiphap_3",
+    "vatpham_hoagiai_dexuat", "luuy_khihoagiai",
+)
+THE_DAT_BY_NAME_SQL = select_columns("loan_dau_cat_tuong", THE_DAT_COLUMNS, "tenthedat = :ten_the_dat")
+THE_DAT_BY_KEYWORD_SQL = select_columns("loan_dau_cat_tuong", THE_DAT_COLUMNS, "keywords_nhandien LIKE :keyword")
+SAT_KHI_BY_NAME_SQL = select_columns("ngoai_canh_sat_khi", SAT_KHI_COLUMNS, "tensatkhi = :ten_sat_khi")
+SAT_KHI_BY_KEYWORD_SQL = select_columns("ngoai_canh_sat_khi", SAT_KHI_COLUMNS, "keywords_nhandien LIKE :keyword")
+
 
 def get_the_dat_cat_tuong_info(keyword: str = None, ten_the_dat: str = None) -> Optional[Dict[str, Any]]:
     """
@@ -21,22 +41,21 @@ def get_the_dat_cat_tuong_info(keyword: str = None, ten_the_dat: str = None) ->
     logger.info(f"Đang tra cứu Thế đất Cát tường với keyword: '{keyword}'")
 
     if ten_the_dat:
-        sql_query = "SELECT * FROM loan_dau_cat_tuong WHERE tenthedat = :ten_the_dat"
+        sql_query = THE_DAT_BY_NAME_SQL
         params = {"ten_the_dat": ten_the_dat}
     elif keyword:
-        sql_query = "SELECT * FROM loan_dau_cat_tuong WHERE keywords_nhandien LIKE :keyword"
+        sql_query = THE_DAT_BY_KEYWORD_SQL
         params = {"keyword": f"%{keyword}%"}
     else:
         return None
 
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        # Trả về kết quả đầu tiên tìm thấy
+        the_dat_info = fetch_one(sql_query, params)
+        if the_dat_info is None:
             logger.warning(f"Không tìm thấy Thế đất Cát tường nào khớp với '{keyword}'.")
             return None
 
-        # Trả về kết quả đầu tiên tìm thấy
-        the_dat_info = result_df.to_dict('records')[0]
         logger.info(f"Tìm thấy Thế đất Cát tường: {the_dat_info.get('tenthedat')}")
         return the_dat_info
 
@@ -58,21 +77,20 @@ def get_sat_khi_info(keyword: str = None, ten_sat_khi: str = None) -> Optional[D
     logger.info(f"Đang tra cứu Sát khí với keyword: '{keyword}'")
 
     if ten_sat_khi:
-        sql_query = "SELECT * FROM ngoai_canh_sat_khi WHERE tensatkhi = :ten_sat_khi"
+        sql_query = SAT_KHI_BY_NAME_SQL
         params = {"ten_sat_khi": ten_sat_khi}
     elif keyword:
-        sql_query = "SELECT * FROM ngoai_canh_sat_khi WHERE keywords_nhandien LIKE :keyword"
+        sql_query = SAT_KHI_BY_KEYWORD_SQL
         params = {"keyword": f"%{keyword}%"}
     else:
         return None
 
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        sat_khi_info = fetch_one(sql_query, params)
+        if sat_khi_info is None:
             logger.warning(f"Không tìm thấy Sát khí nào khớp với '{keyword}'.")
             return None
 
-        sat_khi_info = result_df.to_dict('records')[0]
         logger.info(f"Tìm thấy Sát khí: {sat_khi_info.get('tensatkhi')}")
         return sat_khi_info
 
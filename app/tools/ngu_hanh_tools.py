@@ -1,11 +1,10 @@
 # app/tools/ngu_hanh_tools.py
 
-import pandas as pd
 import logging
 from typing import Optional, Dict, Any
 
-# Import hàm query tiện ích từ module database
-from app.database.connection import query_to_dataframe
+# Tra cứu trong knowledge base đã được nạp sẵn vào bộ nhớ
+from app.database.knowledge_base import get_knowledge_base
 from app.tools import can_chi_helper
 
 logger = logging.getLogger(__name__)
@@ -28,24 +27,14 @@ def get_cung_menh_by_year_gender(nam_sinh: int, gioi_tinh: str) -> Optional[Dict
     # Chuẩn hóa đầu vào giới tính để khớp với dữ liệu trong CSDL
     gioi_tinh_normalized = gioi_tinh.strip().capitalize()
 
-    # Câu lệnh SQL an toàn với tham số hóa
-    sql_query = """
-            SELECT * 
-            FROM cung_menh_lookup 
-            WHERE namsinh_amlich = :nam_sinh AND gioitinh = :gioi_tinh
-        """
-    params = {"nam_sinh": nam_sinh, "gioi_tinh": gioi_tinh.strip().capitalize()}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
+        # Tra cứu O(1) theo khóa (namsinh_amlich, gioitinh)
+        cung_menh_info = get_knowledge_base().lookup("cung_menh_lookup", nam_sinh, gioi_tinh_normalized)
 
-        if result_df.empty:
+        if cung_menh_info is None:
             logger.warning(f"Không tìm thấy Cung Mệnh cho năm sinh {nam_sinh}, giới tính {gioi_tinh_normalized}.")
             return None
 
-        # Chuyển dòng đầu tiên của DataFrame thành một dictionary
-        # to_dict('records') trả về một list, ta lấy phần tử đầu tiên
-        cung_menh_info = result_df.to_dict('records')[0]
         logger.info(f"Tìm thấy Cung Mệnh: {cung_menh_info.get('cungmenh')}")
         return cung_menh_info
 
@@ -67,16 +56,12 @@ def get_menh_info(menh: str) -> Optional[Dict[str, Any]]:
     logger.info(f"Đang tra cứu thông tin cho Mệnh: {menh}")
     menh_normalized = menh.strip().capitalize()
 
-    sql_query = "SELECT * FROM menh WHERE tenmenh = :menh"
-    params = {"menh": menh.strip().capitalize()}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        menh_info = get_knowledge_base().lookup("menh", menh_normalized)
+        if menh_info is None:
             logger.warning(f"Không tìm thấy thông tin cho Mệnh '{menh_normalized}'.")
             return None
 
-        menh_info = result_df.to_dict('records')[0]
         logger.info(f"Đã lấy thông tin thành công cho Mệnh {menh_normalized}.")
         return menh_info
 
@@ -88,8 +73,8 @@ def get_menh_info(menh: str) -> Optional[Dict[str, Any]]:
 def get_nap_am_info(nam_sinh: int) -> Optional[Dict[str, Any]]:
         """
         Tra cứu Nạp Âm và Mệnh Ngũ Hành từ bảng 'nap_am' dựa trên năm sinh.
-        Lưu ý: Bảng này có thể cần được thiết kế lại tốt hơn, hiện tại đang giả định
-        bảng `nap_am` có cột `cac_nam_sinh_vi_du` chứa các năm.
+        Năm sinh được quy đổi sang Can Chi, rồi tra cứu chính xác qua bảng ánh xạ
+        'nap_am_can_chi' (được tạo bởi scripts/preprocess_data.py).
 
         Args:
             nam_sinh: Năm sinh âm lịch.
@@ -105,17 +90,19 @@ def get_nap_am_info(nam_sinh: int) -> Optional[Dict[str, Any]]:
             return None
         logger.info(f"Năm {nam_sinh} tương ứng với Can Chi: '{can_chi}'")
 
-        sql_query = "SELECT * FROM nap_am WHERE canchi_tuongung LIKE :can_chi_pattern"
-        params = {"can_chi_pattern": f"%{can_chi}%"}
-
         try:
-            result_df = query_to_dataframe(sql_query, params)
-            if result_df.empty:
+            # Tra cứu chính xác theo khóa Can Chi, sau đó lấy dòng Nạp Âm theo napamid
+            knowledge_base = get_knowledge_base()
+            mapping = knowledge_base.lookup("nap_am_can_chi", can_chi)
+            if mapping is None:
                 logger.warning(f"Không tìm thấy Nạp Âm nào tương ứng với Can Chi '{can_chi}' trong CSDL.")
                 return None
 
-            # Trả về kết quả đầu tiên tìm được (chắc chắn chỉ có 1)
-            nap_am_info = result_df.to_dict('records')[0]
+            nap_am_info = knowledge_base.lookup("nap_am", mapping.get('napamid'))
+            if nap_am_info is None:
+                logger.warning(f"Không tìm thấy dòng Nạp Âm napamid={mapping.get('napamid')} cho Can Chi '{can_chi}'.")
+                return None
+
             logger.info(f"Tìm thấy Nạp Âm: {nap_am_info.get('tennapam')}")
             return nap_am_info
 
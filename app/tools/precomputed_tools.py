@@ -0,0 +1,129 @@
+# app/tools/precomputed_tools.py
+
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.database.knowledge_base import KnowledgeBase, get_knowledge_base
+from app.tools import bat_trach_tools, general_tools, ngu_hanh_tools, tuong_tac_tools
+
+logger = logging.getLogger(__name__)
+
+# --- Câu trả lời dựng sẵn cho ANALYZE_HOUSE và COMPARE_PEOPLE ---
+# Không gian đầu vào của hai workflow này hữu hạn (năm sinh x giới tính x hướng nhà, cặp Nạp Âm), nên
+# scripts/preprocess_data.py chạy trước chuỗi tra cứu của workflow cho mọi tổ hợp (bằng chính các tool bên dưới,
+# trên database vừa dựng) và lưu kết quả đã ghép sẵn thành các bảng answer_* (payload JSON).
+# Khi phục vụ, workflow chỉ cần một lần tra cứu theo khóa; khóa không có trong bảng -> quay về chuỗi tra cứu từng bước.
+PERSON_TABLE = "answer_person"
+HOUSE_TABLE = "answer_analyze_house"
+NAP_AM_PAIR_TABLE = "answer_nap_am_pair"
+
+
+def build_person_answer(nam_sinh: int, gioi_tinh: str) -> Optional[Dict[str, Any]]:
+    """Thông tin bản mệnh của một người, như các bước Cung Mệnh / Mệnh / Nạp Âm của workflow (None nếu không có Cung Mệnh)."""
+    cung_menh_info = ngu_hanh_tools.get_cung_menh_by_year_gender(nam_sinh, gioi_tinh)
+    if cung_menh_info is None:
+        return None
+    answer = {"cung_menh_info": cung_menh_info}
+    # Giống params_if của workflow: bước thiếu tham số bị bỏ qua (không có key), bước đã gọi thì giữ cả kết quả None
+    if cung_menh_info.get('hanhcungmenh'):
+        answer["menh_ngu_hanh_info"] = ngu_hanh_tools.get_menh_info(cung_menh_info['hanhcungmenh'])
+    answer["nap_am_info"] = ngu_hanh_tools.get_nap_am_info(nam_sinh)
+    return answer
+
+
+def build_house_answer(person: Dict[str, Any], huong_nha: str) -> Dict[str, Any]:
+    """Ghép thông tin bản mệnh với các bước Bát Trạch và tương tác Mệnh - Hướng của AnalyzeHouseWorkflow."""
+    answer = dict(person)
+    cung_menh_info = person["cung_menh_info"]
+    if cung_menh_info.get('cungmenh') and huong_nha:
+        rule_info = bat_trach_tools.get_bat_trach_info(cung_menh_info['cungmenh'], huong_nha)
+        answer["bat_trach_rule_info"] = rule_info
+        if rule_info is not None and rule_info.get('tencungvi_taothanh'):
+            answer["bat_trach_detail_info"] = bat_trach_tools.get_cung_vi_detail(rule_info['tencungvi_taothanh'])
+    if cung_menh_info.get('hanhcungmenh') and huong_nha:
+        answer["menh_huong_interaction_info"] = tuong_tac_tools.get_menh_huong_interaction(
+            cung_menh_info['hanhcungmenh'], huong_nha)
+    return answer
+
+
+def materialize_answer_tables(knowledge_base: KnowledgeBase) -> Dict[str, Tuple[List[str], List[tuple]]]:
+    """
+    Dựng các bảng câu trả lời cho toàn bộ không gian đầu vào có trong dữ liệu: mọi (năm sinh, giới tính) của
+    'cung_menh_lookup' x mọi hướng nhà có trong luật Bát Trạch / Mệnh - Hướng, và mọi cặp (có thứ tự) tên Nạp Âm.
+    Các tool phải đang tra cứu trên knowledge_base (xem use_knowledge_base). Trả về {bảng: (cột, các dòng)}.
+    """
+    directions = sorted({key[1] for name in ("cung_menh_huong_rules", "menh_huong_rules")
+                         for key in knowledge_base.table(name).keys() if key[1]})
+
+    person_rows, house_rows = [], []
+    for nam_sinh, gioi_tinh in knowledge_base.table("cung_menh_lookup").keys():
+        person = build_person_answer(nam_sinh, gioi_tinh)
+        if person is None:
+            continue
+        person_rows.append((nam_sinh, gioi_tinh, json.dumps(person, ensure_ascii=False)))
+        for huong_nha in directions:
+            house_rows.append((nam_sinh, gioi_tinh, huong_nha,
+                               json.dumps(build_house_answer(person, huong_nha), ensure_ascii=False)))
+
+    nap_am_names = list(dict.fromkeys(row['tennapam'] for row in knowledge_base.table("nap_am").rows() if row['tennapam']))
+    pair_rows = [
+        (nap_am1, nap_am2, json.dumps(tuong_tac_tools.get_menh_menh_interaction(nap_am1, nap_am2), ensure_ascii=False))
+        for nap_am1 in nap_am_names for nap_am2 in nap_am_names
+    ]
+    return {
+        PERSON_TABLE: (["namsinh_amlich", "gioitinh", "payload"], person_rows),
+        HOUSE_TABLE: (["namsinh_amlich", "gioitinh", "huongnha", "payload"], house_rows),
+        NAP_AM_PAIR_TABLE: (["napam1", "napam2", "payload"], pair_rows),
+    }
+
+
+def _lookup_answer(table_name: str, *key: Any) -> Optional[Dict[str, Any]]:
+    table = get_knowledge_base().table(table_name)
+    if table is None:
+        logger.info(f"Bảng câu trả lời '{table_name}' chưa được dựng, dùng chuỗi tra cứu từng bước.")
+        return None
+    row = table.get(*key)
+    return None if row is None else {"payload": json.loads(row['payload'])}
+
+
+def get_house_analysis(nam_sinh: int, gioi_tinh: str, huong_nha: str, nam: int) -> Optional[Dict[str, Any]]:
+    """
+    Kết quả dựng sẵn của AnalyzeHouseWorkflow cho (năm sinh, giới tính, hướng nhà), kèm Phi tinh của năm `nam`
+    (phụ thuộc năm hiện tại nên không dựng sẵn). None nếu tổ hợp không có trong bảng câu trả lời.
+    """
+    logger.info(f"Đang tra cứu phân tích nhà dựng sẵn cho: {nam_sinh}, {gioi_tinh}, {huong_nha}")
+    answer = _lookup_answer(HOUSE_TABLE, nam_sinh, gioi_tinh.strip().capitalize(), huong_nha.strip().title())
+    if answer is None:
+        return None
+    results = answer["payload"]
+    results["phi_tinh_info"] = general_tools.get_phi_tinh_info(nam)
+    return results
+
+
+def get_people_comparison(nam_sinh_1: int, gioi_tinh_1: str, nam_sinh_2: int, gioi_tinh_2: str) -> Optional[Dict[str, Any]]:
+    """
+    Kết quả dựng sẵn của ComparePeopleWorkflow: bản mệnh của hai người và tương tác Nạp Âm (ma trận cặp Nạp Âm).
+    None nếu một trong hai người không có trong bảng câu trả lời.
+    """
+    logger.info(f"Đang tra cứu so sánh dựng sẵn cho: {nam_sinh_1} ({gioi_tinh_1}) và {nam_sinh_2} ({gioi_tinh_2})")
+    person_1 = _lookup_answer(PERSON_TABLE, nam_sinh_1, gioi_tinh_1.strip().capitalize())
+    person_2 = _lookup_answer(PERSON_TABLE, nam_sinh_2, gioi_tinh_2.strip().capitalize())
+    if person_1 is None or person_2 is None:
+        return None
+    person_1, person_2 = person_1["payload"], person_2["payload"]
+
+    results = {
+        "cung_menh_info": person_1["cung_menh_info"],
+        "nap_am_info": person_1["nap_am_info"],
+        "cung_menh_info_2": person_2["cung_menh_info"],
+        "nap_am_info_2": person_2["nap_am_info"],
+    }
+    nap_am_1 = (person_1["nap_am_info"] or {}).get('tennapam')
+    nap_am_2 = (person_2["nap_am_info"] or {}).get('tennapam')
+    if nap_am_1 and nap_am_2:
+        pair = _lookup_answer(NAP_AM_PAIR_TABLE, nap_am_1, nap_am_2)
+        if pair is None:
+            return None
+        results["menh_menh_interaction_info"] = pair["payload"]
+    return results
@@ -1,18 +1,13 @@
+import json
 import logging
 from typing import List, Dict, Any, Optional
-from groq import Groq
-from app.core.config import settings
+from app.core.executors import run_sync_tool
+from app.services import llm_client
 
 logger = logging.getLogger(__name__)
 
-try:
-    groq_client = Groq(api_key=settings.GROQ_API_KEY)
-except Exception as e:
-    logger.error(f"Không thể khởi tạo Groq client cho reranker: {e}")
-    groq_client = None
-
 # Cần truy vấn CSDL để lấy mô tả chi tiết cho các ứng viên
-from app.database.connection import query_to_dataframe
+from app.database.connection import fetch_one
 
 
 def _get_details_for_reranking(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -22,16 +17,15 @@ def _get_details_for_reranking(candidates: List[Dict[str, Any]]) -> List[Dict[st
         name = candidate.get('name')
         item_type = candidate.get('type')
         description = ""
+        row = None
         if item_type == 'sat_khi':
-            df = query_to_dataframe("SELECT mota_nhandien FROM ngoai_canh_sat_khi WHERE tensatkhi = :name",
-                                    params={'name': name})
-            if not df.empty:
-                description = df.iloc[0]['mota_nhandien']
+            row = fetch_one("SELECT mota_nhandien FROM ngoai_canh_sat_khi WHERE tensatkhi = :name",
+                            params={'name': name}, mappings=False)
         elif item_type == 'the_dat':
-            df = query_to_dataframe("SELECT mota_nhandien FROM loan_dau_cat_tuong WHERE tenthedat = :name",
-                                    params={'name': name})
-            if not df.empty:
-                description = df.iloc[0]['mota_nhandien']
+            row = fetch_one("SELECT mota_nhandien FROM loan_dau_cat_tuong WHERE tenthedat = :name",
+                            params={'name': name}, mappings=False)
+        if row is not None:
+            description = row.mota_nhandien
 
         detailed_candidates.append({
             "name": name,
@@ -41,15 +35,15 @@ def _get_details_for_reranking(candidates: List[Dict[str, Any]]) -> List[Dict[st
     return detailed_candidates
 
 
-def choose_best_loandau_candidate(user_query: str, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+async def choose_best_loandau_candidate(user_query: str, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     """
     Sử dụng LLM để chọn ra ứng viên phù hợp nhất từ một danh sách.
     """
-    if not groq_client or not candidates:
+    if not llm_client.is_available() or not candidates:
         return None
 
-    # Lấy thêm mô tả chi tiết cho từng ứng viên
-    detailed_candidates = _get_details_for_reranking(candidates)
+    # Lấy thêm mô tả chi tiết cho từng ứng viên (truy vấn CSDL đồng bộ -> chạy trong thread pool của tool)
+    detailed_candidates, _, _ = await run_sync_tool(_get_details_for_reranking, candidates=candidates)
 
     # Xây dựng prompt
     prompt = f"""
@@ -67,14 +61,11 @@ def choose_best_loandau_candidate(user_query: str, candidates: List[Dict[str, An
 
     try:
         logger.info("Gửi yêu cầu re-ranking đến LLM...")
-        chat_completion = groq_client.chat.completions.create(
+        response_str = await llm_client.chat_completion(
             messages=[{"role": "user", "content": prompt}],
-            model="gemma2-9b-it",
             temperature=0,
             response_format={"type": "json_object"},
         )
-        response_str = chat_completion.choices[0].message.content
-        import json
         best_choice_name = json.loads(response_str).get("best_choice")
 
         logger.info(f"LLM đã chọn: '{best_choice_name}'")
@@ -1,107 +1,225 @@
-import faiss
-import pickle
-import os
+import asyncio
 import logging
-from sentence_transformers import SentenceTransformer
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+from app.core.cache import TieredCache, make_cache_key, normalize_query_text
+from app.core.config import settings
+from app.core.executors import EMBEDDING_EXECUTOR
+from app.core.lazy_resource import LazyResource
+from app.database.generations import DataGeneration, generation_manager
+from app.database.vector_store import Filters, VectorStore
+from app.services.embedding_service import EmbeddingService
+from app.services.encoder_backends import MODEL_NAME, load_encoder, resolve_backend
 
 logger = logging.getLogger(__name__)
 
-# --- Cấu hình và tải tài nguyên một lần khi module được import ---
-# Điều này đảm bảo các file lớn chỉ được load vào bộ nhớ một lần.
+# --- Cache hai tầng cho semantic search ---
+# 1. Câu query đã chuẩn hóa -> vector embedding: bỏ qua hoàn toàn lượt forward của transformer.
+# 2. (collection, phiên bản collection, query, tham số tìm kiếm) -> kết quả: bỏ qua cả bước tìm kiếm FAISS.
+# Phiên bản collection nằm trong khóa nên khi file index được build lại, các kết quả cũ tự mất hiệu lực;
+# khi đổi thế hệ dữ liệu, cache kết quả được xóa luôn để giải phóng các mục không bao giờ được dùng lại.
+query_embedding_cache: Optional[TieredCache] = None
+search_result_cache: Optional[TieredCache] = None
+if settings.SEMANTIC_CACHE_ENABLED:
+    query_embedding_cache = TieredCache("query_embedding", max_entries=settings.SEMANTIC_EMBEDDING_CACHE_MAX_ENTRIES)
+    search_result_cache = TieredCache("semantic_search", max_entries=settings.SEMANTIC_RESULT_CACHE_MAX_ENTRIES)
+
+
+def invalidate_semantic_caches():
+    """Xóa toàn bộ cache embedding và kết quả tìm kiếm (ví dụ sau khi đổi model)."""
+    for cache in (query_embedding_cache, search_result_cache):
+        if cache is not None:
+            cache.clear()
+
+
+def _on_generation_swap(previous: Optional[DataGeneration], current: DataGeneration):
+    if search_result_cache is not None:
+        search_result_cache.clear()
 
-# Biến toàn cục để giữ các tài nguyên đã tải
-loandau_index = None
-loandau_info = None
-item_index = None
-item_info = None
-model = None
 
-# Cờ để kiểm tra trạng thái tải
-LOANDAU_RESOURCES_LOADED = False
-ITEM_RESOURCES_LOADED = False
+generation_manager.register_swap_listener(_on_generation_swap)
 
-try:
-    # --- Tải mô hình chung ---
-    PROCESSED_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed')
-    MODEL_NAME = 'bkai-foundation-models/vietnamese-bi-encoder'
 
-    logger.info(f"Đang tải mô hình Sentence Transformer chung: '{MODEL_NAME}'...")
-    model = SentenceTransformer(MODEL_NAME)
+# --- Tài nguyên được nạp lười (lazy) ở nền ---
+# Import module này không còn tải mô hình hay index: mọi process/script import workflow_manager
+# đều khởi động ngay. main.py gọi start_background_loading() lúc startup để làm nóng trước;
+# các tool semantic search sẽ chờ (await) đến khi tài nguyên sẵn sàng.
+# Backend encoder được chốt một lần lúc import (quay về "torch" nếu thiếu thư viện của backend ONNX),
+# để encoder không nạp thất bại lặp lại vì thiếu thư viện và khóa cache embedding khớp với backend thực dùng.
+EMBEDDING_BACKEND = resolve_backend(settings.EMBEDDING_BACKEND)
+
+
+def _load_encoder() -> EmbeddingService:
+    logger.info(f"Đang tải mô hình Sentence Transformer chung: '{MODEL_NAME}' (backend: {EMBEDDING_BACKEND})...")
+    model = load_encoder(
+        EMBEDDING_BACKEND,
+        onnx_dir=settings.EMBEDDING_ONNX_DIR,
+        onnx_quantization=settings.EMBEDDING_ONNX_QUANTIZATION,
+    )
     logger.info("Tải mô hình chung thành công!")
 
-    # --- Tải tài nguyên cho Loan Đầu ---
-    try:
-        logger.info("Đang tải tài nguyên Semantic Search cho Loan Đầu...")
-        loandau_index_path = os.path.join(PROCESSED_DATA_DIR, 'loandau.index')
-        loandau_info_path = os.path.join(PROCESSED_DATA_DIR, 'loandau_info.pkl')
-
-        loandau_index = faiss.read_index(loandau_index_path)
-        with open(loandau_info_path, 'rb') as f:
-            loandau_info = pickle.load(f)
-
-        LOANDAU_RESOURCES_LOADED = True
-        logger.info("Tải tài nguyên Loan Đầu thành công!")
-    except FileNotFoundError:
-        logger.warning(
-            "Không tìm thấy file index/info cho Loan Đầu. Tool 'find_most_similar_loandau' sẽ không hoạt động.")
-    except Exception as e:
-        logger.error(f"Lỗi khi tải tài nguyên Loan Đầu: {e}")
+    # Các câu query đồng thời được gom lô trước khi gọi model.encode (xem app/services/embedding_service.py)
+    return EmbeddingService(
+        model,
+        executor=EMBEDDING_EXECUTOR,
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+    )
 
-    # --- Tải tài nguyên cho Vật Phẩm ---
-    try:
-        logger.info("Đang tải tài nguyên Semantic Search cho Vật Phẩm...")
-        item_index_path = os.path.join(PROCESSED_DATA_DIR, 'item.index')
-        item_info_path = os.path.join(PROCESSED_DATA_DIR, 'item_info.pkl')
-
-        item_index = faiss.read_index(item_index_path)
-        with open(item_info_path, 'rb') as f:
-            item_info = pickle.load(f)
-
-        ITEM_RESOURCES_LOADED = True
-        logger.info("Tải tài nguyên Vật Phẩm thành công!")
-    except FileNotFoundError:
-        logger.warning("Không tìm thấy file index/info cho Vật Phẩm. Tool 'find_most_similar_item' sẽ không hoạt động.")
-        logger.warning("Vui lòng chạy script 'scripts/create_item_embeddings.py' trước.")
-    except Exception as e:
-        logger.error(f"Lỗi khi tải tài nguyên Vật Phẩm: {e}")
 
-except Exception as e:
-    logger.error(
-        f"LỖI NGHIÊM TRỌNG: Không thể tải mô hình embedding chính. Các tool semantic search sẽ thất bại. Lỗi: {e}")
+encoder_resource: LazyResource[EmbeddingService] = LazyResource("embedding_model", _load_encoder)
 
 
-def find_most_similar_loandau(query: str, k: int = 3, similarity_threshold: float = 0.5) -> List[Dict[str, Any]]:
+def vector_store_resource() -> LazyResource[VectorStore]:
     """
-    Tìm kiếm Top K Sát Khí hoặc Thế Đất Cát Tường tương đồng nhất.
+    Vector store (mọi collection loandau, item, ... xem app/database/vector_store.py) của thế hệ dữ liệu
+    mà request hiện tại đang dùng; được dựng lại cùng SQLite khi nạp lại dữ liệu (app/database/generations.py).
+    """
+    return generation_manager.active().vector_store
+
+
+def semantic_resources() -> Tuple[LazyResource, ...]:
+    return encoder_resource, vector_store_resource()
+
+
+def start_background_loading():
     """
-    if not LOANDAU_RESOURCES_LOADED or model is None:
-        logger.error("Tài nguyên Loan Đầu chưa được tải, không thể thực hiện tìm kiếm.")
-        return []
+    Bắt đầu nạp mô hình và các index ở nền. Bản thân hàm này nạp thế hệ dữ liệu đầu tiên
+    (knowledge base) nếu chưa có, nên được gọi qua asyncio.to_thread lúc khởi động.
+    """
+    encoder_resource.start()
+    vector_store_resource().start()
 
-    logger.info(f"Đang thực hiện semantic search (Loan Đầu) cho query: '{query}' với K={k}")
 
-    query_embedding = model.encode(query, convert_to_numpy=True).reshape(1, -1)
-    faiss.normalize_L2(query_embedding)
+def readiness() -> Dict[str, Dict[str, Any]]:
+    resources = semantic_resources()
+    for resource in resources:
+        resource.start()  # Tài nguyên nạp thất bại được thử lại khi hết thời gian chờ, kể cả khi chưa có request
+    return {resource.name: resource.status() for resource in resources}
 
-    # Tìm kiếm K kết quả gần nhất
-    similarity_scores, indices = loandau_index.search(query_embedding, k=k)
 
-    results = []
-    for i in range(k):
-        idx = indices[0][i]
-        similarity = similarity_scores[0][i]
+async def _acquire(resource: LazyResource):
+    """Chờ một tài nguyên sẵn sàng (tối đa SEMANTIC_READY_TIMEOUT_SECONDS). Trả về None nếu thất bại."""
+    try:
+        return await resource.aget(timeout=settings.SEMANTIC_READY_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.error(f"Tài nguyên '{resource.name}' chưa sẵn sàng sau {settings.SEMANTIC_READY_TIMEOUT_SECONDS}s.")
+    except Exception as e:
+        logger.error(f"Tài nguyên '{resource.name}' không khả dụng: {e}")
+    return None
 
-        if similarity >= similarity_threshold:
-            match_info = loandau_info[idx].copy()
-            match_info['similarity_score'] = float(similarity)
-            results.append(match_info)
-            logger.info(f"  - Tìm thấy ứng viên: {match_info['name']} (Score: {similarity:.2f})")
 
+async def _embed_queries(queries: List[str]) -> Optional[np.ndarray]:
+    """
+    Embedding (đã chuẩn hóa L2) của các câu query dưới dạng ma trận (n, dim) để đưa vào FAISS.
+    Các câu chưa có trong cache được gửi đồng thời vào EmbeddingService nên được gom chung một lô.
+    Trả về None nếu không có mô hình.
+    """
+    # Dạng chuẩn hóa chỉ dùng làm khóa cache; mô hình (phân biệt hoa/thường) luôn nhận câu query gốc.
+    # Vector của các backend khác nhau (FP32/int8) không hoàn toàn giống nhau nên backend là một phần của khóa
+    cache_keys = [make_cache_key(MODEL_NAME, EMBEDDING_BACKEND, normalize_query_text(query)) for query in queries]
+    embeddings = [query_embedding_cache.get(key) if query_embedding_cache is not None else None for key in cache_keys]
+
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        embedding_service = await _acquire(encoder_resource)
+        if embedding_service is None:
+            return None
+        encoded = await asyncio.gather(*(embedding_service.encode(queries[i]) for i in missing))
+        for i, embedding in zip(missing, encoded):
+            embeddings[i] = embedding
+            if query_embedding_cache is not None:
+                query_embedding_cache.set(cache_keys[i], embedding)
+    return np.vstack(embeddings)
+
+
+def _result_cache_key(collection: str, version: str, query: str, *params: Any) -> str:
+    return make_cache_key(collection, version, normalize_query_text(query), *params)
+
+
+def _filters_cache_part(filters: Optional[Filters]) -> str:
+    if not filters:
+        return ""
+    return repr(sorted((field, sorted(value) if isinstance(value, (list, tuple, set, frozenset)) else value)
+                       for field, value in filters.items()))
+
+
+async def semantic_search_many(collection: str, queries: List[str], k: int = 3,
+                               similarity_threshold: Optional[float] = None,
+                               filters: Optional[Filters] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Tìm kiếm theo lô nhiều câu query trên một collection của vector store.
+    Câu query nào đã có trong cache kết quả được trả về ngay; các câu còn lại được embed chung một lô
+    và tìm kiếm bằng một lần gọi FAISS duy nhất.
+
+    Args:
+        collection: Tên collection (xem COLLECTION_SPECS), ví dụ "loandau", "item".
+        queries: Các câu query của người dùng.
+        k: Số kết quả tối đa cho mỗi câu query.
+        similarity_threshold: Bỏ các kết quả có độ tương đồng thấp hơn ngưỡng.
+        filters: Bộ lọc metadata áp dụng ngay trong lúc tìm kiếm, ví dụ {"type": "sat_khi"}.
+
+    Returns:
+        Với mỗi câu query: danh sách dict metadata kèm 'similarity_score'.
+    """
+    store = await _acquire(vector_store_resource())
+    target = store.collection(collection) if store is not None else None
+    if target is None:
+        logger.error(f"Collection '{collection}' chưa được tải, không thể thực hiện tìm kiếm.")
+        return [[] for _ in queries]
+
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+    cache_keys = [
+        _result_cache_key(collection, target.version, query, k, similarity_threshold, _filters_cache_part(filters))
+        for query in queries
+    ]
+    if search_result_cache is not None:
+        for i, key in enumerate(cache_keys):
+            cached_results = search_result_cache.get(key)
+            if cached_results is not None:
+                logger.info(f"Semantic search cache hit ({collection}) cho query: '{queries[i]}'")
+                results[i] = [dict(result) for result in cached_results]
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        logger.info(f"Đang thực hiện semantic search ({collection}) cho {len(pending)} query với K={k}, bộ lọc: {filters}")
+        query_embeddings = await _embed_queries([queries[i] for i in pending])
+        if query_embeddings is None:
+            return [result or [] for result in results]
+
+        searched = target.search(query_embeddings, k, similarity_threshold=similarity_threshold, filters=filters)
+        for i, hits in zip(pending, searched):
+            for hit in hits:
+                logger.info(f"  - Tìm thấy ứng viên: {hit['name']} (Score: {hit['similarity_score']:.2f})")
+            results[i] = hits
+            if search_result_cache is not None:
+                search_result_cache.set(cache_keys[i], [dict(hit) for hit in hits])
     return results
 
-# --- TOOL MỚI BẠN YÊU CẦU ---
-def find_most_similar_item(query: str, similarity_threshold: float = 0.1) -> Optional[Dict[str, Any]]:
+
+async def semantic_search(collection: str, query: str, k: int = 3, similarity_threshold: Optional[float] = None,
+                          filters: Optional[Filters] = None) -> List[Dict[str, Any]]:
+    """Tìm kiếm một câu query trên một collection của vector store (xem semantic_search_many)."""
+    results = await semantic_search_many(collection, [query], k=k, similarity_threshold=similarity_threshold,
+                                         filters=filters)
+    return results[0]
+
+
+async def find_most_similar_loandau(query: str, k: int = 3, similarity_threshold: float = 0.5,
+                                    loai: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Tìm kiếm Top K Sát Khí hoặc Thế Đất Cát Tường tương đồng nhất.
+
+    Args:
+        loai: Chỉ tìm trong một loại ('sat_khi' hoặc 'the_dat'); None để tìm cả hai.
+    """
+    filters = {"type": loai} if loai else None
+    return await semantic_search("loandau", query, k=k, similarity_threshold=similarity_threshold, filters=filters)
+
+
+async def find_most_similar_item(query: str, similarity_threshold: float = 0.1) -> Optional[Dict[str, Any]]:
     """
     Tìm kiếm Vật phẩm phong thủy tương đồng nhất với mô tả hoặc tên gọi khác của người dùng.
 
@@ -113,34 +231,12 @@ def find_most_similar_item(query: str, similarity_threshold: float = 0.1) -> Opt
         Optional[Dict[str, Any]]: Một dictionary chứa tên và thông tin của vật phẩm khớp nhất,
                                   hoặc None nếu không tìm thấy kết quả nào đủ tốt.
     """
-    if not ITEM_RESOURCES_LOADED or model is None:
-        logger.error("Tài nguyên Vật Phẩm chưa được tải, không thể thực hiện tìm kiếm.")
-        return None
-
-    logger.info(f"Đang thực hiện semantic search (Vật Phẩm) cho query: '{query}'")
-
-    # 1. Tạo embedding cho câu query và chuẩn hóa nó
-    query_embedding = model.encode(query, convert_to_numpy=True).reshape(1, -1)
-    faiss.normalize_L2(query_embedding)
-
-    # 2. Tìm kiếm trong chỉ mục FAISS của vật phẩm
     # k=1: chỉ tìm 1 kết quả gần nhất
-    similarity_scores, indices = item_index.search(query_embedding, k=1)
-
-    best_match_index = indices[0][0]
-    similarity = similarity_scores[0][0]
-
-    logger.info(
-        f"Tìm thấy kết quả (Vật Phẩm) gần nhất ở index {best_match_index} với Cosine Similarity: {similarity:.2f}")
-
-    # 3. Kiểm tra ngưỡng tương đồng
-    if similarity < similarity_threshold:
-        logger.warning(f"Độ tương đồng ({similarity:.2f}) thấp hơn ngưỡng ({similarity_threshold}). Bỏ qua kết quả.")
+    results = await semantic_search("item", query, k=1, similarity_threshold=similarity_threshold)
+    if not results:
+        logger.warning(f"Không có vật phẩm nào đạt ngưỡng tương đồng ({similarity_threshold}) cho query: '{query}'.")
         return None
 
-    # 4. Trả về thông tin của kết quả khớp nhất từ metadata
-    best_match_info = item_info[best_match_index].copy()  # Dùng copy() để an toàn
-    best_match_info['similarity_score'] = float(similarity)
+    best_match_info = results[0]
     best_match_info['lookup_method'] = 'cosine_similarity'
-
-    return best_match_info
\ No newline at end of file
+    return best_match_info
@@ -3,7 +3,7 @@
 import logging
 from typing import Optional, Dict, Any
 
-from app.database.connection import query_to_dataframe
+from app.database.knowledge_base import get_knowledge_base
 
 logger = logging.getLogger(__name__)
 
@@ -24,17 +24,13 @@ def get_menh_huong_interaction(menh_gia_chu: str, huong_nha: str) -> Optional[Di
     menh_normalized = menh_gia_chu.strip().capitalize()
     huong_normalized = huong_nha.strip().title()
 
-    sql_query = "SELECT * FROM menh_huong_rules WHERE menhgiachu = :menh AND huongnha = :huong"
-    params = {"menh": menh_normalized, "huong": huong_normalized}
-
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        interaction_info = get_knowledge_base().lookup("menh_huong_rules", menh_normalized, huong_normalized)
+        if interaction_info is None:
             logger.warning(
                 f"Không tìm thấy quy tắc tương tác cho Mệnh '{menh_normalized}' và Hướng '{huong_normalized}'.")
             return None
 
-        interaction_info = result_df.to_dict('records')[0]
         logger.info(f"Tìm thấy tương tác Mệnh-Hướng: {interaction_info.get('moiquanhe_nguhanh')}")
         return interaction_info
 
@@ -57,20 +53,21 @@ def get_menh_menh_interaction(nap_am1: str, nap_am2: str) -> Optional[Dict[str,
     """
     logger.info(f"Đang tra cứu tương tác Mệnh-Mệnh cho: {nap_am1} - {nap_am2}")
 
-    # Tìm theo cả 2 chiều
-    sql_query = """
-        SELECT * FROM menh_menh_rules 
-        WHERE (napam1 = :na1 AND napam2 = :na2) OR (napam1 = :na2 AND napam2 = :na1)
-    """
-    params = {"na1": nap_am1.strip().title(), "na2": nap_am2.strip().title()}
+    na1 = nap_am1.strip().title()
+    na2 = nap_am2.strip().title()
 
     try:
-        result_df = query_to_dataframe(sql_query, params)
-        if result_df.empty:
+        rules_table = get_knowledge_base().table("menh_menh_rules")
+        if rules_table is None:
+            logger.error("Bảng 'menh_menh_rules' chưa được nạp vào knowledge base.")
+            return None
+
+        # Tìm theo cả 2 chiều, lấy dòng xuất hiện trước trong bảng
+        interaction_info = rules_table.get_first([(na1, na2), (na2, na1)])
+        if interaction_info is None:
             logger.warning(f"Không tìm thấy quy tắc tương tác cho Nạp Âm '{nap_am1}' và '{nap_am2}'.")
             return None
 
-        interaction_info = result_df.to_dict('records')[0]
         logger.info(f"Tìm thấy tương tác Mệnh-Mệnh: {interaction_info.get('moiquanhe_nguhanh')}")
         return interaction_info
 
@@ -0,0 +1,148 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# --- Cấu hình Logging ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# --- Định nghĩa các đường dẫn và hằng số ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.append(PROJECT_ROOT)
+
+from app.database.index_bundle import bundle_root, load_current_bundle  # noqa: E402
+from app.database.vector_store import (  # noqa: E402
+    COLLECTION_SPECS, INDEX_MODES, IndexBuildParams, IndexSearchParams, build_index, index_memory_bytes,
+    search_parameters,
+)
+
+INDEX_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
+
+
+def load_corpus_vectors(collection):
+    """
+    Các vector gốc của collection: từ cache embedding của lần build tăng dần gần nhất nếu có,
+    nếu không thì đọc lại từ index FAISS (flat) trong bundle hiện tại của collection.
+    """
+    spec = COLLECTION_SPECS[collection]
+    embeddings_path = os.path.join(INDEX_DIR, spec.embeddings_file)
+    if os.path.exists(embeddings_path):
+        with np.load(embeddings_path, allow_pickle=False) as state:
+            return state['vectors']
+    index = load_current_bundle(bundle_root(INDEX_DIR), collection).index
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def scale_corpus(vectors, target_rows, noise, rng):
+    """
+    Tạo corpus lớn hơn để mô phỏng catalog mở rộng: mỗi vector mới là tổ hợp của hai vector gốc
+    cộng nhiễu, chuẩn hóa L2, nên vẫn giữ phân bố ngữ nghĩa gần với dữ liệu thật.
+    """
+    if target_rows <= len(vectors):
+        return vectors
+    extra = target_rows - len(vectors)
+    a = vectors[rng.integers(0, len(vectors), extra)]
+    b = vectors[rng.integers(0, len(vectors), extra)]
+    weights = rng.uniform(0.5, 1.0, (extra, 1)).astype(np.float32)
+    synthetic = weights * a + (1 - weights) * b + rng.normal(0, noise, a.shape).astype(np.float32)
+    scaled = np.vstack([vectors, synthetic]).astype(np.float32)
+    faiss.normalize_L2(scaled)
+    return scaled
+
+
+def make_queries(vectors, n_queries, noise, rng):
+    """Câu query giả lập: vector của corpus cộng nhiễu (như một cách diễn đạt khác của cùng mô tả)."""
+    queries = vectors[rng.integers(0, len(vectors), n_queries)]
+    queries = (queries + rng.normal(0, noise, queries.shape)).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(ground_truth, found):
+    """Tỉ lệ trung bình các id đúng (theo index flat) có mặt trong top-k của index xấp xỉ."""
+    k = ground_truth.shape[1]
+    return float(np.mean([len(set(t) & set(f[f >= 0])) / k for t, f in zip(ground_truth, found)]))
+
+
+def measure(index, queries, k, search_params):
+    """Trả về (kết quả top-k, QPS khi tìm theo lô, QPS khi tìm từng câu một như lúc phục vụ request)."""
+    params = search_parameters(index, k, search_params)
+    started_at = time.perf_counter()
+    _, found = index.search(queries, k, params=params)
+    batch_qps = len(queries) / (time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    for query in queries:
+        index.search(query.reshape(1, -1), k, params=params)
+    single_qps = len(queries) / (time.perf_counter() - started_at)
+    return found, batch_qps, single_qps
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="So sánh các loại index FAISS (flat/hnsw/ivfpq): recall@k so với flat, QPS và bộ nhớ.")
+    parser.add_argument('--collection', default='loandau', choices=list(COLLECTION_SPECS))
+    parser.add_argument('--rows', type=int, default=0,
+                        help="Mở rộng corpus tới số dòng này bằng vector tổng hợp (0: giữ nguyên corpus thật).")
+    parser.add_argument('--queries', type=int, default=1000, help="Số câu query giả lập.")
+    parser.add_argument('--noise', type=float, default=0.02, help="Độ lệch chuẩn nhiễu của query/vector tổng hợp.")
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', default=['hnsw', 'ivfpq'], choices=[m for m in INDEX_MODES if m != 'flat'])
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 32, 64, 128])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--hnsw-m', type=int, default=32)
+    parser.add_argument('--ivf-nlist', type=int, default=None)
+    parser.add_argument('--pq-m', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus = scale_corpus(load_corpus_vectors(args.collection), args.rows, args.noise, rng)
+    queries = make_queries(corpus, args.queries, args.noise, rng)
+    k = min(args.k, len(corpus))
+    logging.info(f"--- Benchmark '{args.collection}': {len(corpus)} vectors x {corpus.shape[1]} chiều, "
+                 f"{len(queries)} query, k={k} ---")
+
+    # Chuẩn so sánh: index flat (chính xác tuyệt đối)
+    flat = build_index(corpus, IndexBuildParams(mode='flat'))
+    ground_truth, flat_batch_qps, flat_single_qps = measure(flat, queries, k, IndexSearchParams())
+    rows = [('flat', '-', 0.0, 1.0, flat_batch_qps, flat_single_qps, index_memory_bytes(flat))]
+
+    for mode in args.modes:
+        build_params = IndexBuildParams(mode=mode, hnsw_m=args.hnsw_m, ivf_nlist=args.ivf_nlist, pq_m=args.pq_m)
+        started_at = time.perf_counter()
+        index = build_index(corpus, build_params)
+        build_seconds = time.perf_counter() - started_at
+        memory = index_memory_bytes(index)
+
+        sweep = args.ef_search if mode == 'hnsw' else args.nprobe
+        for value in sweep:
+            search_params = IndexSearchParams(ef_search=value) if mode == 'hnsw' else IndexSearchParams(nprobe=value)
+            found, batch_qps, single_qps = measure(index, queries, k, search_params)
+            label = f"efSearch={value}" if mode == 'hnsw' else f"nprobe={value}"
+            rows.append((mode, label, build_seconds, recall_at_k(ground_truth, found), batch_qps, single_qps, memory))
+
+    header = f"{'index':<7} {'tham số':<13} {'build (s)':>9} {f'recall@{k}':>9} {'QPS lô':>10} {'QPS đơn':>10} {'bộ nhớ (MB)':>12}"
+    print(header)
+    print('-' * len(header))
+    for mode, label, build_seconds, recall, batch_qps, single_qps, memory in rows:
+        print(f"{mode:<7} {label:<13} {build_seconds:>9.2f} {recall:>9.3f} {batch_qps:>10.0f} {single_qps:>10.0f} "
+              f"{memory / 1024 / 1024:>12.2f}")
+
+    logging.info("--- HOÀN TẤT! Chọn loại index bằng VECTOR_INDEX_MODE khi build, "
+                 "tham số tìm kiếm bằng VECTOR_HNSW_EF_SEARCH / VECTOR_IVF_NPROBE trong file .env ---")
+
+
+if __name__ == "__main__":
+    main()
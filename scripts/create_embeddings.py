@@ -1,24 +1,36 @@
 # scripts/create_embeddings.py
+import logging
 import sqlite3
 import pandas as pd
-import faiss
-import numpy as np
-import pickle
 import os
-from sentence_transformers import SentenceTransformer
+import sys
+
+# Hiển thị tiến trình encode/cập nhật index của app/database/embedding_builder.py
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 # --- Cấu hình ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.append(PROJECT_ROOT)
+
+from app.database.embedding_builder import CorpusRow, build_collection  # noqa: E402
+from app.database.vector_store import COLLECTION_SPECS, IndexBuildParams  # noqa: E402
+from app.services.encoder_backends import MODEL_NAME, load_encoder  # noqa: E402
+
 DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'processed', 'phongthuy.sqlite')
 OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
-MODEL_NAME = 'bkai-foundation-models/vietnamese-bi-encoder' # Model mới, mạnh hơn
+# Backend suy luận: "torch" (mặc định), "torch_int8", "onnx", "onnx_int8" (xem app/services/encoder_backends.py)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', os.path.join(PROJECT_ROOT, 'data', 'models', 'vietnamese-bi-encoder-onnx'))
+# Loại index: VECTOR_INDEX_MODE="flat" (mặc định), "hnsw", "ivfpq" và các tham số VECTOR_INDEX_* khác
+# (xem IndexBuildParams trong app/database/vector_store.py, so sánh bằng scripts/benchmark_vector_index.py)
+INDEX_PARAMS = IndexBuildParams.from_env()
 
 print("--- Bắt đầu tạo Vector Embeddings ---")
 
 # --- 1. Tải mô hình Embedding ---
-print(f"Đang tải mô hình Sentence Transformer: {MODEL_NAME}...")
-model = SentenceTransformer(MODEL_NAME)
+print(f"Đang tải mô hình Sentence Transformer: {MODEL_NAME} (backend: {EMBEDDING_BACKEND})...")
+model = load_encoder(EMBEDDING_BACKEND, onnx_dir=ONNX_DIR)
 print("Tải mô hình thành công.")
 
 # --- 2. Kết nối và đọc dữ liệu từ SQLite ---
@@ -33,33 +45,30 @@ print(f"Đã đọc {len(df_sat_khi)} Sát Khí và {len(df_cat_tuong)} Thế Đ
 df_sat_khi['corpus'] = df_sat_khi['mota_nhandien'] + " " + df_sat_khi['keywords_nhandien']
 df_cat_tuong['corpus'] = df_cat_tuong['mota_nhandien'] + " " + df_cat_tuong['keywords_nhandien']
 
-all_corpus = pd.concat([df_sat_khi['corpus'], df_cat_tuong['corpus']]).tolist()
-
-# Lưu lại thông tin gốc để tra cứu ngược
-all_data_info = (
-        [{'type': 'sat_khi', 'name': row['tensatkhi']} for index, row in df_sat_khi.iterrows()] +
-        [{'type': 'the_dat', 'name': row['tenthedat']} for index, row in df_cat_tuong.iterrows()]
+# Mỗi dòng giữ khóa ổn định (loại + tên) và thông tin gốc để tra cứu ngược
+corpus_rows = (
+        [CorpusRow(f"sat_khi:{row['tensatkhi']}", row['corpus'], {'type': 'sat_khi', 'name': row['tensatkhi']})
+         for index, row in df_sat_khi.iterrows()] +
+        [CorpusRow(f"the_dat:{row['tenthedat']}", row['corpus'], {'type': 'the_dat', 'name': row['tenthedat']})
+         for index, row in df_cat_tuong.iterrows()]
 )
 
-# --- 4. Tạo Embeddings ---
-print("Đang tạo embeddings cho toàn bộ corpus... (việc này có thể mất vài phút)")
-corpus_embeddings = model.encode(all_corpus, convert_to_tensor=True, show_progress_bar=True)
-corpus_embeddings_np = corpus_embeddings.cpu().numpy()
-print(f"Tạo embeddings thành công, shape: {corpus_embeddings_np.shape}")
-
-# --- 5. Xây dựng chỉ mục FAISS ---
-faiss.normalize_L2(corpus_embeddings_np)
-d = corpus_embeddings_np.shape[1]  # Kích thước của vector
-index = faiss.IndexFlatIP(d) # SỬ DỤNG IndexFlatIP
-index.add(corpus_embeddings_np)
-print(f"Đã xây dựng chỉ mục FAISS (IP) với {index.ntotal} vectors.")
-
-# --- 6. Lưu tất cả mọi thứ ---
-faiss.write_index(index, os.path.join(OUTPUT_DIR, 'loandau.index'))
-with open(os.path.join(OUTPUT_DIR, 'loandau_info.pkl'), 'wb') as f:
-    pickle.dump(all_data_info, f)
+# --- 4. Tạo embeddings (chỉ cho các dòng mới/thay đổi) và cập nhật chỉ mục FAISS ---
+# Vector của các dòng không đổi được lấy lại từ loandau_embeddings.npz; xóa file này để encode lại toàn bộ.
+print("Đang tạo embeddings cho các dòng mới/thay đổi và cập nhật chỉ mục FAISS...")
+stats = build_collection(
+    COLLECTION_SPECS['loandau'],
+    corpus_rows,
+    encode=lambda texts: model.encode(texts, convert_to_numpy=True),
+    model_name=MODEL_NAME,
+    backend=EMBEDDING_BACKEND,
+    output_dir=OUTPUT_DIR,
+    params=INDEX_PARAMS,
+)
+print(f"Đã xây dựng chỉ mục FAISS ({INDEX_PARAMS.mode}, IP): {stats.added} mới, {stats.changed} thay đổi, "
+      f"{stats.removed} bị xóa, {stats.unchanged} giữ nguyên, {stats.encoded} văn bản được encode.")
 
-print(f"--- Đã lưu thành công index và data info vào thư mục: {OUTPUT_DIR} ---")
+print(f"--- Đã lưu thành công bundle {stats.manifest.version} vào thư mục: {os.path.join(OUTPUT_DIR, 'vector_store')} ---")
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
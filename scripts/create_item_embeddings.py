@@ -1,11 +1,8 @@
 import os
 import pandas as pd
 import sqlite3
-import faiss
-import numpy as np
-import pickle
 import logging
-from sentence_transformers import SentenceTransformer
+import sys
 
 # --- Cấu hình Logging ---
 # Thiết lập hệ thống ghi log để theo dõi tiến trình một cách chi tiết
@@ -20,13 +17,23 @@ logging.basicConfig(
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Đi ngược lên một cấp để lấy thư mục gốc của project
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.append(PROJECT_ROOT)
+
+from app.database.embedding_builder import CorpusRow, build_collection, unique_row_keys  # noqa: E402
+from app.database.vector_store import COLLECTION_SPECS, IndexBuildParams  # noqa: E402
+from app.services.encoder_backends import MODEL_NAME, load_encoder  # noqa: E402
 
 # Định nghĩa các đường dẫn CSDL và thư mục đầu ra
 DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'processed', 'phongthuy.sqlite')
 OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
 
-# Tên mô hình embedding mạnh mẽ cho tiếng Việt (chuyên cho retrieval)
-MODEL_NAME = 'bkai-foundation-models/vietnamese-bi-encoder'
+# Backend suy luận của mô hình embedding (MODEL_NAME, chuyên cho retrieval tiếng Việt):
+# "torch" (mặc định), "torch_int8", "onnx", "onnx_int8" - xem app/services/encoder_backends.py
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', os.path.join(PROJECT_ROOT, 'data', 'models', 'vietnamese-bi-encoder-onnx'))
+# Loại index FAISS: VECTOR_INDEX_MODE="flat" (mặc định), "hnsw", "ivfpq" và các tham số VECTOR_INDEX_* khác
+# (xem IndexBuildParams trong app/database/vector_store.py, so sánh bằng scripts/benchmark_vector_index.py)
+INDEX_PARAMS = IndexBuildParams.from_env()
 
 def main():
     """
@@ -35,9 +42,9 @@ def main():
     logging.info("--- BẮT ĐẦU QUÁ TRÌNH TẠO EMBEDDINGS CHO VẬT PHẨM ---")
 
     # --- 1. Tải mô hình Sentence Transformer ---
-    logging.info(f"Đang tải mô hình Sentence Transformer: '{MODEL_NAME}'...")
+    logging.info(f"Đang tải mô hình Sentence Transformer: '{MODEL_NAME}' (backend: {EMBEDDING_BACKEND})...")
     try:
-        model = SentenceTransformer(MODEL_NAME)
+        model = load_encoder(EMBEDDING_BACKEND, onnx_dir=ONNX_DIR)
         logging.info("Tải mô hình thành công.")
     except Exception as e:
         logging.error(f"Không thể tải mô hình embedding. Lỗi: {e}")
@@ -66,44 +73,37 @@ def main():
     cols_to_combine = ['tenvatpham', 'tengoikhac', 'congdung_keywords', 'mota_truyenthuyet']
     df['corpus'] = df[cols_to_combine].fillna('').astype(str).agg(' '.join, axis=1)
 
-    # Lấy danh sách corpus và metadata theo đúng thứ tự
-    corpus_list = df['corpus'].tolist()
-    # Metadata này dùng để tra cứu ngược từ index của vector về tên vật phẩm
-    metadata_list = [{'name': row['tenvatpham']} for index, row in df.iterrows()]
-    logging.info(f"Đã tạo {len(corpus_list)} văn bản trong corpus.")
-
-    # --- 4. Tạo Embeddings ---
-    logging.info("Đang tạo embeddings cho toàn bộ corpus vật phẩm...")
-    # model.encode sẽ trả về một numpy array
-    corpus_embeddings = model.encode(corpus_list, convert_to_numpy=True, show_progress_bar=True)
-    logging.info(f"Tạo embeddings thành công, shape: {corpus_embeddings.shape}")
-
-    # --- 5. Xây dựng chỉ mục FAISS (sử dụng Cosine Similarity) ---
-    logging.info("Đang xây dựng chỉ mục FAISS...")
-    # Chuẩn hóa các vector (bước bắt buộc để IndexFlatIP hoạt động như Cosine Similarity)
-    faiss.normalize_L2(corpus_embeddings)
-
-    # Lấy số chiều của vector
-    dimension = corpus_embeddings.shape[1]
-    # Sử dụng IndexFlatIP, tối ưu cho việc tìm kiếm Cosine Similarity
-    index = faiss.IndexFlatIP(dimension)
-    # Thêm các vector đã được chuẩn hóa vào chỉ mục
-    index.add(corpus_embeddings)
-    logging.info(f"Đã xây dựng chỉ mục FAISS thành công với {index.ntotal} vectors.")
-
-    # --- 6. Lưu các file kết quả ---
-    # Đảm bảo thư mục đầu ra tồn tại
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    index_path = os.path.join(OUTPUT_DIR, 'item.index')
-    info_path = os.path.join(OUTPUT_DIR, 'item_info.pkl')
-
-    logging.info(f"Đang lưu chỉ mục FAISS vào: {index_path}")
-    faiss.write_index(index, index_path)
-
-    logging.info(f"Đang lưu thông tin metadata vào: {info_path}")
-    with open(info_path, 'wb') as f:
-        pickle.dump(metadata_list, f)
+    # Mỗi dòng giữ một khóa ổn định theo tên vật phẩm (tên trùng được thêm hậu tố '#2', '#3'...)
+    # cùng metadata dùng để tra cứu ngược từ vector về tên vật phẩm
+    row_keys = unique_row_keys(df['tenvatpham'].astype(str).tolist())
+    corpus_rows = [
+        CorpusRow(key, row['corpus'], {'name': row['tenvatpham']})
+        for key, (index, row) in zip(row_keys, df.iterrows())
+    ]
+    logging.info(f"Đã tạo {len(corpus_rows)} văn bản trong corpus.")
+
+    # --- 4. Tạo Embeddings cho các dòng mới/thay đổi và cập nhật chỉ mục FAISS ---
+    # Vector của các dòng không đổi được lấy lại từ item_embeddings.npz (so sánh bằng hash nội dung corpus),
+    # nên sửa mô tả một vật phẩm chỉ phải encode lại đúng vật phẩm đó. Xóa file .npz để encode lại toàn bộ.
+    # Các vector được chuẩn hóa L2 để inner product tương đương Cosine Similarity.
+    logging.info("Đang tạo embeddings và cập nhật chỉ mục FAISS...")
+    try:
+        stats = build_collection(
+            COLLECTION_SPECS['item'],
+            corpus_rows,
+            encode=lambda texts: model.encode(texts, convert_to_numpy=True),
+            model_name=MODEL_NAME,
+            backend=EMBEDDING_BACKEND,
+            output_dir=OUTPUT_DIR,
+            params=INDEX_PARAMS,
+        )
+    except Exception as e:
+        logging.error(f"Không thể xây dựng chỉ mục FAISS cho vật phẩm. Lỗi: {e}")
+        return
+
+    logging.info(
+        f"Đã xây dựng chỉ mục FAISS ({INDEX_PARAMS.mode}): {stats.added} mới, {stats.changed} thay đổi, "
+        f"{stats.removed} bị xóa, {stats.unchanged} giữ nguyên, {stats.encoded} văn bản được encode.")
 
     logging.info("--- HOÀN TẤT! Đã tạo và lưu thành công các file embedding cho vật phẩm. ---")
 
@@ -0,0 +1,130 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import faiss
+import numpy as np
+import pandas as pd
+
+# --- Cấu hình Logging ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# --- Định nghĩa các đường dẫn và hằng số ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.append(PROJECT_ROOT)
+
+from app.database.index_bundle import bundle_root, load_current_bundle  # noqa: E402
+from app.services.encoder_backends import (  # noqa: E402
+    DEFAULT_ONNX_QUANTIZATION, ENCODER_BACKENDS, MODEL_NAME, export_onnx_encoder, load_encoder,
+)
+
+DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'processed', 'phongthuy.sqlite')
+INDEX_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
+ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', os.path.join(PROJECT_ROOT, 'data', 'models', 'vietnamese-bi-encoder-onnx'))
+
+# Các câu query dùng để kiểm tra: từ khóa nhận diện / tên gọi khác, gần với cách người dùng mô tả thực tế
+CHECK_QUERIES_SQL = {
+    'loandau': [
+        "SELECT keywords_nhandien AS q FROM ngoai_canh_sat_khi",
+        "SELECT keywords_nhandien AS q FROM loan_dau_cat_tuong",
+    ],
+    'item': [
+        "SELECT tengoikhac AS q FROM vat_pham_phong_thuy",
+        "SELECT congdung_keywords AS q FROM vat_pham_phong_thuy",
+    ],
+}
+
+
+def load_check_queries(sqls):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        frames = [pd.read_sql_query(sql, conn) for sql in sqls]
+    finally:
+        conn.close()
+    queries = pd.concat(frames)['q'].dropna().astype(str).str.strip()
+    return [q for q in queries.tolist() if q]
+
+
+def encode_queries(model, queries):
+    """Encode từng câu một (giống lúc phục vụ request) và trả về (ma trận embedding, ms trung bình mỗi câu)."""
+    started_at = time.perf_counter()
+    vectors = np.vstack([model.encode(q, convert_to_numpy=True) for q in queries]).astype(np.float32)
+    elapsed_ms = (time.perf_counter() - started_at) * 1000 / max(len(queries), 1)
+    faiss.normalize_L2(vectors)
+    return vectors, elapsed_ms
+
+
+def topk_agreement(index, reference_vectors, candidate_vectors, k):
+    """Tỉ lệ trùng khớp trung bình của top-k (và top-1) khi tìm bằng vector FP32 và vector của backend cần kiểm tra."""
+    _, reference_ids = index.search(reference_vectors, k)
+    _, candidate_ids = index.search(candidate_vectors, k)
+    overlap = np.mean([len(set(r) & set(c)) / k for r, c in zip(reference_ids, candidate_ids)])
+    top1 = np.mean(reference_ids[:, 0] == candidate_ids[:, 0])
+    return float(overlap), float(top1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export bi-encoder sang ONNX (FP32 + int8) và so sánh top-k với index FP32 hiện tại.")
+    parser.add_argument('--backends', nargs='+', default=['onnx', 'onnx_int8', 'torch_int8'],
+                        choices=[b for b in ENCODER_BACKENDS if b != 'torch'],
+                        help="Các backend cần kiểm tra độ chính xác so với PyTorch FP32.")
+    parser.add_argument('--quantization', default=DEFAULT_ONNX_QUANTIZATION,
+                        help="Cấu hình lượng tử hóa ONNX Runtime (avx2, avx512, avx512_vnni, arm64).")
+    parser.add_argument('--k', type=int, default=3, help="Số kết quả top-k dùng để so sánh.")
+    parser.add_argument('--skip-export', action='store_true', help="Bỏ qua bước export, chỉ kiểm tra độ chính xác.")
+    args = parser.parse_args()
+
+    logging.info("--- BẮT ĐẦU EXPORT VÀ KIỂM TRA BACKEND ENCODER ---")
+
+    # --- 1. Export ONNX ---
+    if not args.skip_export:
+        try:
+            export_onnx_encoder(ONNX_DIR, onnx_quantization=args.quantization)
+        except ImportError as e:
+            logging.error(f"Thiếu thư viện để export ONNX ({e}). Vui lòng cài đặt: pip install 'optimum[onnxruntime]'")
+            return
+
+    # --- 2. Nạp mô hình chuẩn (FP32) và các backend cần kiểm tra ---
+    logging.info(f"Đang tải mô hình chuẩn PyTorch FP32: '{MODEL_NAME}'...")
+    reference_model = load_encoder('torch')
+    candidates = {}
+    for backend in args.backends:
+        try:
+            candidates[backend] = load_encoder(backend, onnx_dir=ONNX_DIR, onnx_quantization=args.quantization)
+        except Exception as e:
+            logging.error(f"Không thể tải backend '{backend}': {e}")
+
+    # --- 3. So sánh top-k trên index (vector FP32) của từng collection ---
+    for collection, sqls in CHECK_QUERIES_SQL.items():
+        try:
+            index = load_current_bundle(bundle_root(INDEX_DIR), collection, expected_model=MODEL_NAME).index
+        except Exception as e:
+            logging.warning(f"Không nạp được bundle của collection '{collection}' ({e}), bỏ qua.")
+            continue
+        queries = load_check_queries(sqls)
+        k = min(args.k, index.ntotal)
+        logging.info(f"[{collection}] {len(queries)} câu query, {index.ntotal} vectors, k={k}")
+
+        reference_vectors, reference_ms = encode_queries(reference_model, queries)
+        logging.info(f"  - torch (FP32): {reference_ms:.2f} ms/câu")
+        for backend, model in candidates.items():
+            vectors, elapsed_ms = encode_queries(model, queries)
+            overlap, top1 = topk_agreement(index, reference_vectors, vectors, k)
+            logging.info(
+                f"  - {backend}: {elapsed_ms:.2f} ms/câu (x{reference_ms / elapsed_ms:.1f}), "
+                f"trùng top-{k}: {overlap:.1%}, trùng top-1: {top1:.1%}")
+
+    logging.info("--- HOÀN TẤT! Chọn backend bằng biến EMBEDDING_BACKEND trong file .env ---")
+
+
+if __name__ == "__main__":
+    main()
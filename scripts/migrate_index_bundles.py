@@ -0,0 +1,72 @@
+import argparse
+import logging
+import os
+import pickle
+import sys
+
+import faiss
+
+# --- Cấu hình Logging ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# --- Định nghĩa các đường dẫn và hằng số ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.append(PROJECT_ROOT)
+
+from app.database.index_bundle import bundle_root, write_bundle  # noqa: E402
+from app.database.vector_store import COLLECTION_SPECS, index_ids  # noqa: E402
+from app.services.encoder_backends import MODEL_NAME  # noqa: E402
+
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
+
+# Định dạng cũ: <collection>.index + <collection>_info.pkl (list các dict metadata, theo thứ tự vector)
+LEGACY_FILES = {
+    'loandau': ('loandau.index', 'loandau_info.pkl'),
+    'item': ('item.index', 'item_info.pkl'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Chuyển index FAISS + metadata pickle định dạng cũ sang bundle (data/processed/vector_store).")
+    parser.add_argument('--backend', default='torch', help="Backend đã dùng để tạo các vector cũ.")
+    parser.add_argument('--remove-legacy', action='store_true', help="Xóa file .index/.pkl cũ sau khi chuyển xong.")
+    args = parser.parse_args()
+
+    for collection, (index_file, metadata_file) in LEGACY_FILES.items():
+        index_path = os.path.join(DATA_DIR, index_file)
+        metadata_path = os.path.join(DATA_DIR, metadata_file)
+        if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            logging.info(f"[{collection}] Không có file định dạng cũ, bỏ qua.")
+            continue
+
+        spec = COLLECTION_SPECS[collection]
+        index = faiss.read_index(index_path)
+        with open(metadata_path, 'rb') as f:
+            metadata = pickle.load(f)
+        if index.ntotal != len(metadata):
+            logging.error(f"[{collection}] Index có {index.ntotal} vectors nhưng metadata có {len(metadata)} dòng, bỏ qua.")
+            continue
+
+        # Kiểm tra kiểu từng dòng trước khi ghi thành cột
+        rows = [spec.metadata_model.model_validate(row).model_dump() for row in metadata]
+        columns = {field: [row[field] for row in rows] for field in spec.metadata_model.model_fields}
+        manifest = write_bundle(bundle_root(DATA_DIR), collection, index, index_ids(index), columns,
+                                model=MODEL_NAME, backend=args.backend)
+        logging.info(f"[{collection}] Đã tạo bundle {manifest.version} ({manifest.rows} vectors).")
+
+        if args.remove_legacy:
+            os.remove(index_path)
+            os.remove(metadata_path)
+            logging.info(f"[{collection}] Đã xóa '{index_file}' và '{metadata_file}'.")
+
+    logging.info("--- HOÀN TẤT! Lần chạy scripts/create_*embeddings.py tiếp theo sẽ tạo lại cache embedding. ---")
+
+
+if __name__ == "__main__":
+    main()
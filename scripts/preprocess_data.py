@@ -1,10 +1,15 @@
 import os
+import sys
 import pandas as pd
 import sqlite3
 import glob
+import hashlib
 import logging
 import re
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
 
 # --- Cấu hình Logging ---
 # Thiết lập hệ thống ghi log để theo dõi tiến trình một cách chi tiết
@@ -25,6 +30,27 @@ RAW_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'raw')
 PROCESSED_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed')
 DB_PATH = os.path.join(PROCESSED_DATA_DIR, 'phongthuy.sqlite')
 
+# Số process đọc file Excel song song (pd.read_excel là bước chậm nhất); mặc định theo số CPU
+PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', '0')) or (os.cpu_count() or 1)
+# PREPROCESS_FULL_REBUILD=1: bỏ qua manifest, đọc lại mọi file Excel thay vì chỉ các file đã thay đổi
+PREPROCESS_FULL_REBUILD = os.getenv('PREPROCESS_FULL_REBUILD', '0') == '1'
+# Bảng lưu hash nội dung của từng file nguồn ở lần build trước (nằm ngay trong database)
+MANIFEST_TABLE = '_ingest_manifest'
+# Tăng khi đổi cách đọc/ép kiểu dữ liệu hoặc thêm bảng phái sinh để lần build tiếp theo dựng lại từ đầu
+INGEST_FORMAT_VERSION = 2
+# Các bảng câu trả lời dựng sẵn (tiền tố answer_) được dựng bằng code của các tool chứ không chỉ từ dữ liệu:
+# manifest lưu hash của mã nguồn này, sửa tool là lần build tiếp theo dựng lại chúng (không cần tăng version)
+ANSWER_TABLE_PREFIX = 'answer_'
+PRECOMPUTE_SOURCES = (
+    os.path.join('app', 'tools', '*.py'),
+    os.path.join('app', 'database', 'knowledge_base.py'),
+)
+
+# Thêm thư mục gốc vào sys.path để dùng lại các hàm trong package 'app' khi chạy script trực tiếp
+sys.path.append(PROJECT_ROOT)
+from app.database.schema import TABLE_SCHEMAS, SchemaError, TableSchema  # noqa: E402
+from app.tools.can_chi_helper import normalize_can_chi  # noqa: E402
+
 
 def normalize_text(text: str) -> str:
     """
@@ -41,50 +67,291 @@ def normalize_text(text: str) -> str:
     return text.strip('_')
 
 
-def process_excel_file(excel_path: str, conn: sqlite3.Connection):
+def coerce_column(values: pd.Series, column_type: str, table_name: str, column: str) -> list:
     """
-    Đọc một file Excel, chuẩn hóa tên cột và ghi dữ liệu vào một bảng trong CSDL SQLite.
-    Tên bảng sẽ được tạo dựa trên tên file Excel.
+    Ép một cột về kiểu khai báo trong schema và trả về list giá trị Python (NaN/NaT -> None).
+    INTEGER không chấp nhận số lẻ (1991.5) hay chuỗi không phải số; REAL không chấp nhận chuỗi không phải số.
     """
+    present = values.notna()
+    if column_type == 'TEXT':
+        return [str(value) if is_present else None for value, is_present in zip(values.tolist(), present)]
+
+    numbers = pd.to_numeric(values, errors='coerce')
+    invalid = present & numbers.isna()
+    if column_type == 'INTEGER':
+        invalid |= numbers.notna() & (numbers % 1 != 0)
+    if invalid.any():
+        excel_row = int(invalid.idxmax()) + 2  # +1 dòng tiêu đề, +1 vì Excel đánh số từ 1
+        raise SchemaError(f"Bảng '{table_name}', cột '{column}' ({column_type}): giá trị không hợp lệ "
+                          f"'{values[invalid.idxmax()]}' ở dòng Excel {excel_row}.")
+    if column_type == 'INTEGER':
+        numbers = numbers.astype('Int64')
+    return [None if pd.isna(value) else value for value in numbers.astype(object).tolist()]
+
+
+class ParsedTable(NamedTuple):
+    """Kết quả đọc một file Excel trong process con, gửi về process chính để ghi vào SQLite."""
+    table_name: str
+    source_file: str
+    content_hash: str
+    columns: List[str]
+    rows: List[tuple]
+    column_types: Optional[List[str]]  # Chỉ với bảng chưa khai báo schema: kiểu suy từ dtype của pandas
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def schema_hash(table_name: str) -> str:
+    """Dấu vân tay của schema + cách đọc dữ liệu: đổi schema của một bảng thì bảng đó được đọc lại."""
+    schema = TABLE_SCHEMAS.get(table_name)
+    payload = f"{INGEST_FORMAT_VERSION}:{schema.model_dump_json() if schema is not None else ''}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def precompute_code_hash() -> str:
+    """Hash mã nguồn dùng để dựng các bảng câu trả lời (PRECOMPUTE_SOURCES), đọc trực tiếp từ file, không import."""
+    digest = hashlib.sha256()
+    paths = sorted(path for pattern in PRECOMPUTE_SOURCES for path in glob.glob(os.path.join(PROJECT_ROOT, pattern)))
+    for path in paths:
+        digest.update(f"{os.path.relpath(path, PROJECT_ROOT)}:{file_hash(path)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def answer_table_names() -> List[str]:
+    return [name for name in TABLE_SCHEMAS if name.startswith(ANSWER_TABLE_PREFIX)]
+
+
+def prepare_rows(df: pd.DataFrame, schema: TableSchema) -> List[tuple]:
+    """
+    Kiểm tra DataFrame theo schema khai báo (các cột bắt buộc có mặt và không NULL), ép kiểu từng cột
+    và trả về các dòng dạng tuple sẵn sàng cho executemany.
+    """
+    missing = [column for column in schema.required_columns() if column not in df.columns]
+    if missing:
+        raise SchemaError(f"Bảng '{schema.name}' thiếu các cột bắt buộc: {missing}.")
+    for column in schema.required_columns():
+        nulls = df[column].isna()
+        if nulls.any():
+            excel_rows = [int(i) + 2 for i in df.index[nulls][:5]]
+            raise SchemaError(f"Bảng '{schema.name}', cột '{column}' là NOT NULL nhưng trống ở dòng Excel {excel_rows}.")
+
+    data = [coerce_column(df[column], schema.column_type(column), schema.name, column) for column in df.columns]
+    return list(zip(*data))
+
+
+def infer_column_type(values: pd.Series) -> str:
+    """Kiểu SQLite cho một cột của bảng chưa khai báo schema, suy từ dtype của pandas (như DataFrame.to_sql)."""
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(values):
+        return 'REAL'
+    return 'TEXT'
+
+
+def write_untyped_table(conn: sqlite3.Connection, table_name: str, columns: List[str], column_types: List[str],
+                        rows: List[tuple]):
+    """
+    Tạo lại bảng chưa khai báo schema (không khóa chính/index) và ghi các dòng bằng executemany,
+    trong giao dịch của main() như write_table (DataFrame.to_sql có thể tự commit giữa chừng).
+    """
+    definitions = ', '.join(f'"{column}" {column_type}' for column, column_type in zip(columns, column_types))
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f'CREATE TABLE "{table_name}" ({definitions})')
+    conn.executemany(f'INSERT INTO "{table_name}" VALUES ({", ".join("?" for _ in columns)})', rows)
+
+
+def write_table(conn: sqlite3.Connection, schema: TableSchema, columns: List[str], rows: List[tuple]):
+    """
+    Tạo lại bảng theo schema (khóa chính, NOT NULL) và ghi các dòng, rồi mới tạo index
+    (nhanh hơn cập nhật index theo từng dòng). Chạy trong giao dịch của main(), không tự commit.
+    Khóa chính/UNIQUE bị trùng làm sqlite3.IntegrityError, được báo lại thành SchemaError.
+    """
+    placeholders = ', '.join('?' for _ in columns)
+    quoted_columns = ', '.join(f'"{column}"' for column in columns)
+
+    conn.execute(f'DROP TABLE IF EXISTS "{schema.name}"')
+    conn.execute(schema.create_table_sql(columns))
     try:
-        # Lấy tên file (không bao gồm phần mở rộng) để làm tên bảng
-        base_name = os.path.basename(excel_path)
-        table_name = os.path.splitext(base_name)[0]
-        logging.info(f"Đang xử lý file: '{base_name}' -> Bảng SQLite: '{table_name}'")
+        conn.executemany(f'INSERT INTO "{schema.name}" ({quoted_columns}) VALUES ({placeholders})', rows)
+        for statement in schema.create_index_sql():
+            conn.execute(statement)
+    except sqlite3.IntegrityError as e:
+        raise SchemaError(f"Bảng '{schema.name}' vi phạm khóa chính/UNIQUE: {e}.") from e
+
 
+def parse_excel_file(excel_path: str, content_hash: str) -> Optional[ParsedTable]:
+    """
+    Đọc một file Excel, chuẩn hóa tên cột và chuẩn bị dữ liệu cho bảng cùng tên (chạy trong process con).
+    Bảng có trong app/database/schema.py được kiểm tra và ép kiểu theo schema; dữ liệu sai schema
+    làm hỏng cả lần build (SchemaError). Trả về None khi file rỗng hoặc không đọc được.
+    """
+    # Lấy tên file (không bao gồm phần mở rộng) để làm tên bảng
+    base_name = os.path.basename(excel_path)
+    table_name = os.path.splitext(base_name)[0]
+    try:
         # Đọc dữ liệu từ file Excel vào một DataFrame của Pandas
         df = pd.read_excel(excel_path)
 
         # Xử lý trường hợp file Excel rỗng
         if df.empty:
             logging.warning(f"File '{base_name}' rỗng, bỏ qua.")
-            return
+            return None
 
         # Chuẩn hóa tên các cột để tương thích với SQL
         # Ví dụ: "1. Bảng tra cứu Bát Trạch (Cung Mệnh vs Hướng)" -> "1_bang_tra_cuu_bat_trach_cung_menh_vs_huong"
-        original_columns = df.columns.tolist()
-        df.columns = [normalize_text(col) for col in original_columns]
+        df.columns = [normalize_text(col) for col in df.columns.tolist()]
 
-        # Ghi DataFrame vào bảng SQLite
-        # - if_exists='replace': Nếu bảng đã tồn tại, xóa đi và tạo lại. Điều này đảm bảo dữ liệu luôn mới nhất.
-        # - index=False: Không ghi chỉ số của DataFrame vào CSDL.
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-
-        logging.info(f"Đã ghi thành công {len(df)} dòng vào bảng '{table_name}'.")
+        schema = TABLE_SCHEMAS.get(table_name)
+        if schema is None:
+            column_types = [infer_column_type(df[column]) for column in df.columns]
+            data = [coerce_column(df[column], column_type, table_name, column)
+                    for column, column_type in zip(df.columns, column_types)]
+            return ParsedTable(table_name, base_name, content_hash, df.columns.tolist(), list(zip(*data)), column_types)
+        return ParsedTable(table_name, base_name, content_hash, df.columns.tolist(), prepare_rows(df, schema), None)
 
+    except SchemaError:
+        raise
     except FileNotFoundError:
         logging.error(f"Không tìm thấy file: {excel_path}")
     except Exception as e:
-        logging.error(f"Gặp lỗi khi xử lý file '{os.path.basename(excel_path)}': {e}")
+        logging.error(f"Gặp lỗi khi xử lý file '{base_name}': {e}")
+    return None
+
+
+def store_parsed_table(conn: sqlite3.Connection, parsed: ParsedTable):
+    """Ghi một bảng đã đọc vào database tạm và cập nhật manifest."""
+    schema = TABLE_SCHEMAS.get(parsed.table_name)
+    if schema is not None:
+        write_table(conn, schema, parsed.columns, parsed.rows)
+    else:
+        # Bảng chưa khai báo schema: kiểu suy từ pandas, không có khóa chính/index
+        logging.warning(f"Bảng '{parsed.table_name}' chưa có trong app/database/schema.py, "
+                        f"ghi với kiểu do pandas suy luận.")
+        write_untyped_table(conn, parsed.table_name, parsed.columns, parsed.column_types, parsed.rows)
+    row_count = len(parsed.rows)
+    conn.execute(f"INSERT OR REPLACE INTO {MANIFEST_TABLE} (table_name, source_file, content_hash, schema_hash, row_count) "
+                 f"VALUES (?, ?, ?, ?, ?)",
+                 (parsed.table_name, parsed.source_file, parsed.content_hash, schema_hash(parsed.table_name), row_count))
+    logging.info(f"Đã ghi thành công {row_count} dòng vào bảng '{parsed.table_name}'.")
+
+
+def drop_table(conn: sqlite3.Connection, table_name: str):
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ?", (table_name,))
+
+
+def seed_build_database(build_path: str) -> dict:
+    """
+    Khởi tạo database tạm: sao chép database đang công bố (sqlite3 backup, không đụng tới file gốc) để giữ lại
+    các bảng có file nguồn không đổi, và trả về manifest {table_name: (content_hash, schema_hash)} của lần build đó.
+    Không có database cũ, không có manifest hoặc PREPROCESS_FULL_REBUILD=1 -> bắt đầu từ database rỗng.
+    """
+    if PREPROCESS_FULL_REBUILD or not os.path.exists(DB_PATH):
+        return {}
+    source = sqlite3.connect(f"file:{quote(DB_PATH)}?mode=ro", uri=True)
+    try:
+        try:
+            manifest = {table_name: (content_hash, table_schema_hash) for table_name, content_hash, table_schema_hash in
+                        source.execute(f"SELECT table_name, content_hash, schema_hash FROM {MANIFEST_TABLE}")}
+        except sqlite3.OperationalError:
+            logging.info("Database hiện tại chưa có manifest, đọc lại toàn bộ file Excel.")
+            return {}
+        target = sqlite3.connect(build_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return manifest
+
+
+def build_nap_am_can_chi_table(conn: sqlite3.Connection):
+    """
+    Tách cột 'canchi_tuongung' của bảng 'nap_am' (ví dụ: "Giáp Tý, Ất Sửu") thành bảng ánh xạ
+    'nap_am_can_chi' (can_chi -> napamid) với khóa chính trên can_chi.
+    Nhờ đó tool tra cứu Nạp Âm dùng khóa chính xác thay vì LIKE '%can_chi%' (quét toàn bảng
+    và có thể khớp nhầm khi một Can Chi là chuỗi con của ô khác).
+    """
+    logging.info("Đang tạo bảng ánh xạ Can Chi -> Nạp Âm ('nap_am_can_chi')...")
+    rows = conn.execute("SELECT napamid, tennapam, canchi_tuongung FROM nap_am ORDER BY rowid").fetchall()
+
+    mapping = {}
+    for napamid, tennapam, canchi_cell in rows:
+        for part in re.split(r'[,;/\n]+', canchi_cell or ''):
+            if not part.strip():
+                continue
+            can_chi = normalize_can_chi(part)
+            if can_chi is None:
+                logging.warning(f"Bỏ qua giá trị Can Chi không hợp lệ '{part.strip()}' của Nạp Âm '{tennapam}'.")
+                continue
+            if can_chi in mapping:
+                # Giữ dòng xuất hiện đầu tiên để kết quả luôn xác định
+                if mapping[can_chi] != napamid:
+                    logging.warning(f"Can Chi '{can_chi}' xuất hiện ở nhiều dòng Nạp Âm, giữ napamid={mapping[can_chi]}.")
+                continue
+            mapping[can_chi] = napamid
+
+    write_table(conn, TABLE_SCHEMAS['nap_am_can_chi'], ['can_chi', 'napamid'], list(mapping.items()))
+    logging.info(f"Đã ghi {len(mapping)} Can Chi vào bảng 'nap_am_can_chi'.")
+
+
+def build_answer_tables(conn: sqlite3.Connection, build_path: str):
+    """
+    Dựng các bảng câu trả lời (answer_*) cho ANALYZE_HOUSE / COMPARE_PEOPLE bằng chính các tool của workflow,
+    tra cứu trên knowledge base nạp từ database tạm (các bảng gốc phải đã được commit).
+    Luôn dựng lại khi database thay đổi vì chúng phụ thuộc vào nhiều bảng gốc; số dòng nhỏ (vài nghìn).
+    Manifest ghi hash mã nguồn của các tool (precompute_code_hash) để phát hiện khi code thay đổi.
+    """
+    # Import muộn: các module này nạp app.core.config, chỉ cần tới khi database tạm đã có dữ liệu
+    from app.database.connection import open_reader
+    from app.database.knowledge_base import KnowledgeBase, use_knowledge_base
+    from app.tools.precomputed_tools import materialize_answer_tables
+
+    logging.info("Đang dựng các bảng câu trả lời dựng sẵn (answer_*)...")
+    reader = open_reader(build_path)
+    try:
+        knowledge_base = KnowledgeBase.load(db=reader, answers=False)
+    finally:
+        reader.close()
+
+    # Các tool ghi log cho từng lần tra cứu; ở đây có hàng nghìn lần tra cứu nên chỉ giữ log lỗi
+    tools_logger = logging.getLogger('app.tools')
+    previous_level = tools_logger.level
+    tools_logger.setLevel(logging.ERROR)
+    try:
+        with use_knowledge_base(knowledge_base):
+            answer_tables = materialize_answer_tables(knowledge_base)
+    finally:
+        tools_logger.setLevel(previous_level)
+
+    code_hash = precompute_code_hash()
+    for table_name, (columns, rows) in answer_tables.items():
+        write_table(conn, TABLE_SCHEMAS[table_name], columns, rows)
+        conn.execute(f"INSERT OR REPLACE INTO {MANIFEST_TABLE} (table_name, source_file, content_hash, schema_hash, row_count) "
+                     f"VALUES (?, ?, ?, ?, ?)",
+                     (table_name, os.path.join('app', 'tools', 'precomputed_tools.py'), code_hash,
+                      schema_hash(table_name), len(rows)))
+        logging.info(f"Đã ghi {len(rows)} dòng vào bảng '{table_name}'.")
 
 
 def main():
     """
     Hàm chính điều phối toàn bộ quá trình:
     1. Kiểm tra và tạo các thư mục cần thiết.
-    2. Xóa database cũ (nếu có) để tạo mới.
-    3. Tìm tất cả các file Excel trong thư mục raw.
-    4. Xử lý từng file và ghi vào CSDL SQLite.
+    2. Tìm tất cả các file Excel trong thư mục raw và băm nội dung (sha256) từng file.
+    3. Database tạm (cạnh file đang dùng) bắt đầu từ bản sao của database hiện tại; chỉ các file có hash
+       (hoặc schema) khác với manifest của lần build trước mới được đọc lại, song song trong một process pool.
+    4. Ghi các bảng thay đổi, bảng phái sinh và manifest trong một giao dịch; sau đó dựng các bảng câu trả lời
+       (answer_*) từ dữ liệu vừa ghi và ANALYZE trong giao dịch thứ hai.
+    5. Chỉ khi mọi bước thành công mới đổi file tạm thành DB_PATH (os.replace, nguyên tử):
+       server đang chạy vẫn đọc file cũ cho đến khi được nạp lại (POST /admin/reload).
     """
     logging.info("--- BẮT ĐẦU QUÁ TRÌNH TIỀN XỬ LÝ DỮ LIỆU ---")
 
@@ -98,13 +365,8 @@ def main():
     os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
     logging.info(f"Đã đảm bảo thư mục đầu ra tồn tại: {PROCESSED_DATA_DIR}")
 
-    # Xóa file database cũ nếu tồn tại để đảm bảo tạo mới hoàn toàn
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-        logging.info(f"Đã xóa database cũ tại: {DB_PATH}")
-
     # Tìm tất cả các file có đuôi .xlsx trong thư mục dữ liệu thô
-    excel_files = glob.glob(os.path.join(RAW_DATA_DIR, '*.xlsx'))
+    excel_files = sorted(glob.glob(os.path.join(RAW_DATA_DIR, '*.xlsx')))
 
     if not excel_files:
         logging.warning(f"Không tìm thấy file Excel nào trong thư mục: {RAW_DATA_DIR}")
@@ -112,28 +374,102 @@ def main():
         return
 
     logging.info(f"Tìm thấy {len(excel_files)} file Excel cần xử lý.")
+    sources = {os.path.splitext(os.path.basename(path))[0]: (path, file_hash(path)) for path in excel_files}
+
+    # Không xóa database cũ: server có thể đang đọc nó. Database mới được dựng hoàn toàn trong file tạm.
+    build_path = f"{DB_PATH}.building-{os.getpid()}"
+    if os.path.exists(build_path):
+        os.remove(build_path)
 
     conn = None
+    succeeded = False
     try:
-        # Tạo kết nối đến file CSDL SQLite
-        conn = sqlite3.connect(DB_PATH)
-        logging.info(f"Đã tạo kết nối tới CSDL SQLite tại: {DB_PATH}")
+        previous = seed_build_database(build_path)
+        changed: List[Tuple[str, str]] = [
+            (path, content_hash) for table_name, (path, content_hash) in sources.items()
+            if previous.get(table_name) != (content_hash, schema_hash(table_name))
+        ]
+        # Bảng phái sinh có dòng manifest riêng (bảng câu trả lời), không bị coi là "mất file nguồn"
+        removed = [table_name for table_name in previous if table_name not in sources
+                   and not (table_name in TABLE_SCHEMAS and TABLE_SCHEMAS[table_name].derived)]
+        code_hash = precompute_code_hash()
+        stale_answers = [table_name for table_name in answer_table_names()
+                         if previous.get(table_name) != (code_hash, schema_hash(table_name))]
+        if previous and not changed and not removed and not stale_answers:
+            logging.info("--- KHÔNG CÓ FILE EXCEL NÀO THAY ĐỔI, GIỮ NGUYÊN DATABASE HIỆN TẠI ---")
+            if os.path.exists(build_path):
+                os.remove(build_path)
+            return
+        logging.info(f"{len(changed)} file cần đọc lại, {len(sources) - len(changed)} file không đổi"
+                     + (f", {len(removed)} bảng không còn file nguồn: {removed}" if removed else "") + ".")
+        if previous and stale_answers and not changed:
+            logging.info(f"Mã nguồn dựng bảng câu trả lời đã thay đổi, dựng lại: {stale_answers}.")
+
+        # Đọc song song các file đã thay đổi (mỗi process một workbook), giữ thứ tự file để kết quả xác định
+        workers = max(1, min(PREPROCESS_WORKERS, len(changed)))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed_tables = list(pool.map(parse_excel_file, *zip(*changed)))
+        else:
+            parsed_tables = [parse_excel_file(path, content_hash) for path, content_hash in changed]
+
+        # isolation_level=None: tự quản lý giao dịch (BEGIN/COMMIT tường minh, áp dụng cả cho DDL)
+        conn = sqlite3.connect(build_path, isolation_level=None)
+        logging.info(f"Đã tạo kết nối tới CSDL SQLite tạm tại: {build_path}")
+        conn.execute("BEGIN")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (table_name TEXT PRIMARY KEY, source_file TEXT NOT NULL, "
+                     f"content_hash TEXT NOT NULL, schema_hash TEXT NOT NULL, row_count INTEGER NOT NULL)")
+
+        for table_name in removed:
+            drop_table(conn, table_name)
+        for (path, _), parsed in zip(changed, parsed_tables):
+            if parsed is None:
+                # File rỗng/lỗi: không giữ lại bảng cũ của lần build trước
+                drop_table(conn, os.path.splitext(os.path.basename(path))[0])
+            else:
+                logging.info(f"Đang ghi file: '{parsed.source_file}' -> Bảng SQLite: '{parsed.table_name}'")
+                store_parsed_table(conn, parsed)
 
-        # Lặp qua từng file Excel và xử lý
-        for file_path in excel_files:
-            process_excel_file(file_path, conn)
+        # Mọi bảng đã khai báo schema đều phải được dựng (file thiếu hoặc đọc lỗi -> không thay database cũ)
+        built_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing_tables = [name for name, schema in TABLE_SCHEMAS.items() if not schema.derived and name not in built_tables]
+        if missing_tables:
+            raise SchemaError(f"Không dựng được các bảng đã khai báo schema: {missing_tables}.")
 
+        # Dựng các bảng phái sinh từ dữ liệu đã nạp
+        build_nap_am_can_chi_table(conn)
+        conn.execute("COMMIT")
+
+        # Bảng câu trả lời dựng sẵn đọc lại các bảng vừa commit qua knowledge base
+        conn.execute("BEGIN")
+        build_answer_tables(conn, build_path)
+
+        # Thống kê cho query planner (chọn index khi một bảng có nhiều index phù hợp)
+        conn.execute("ANALYZE")
+        conn.execute("COMMIT")
+        succeeded = True
+
+    except SchemaError as e:
+        logging.error(f"Dữ liệu không khớp schema: {e}")
     except sqlite3.Error as e:
         logging.error(f"Lỗi CSDL SQLite: {e}")
     finally:
-        # Đảm bảo kết nối CSDL luôn được đóng, dù có lỗi hay không
+        # Đảm bảo kết nối CSDL luôn được đóng, dù có lỗi hay không (giao dịch dở dang bị hủy)
         if conn:
             conn.close()
             logging.info("Đã đóng kết nối CSDL.")
 
+    if not succeeded:
+        if os.path.exists(build_path):
+            os.remove(build_path)
+        logging.error(f"--- TIỀN XỬ LÝ THẤT BẠI, GIỮ NGUYÊN DATABASE CŨ TẠI: {DB_PATH} ---")
+        sys.exit(1)
+
+    os.replace(build_path, DB_PATH)
     logging.info(f"--- HOÀN TẤT QUÁ TRÌNH TIỀN XỬ LÝ. ĐÃ TẠO DATABASE TẠI: {DB_PATH} ---")
+    logging.info("Nếu server đang chạy, gọi POST /admin/reload (hoặc bật DATA_WATCH_ENABLED) để nạp lại dữ liệu.")
 
 
 if __name__ == "__main__":
     # Dòng này đảm bảo hàm main() chỉ chạy khi script được thực thi trực tiếp
-    main()
\ No newline at end of file
+    main()